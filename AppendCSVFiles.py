@@ -3,6 +3,8 @@
 """
 import os
 import glob
+import codecs
+import shutil
 import pandas as pd
 from pypeepa import (
     getFilePath,
@@ -13,38 +15,128 @@ from pypeepa import (
     loggingHandler,
 )
 
+from helpers import parseToolArgs, processFilesInPool, readCSVColumns, readFileChunks
 
-def appendCSVFiles(directory_path, output_file_path, logger, chunk_size=1000):
+# Buffer size used when the bytes can't be copied in the kernel
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def readHeaderLine(csv_file):
+    """Read the first line of a file as bytes, without a utf-8 BOM or the line ending, to compare headers."""
+    with open(csv_file, "rb") as f:
+        return f.readline().removeprefix(codecs.BOM_UTF8).rstrip(b"\r\n")
+
+
+def copyFileBody(csv_file, output_file, offset):
+    """
+    Copy the bytes of `csv_file` from `offset` to the end into the binary `output_file`, in the kernel with
+    copy_file_range or sendfile where possible, else with large buffered reads.
+    """
+    count = os.path.getsize(csv_file) - offset
+    output_file.flush()
+    with open(csv_file, "rb") as source:
+        try:
+            while count > 0:
+                if hasattr(os, "copy_file_range"):
+                    copied = os.copy_file_range(
+                        source.fileno(), output_file.fileno(), count, offset
+                    )
+                else:
+                    copied = os.sendfile(
+                        output_file.fileno(), source.fileno(), offset, count
+                    )
+                if copied == 0:
+                    break
+                offset += copied
+                count -= copied
+        except (AttributeError, OSError):
+            # Not supported by this system or between these file systems
+            source.seek(offset)
+            output_file.seek(0, os.SEEK_END)
+            shutil.copyfileobj(source, output_file, COPY_BUFFER_SIZE)
+    # The kernel copies moved the end of the file without the buffered writer knowing
+    output_file.seek(0, os.SEEK_END)
+
+
+def appendCSVFilesBytes(csv_files, output_file_path, hide_progress_bar=False):
+    """
+    Append csv files that all have the same header by copying their bytes, the header is written once from the first
+    file and the body of every file is copied as is.
+    """
+    ends_with_newline = True
+    with open(output_file_path, "wb") as output_file:
+        for file_number, csv_file in enumerate(
+            csv_files if hide_progress_bar else progressBarIterator(iterable=csv_files)
+        ):
+            with open(csv_file, "rb") as f:
+                f.readline()
+                body_offset = 0 if file_number == 0 else f.tell()
+            if os.path.getsize(csv_file) == body_offset:
+                continue
+            if not ends_with_newline:
+                output_file.write(b"\n")
+            copyFileBody(csv_file, output_file, body_offset)
+            with open(csv_file, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                ends_with_newline = f.read(1) == b"\n"
+
+
+def appendCSVFilesAligned(
+    csv_files, output_file_path, columns, chunk_size, hide_progress_bar=False
+):
+    """
+    Append csv files chunk by chunk, every chunk is aligned to `columns` as it is read so the files are read only once.
+    The columns a file doesnt have are left empty.
+    """
+    with open(output_file_path, "wb") as output_file:
+        # Write the header of the whole schema
+        pd.DataFrame(columns=columns).to_csv(output_file, index=False, mode="wb")
+        for csv_file in (
+            csv_files if hide_progress_bar else progressBarIterator(iterable=csv_files)
+        ):
+            for chunk in readFileChunks(csv_file, chunk_size):
+                chunk.reindex(columns=columns).to_csv(
+                    output_file, index=False, header=False, mode="ab"
+                )
+
+
+def appendCSVFiles(
+    directory_path, output_file_path, logger, chunk_size=1000, hide_progress_bar=False
+):
     """
     Appends csv files in a directory and outputs it to a csv file with the same name as the directory
     """
     # Find all CSV files in the given directory
     csv_files = glob.glob(os.path.join(directory_path, "*.csv"))
+    csv_files = [csv_file for csv_file in csv_files if os.path.getsize(csv_file) > 0]
 
     if len(csv_files) == 0:
         print("No CSV files found in the directory.")
         return
 
-    # Initialize the output file
-    header_written = False
-
-    # Loop through each CSV file and append its contents to the output file
-    with open(output_file_path, "wb") as output_file:
-        for csv_file in progressBarIterator(
-            iterable=csv_files,
-        ):
-            for chunk in pd.read_csv(csv_file, chunksize=chunk_size):
-                if not header_written:
-                    chunk.to_csv(output_file, index=False, header=True, mode="wb")
-                    header_written = True
-                else:
-                    chunk.to_csv(output_file, index=False, header=False, mode="ab")
+    # Only the header lines are read to decide if the files can be copied as they are
+    headers = {readHeaderLine(csv_file) for csv_file in csv_files}
+    if len(headers) == 1:
+        appendCSVFilesBytes(csv_files, output_file_path, hide_progress_bar)
+    else:
+        # Union of the columns of all the files in the order they are found
+        columns = []
+        for csv_file in csv_files:
+            columns.extend(col for col in readCSVColumns(csv_file) if col not in columns)
+        loggingHandler(
+            logger,
+            f"Headers are different in '{directory_path}', combining to the columns: {columns}",
+        )
+        appendCSVFilesAligned(
+            csv_files, output_file_path, columns, chunk_size, hide_progress_bar
+        )
 
     loggingHandler(logger, f"Combined data saved to '{output_file_path}'.")
 
 
 async def main():
     app_name = "AppendCSVFiles"
+    args = parseToolArgs()
     # Initialising logging
     logger = initLogging(app_name)
 
@@ -61,10 +153,25 @@ async def main():
     # Create outputdirectory if doesnt exist
     createDirectory(output_dir)
 
+    tasks = []
     for directory in input_dir_content:
         input_path = os.path.join(input_dir, directory)
         output_file_path = os.path.join(output_dir, f"{directory}.csv")
-        appendCSVFiles(input_path, output_file_path, logger, 10000)
+        tasks.append(
+            (
+                input_path,
+                directory,
+                (
+                    input_path,
+                    output_file_path,
+                    logger if args.workers == 1 else None,
+                    10000,
+                    args.workers > 1,
+                ),
+            )
+        )
+    # Start the process on each folder, with --workers the folders are combined in parallel
+    processFilesInPool(appendCSVFiles, tasks, args.workers, logger=logger)
 
 
 if __name__ == "__main__":
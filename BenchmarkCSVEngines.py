@@ -0,0 +1,132 @@
+import os
+import time
+import numpy as np
+from typing import Tuple
+from pandas import DataFrame
+from pypeepa import (
+    initLogging,
+    getFilePath,
+    loggingHandler,
+    askYNQuestion,
+    askSelectOptionQuestion,
+)
+from helpers import (
+    CSV_ENGINES,
+    setCSVEngine,
+    readCSV,
+    readFileChunks,
+    readCSVColumns,
+)
+
+
+def writeBenchmarkFile(
+    output_path: str, rows: int, columns: int, chunk_rows: int = 100000
+):
+    """
+    Write a csv like the datasets the tools are used on, a mix of ids, numbers, names, codes, dates and empty values,
+    `chunk_rows` rows at a time so any size can be written.
+    """
+    rng = np.random.default_rng(0)
+    names = np.array(
+        ["john", "diane", "peter", "dave", "maría", "o'neil", "van der berg"]
+    )
+    codes = np.array(["CA", "NY", "TX", "93516", "A1B 2C3", "", "N/A"])
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        for start in range(0, rows, chunk_rows):
+            count = min(chunk_rows, rows - start)
+            data = {}
+            for col in range(columns):
+                match col % 5:
+                    case 0:
+                        values = np.arange(start, start + count)
+                    case 1:
+                        values = np.round(rng.random(count) * 1000, 2)
+                    case 2:
+                        values = rng.choice(names, count)
+                    case 3:
+                        values = rng.choice(codes, count)
+                    case 4:
+                        values = np.datetime_as_string(
+                            rng.integers(0, 20000, count).astype("datetime64[D]")
+                        )
+                data[f"column{col}"] = values
+            DataFrame(data).to_csv(f, index=False, header=start == 0)
+
+
+def timeRead(read_function) -> Tuple[float, int]:
+    """Run a read and return the seconds it took and the number of rows it read."""
+    tick = time.perf_counter()
+    rows = read_function()
+    return time.perf_counter() - tick, rows
+
+
+def benchmarkEngine(csv_file: str, chunk_size: int, full_read: bool):
+    """Time the reads the tools do, a chunked read of all the columns, of two columns and a read of the whole file."""
+    usecols = readCSVColumns(csv_file)[:2]
+    reads = {
+        "chunks, all columns": lambda: sum(
+            len(chunk.index) for chunk in readFileChunks(csv_file, chunk_size)
+        ),
+        "chunks, 2 columns": lambda: sum(
+            len(chunk.index)
+            for chunk in readFileChunks(csv_file, chunk_size, usecols)
+        ),
+    }
+    if full_read:
+        reads["whole file"] = lambda: len(
+            readCSV(
+                csv_file,
+                low_memory=False,
+                encoding_errors="ignore",
+                on_bad_lines="skip",
+            ).index
+        )
+    return {name: timeRead(read_function) for name, read_function in reads.items()}
+
+
+# Main function
+# variables:
+async def main():
+    app_name = "BenchmarkCSVEngines"
+    print(
+        "\nCompare the speed of the csv engines on a file, the default test file is 10M rows of 100 columns (about 6GB).\n"
+    )
+    logger = initLogging(app_name)
+    if askYNQuestion("Write a test file?(y/n)"):
+        output_dir = getFilePath("Enter the location to write the test file: ")
+        rows = askSelectOptionQuestion(
+            "Enter the number of rows (10000000 for a typical file)", 1, 100000000
+        )
+        columns = askSelectOptionQuestion(
+            "Enter the number of columns (100 for a typical file)", 1, 1000
+        )
+        csv_file = os.path.join(output_dir, f"benchmark_{rows}x{columns}.csv")
+        tick = time.time()
+        writeBenchmarkFile(csv_file, rows, columns)
+        loggingHandler(logger, f"Wrote {csv_file} in {time.time()-tick}s")
+    else:
+        csv_file = getFilePath("Enter the csv file to read: ", (".csv"), False)
+    full_read = askYNQuestion(
+        "Also read the whole file at once? Needs memory for all of it (y/n)"
+    )
+    chunk_size = 100000
+
+    loggingHandler(
+        logger,
+        f"{csv_file}: {os.path.getsize(csv_file) / 1024 / 1024:.0f}MB, {os.cpu_count()} CPUs",
+    )
+    for engine in CSV_ENGINES:
+        setCSVEngine(engine)
+        for name, (seconds, rows) in benchmarkEngine(
+            csv_file, chunk_size, full_read
+        ).items():
+            loggingHandler(
+                logger,
+                f"{engine:>8} | {name:<20} | {seconds:8.2f}s | {rows / seconds:12.0f} rows/s",
+            )
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import tempfile
+from pandas import concat, read_csv
+from pypeepa import initLogging, loggingHandler, askSelectOptionQuestion
+from ConvertJSONToCSV import convertJSONToCSV
+
+
+def writeBenchmarkFile(output_path: str, rows: int):
+    """
+    Write a JSON lines file with the values that broke before, ids and phone numbers too large for a float and
+    nulls or missing keys in the same columns as ints.
+    """
+    with open(output_path, "w", encoding="utf-8") as f:
+        for row in range(rows):
+            record = {
+                "id": 12345678901234567 + row,
+                "count": row % 7,
+                "phone": None if row % 5 == 0 else 4155550100 + row,
+                "price": round(row * 0.37, 2),
+                "name": f"name {row}",
+            }
+            if row % 3 == 0:
+                del record["count"]
+            if row % 1000 == 999:
+                record["address"] = {"city": "Paris", "zip": "75001"}
+            f.write(json.dumps(record) + "\n")
+
+
+def checkValuesUnchanged(json_file: str, output_path: str):
+    """
+    Compare every value of the csv chunk files with the JSON it came from, ints have to be written exactly as they
+    are in the JSON and nulls or missing keys as empty values.\n
+    @return: The number of values checked.
+    """
+    output_dir, output_name = os.path.split(output_path)
+    chunk_files = sorted(
+        (f for f in os.listdir(output_dir) if f.startswith(f"{output_name}_chunk")),
+        key=lambda f: int(f[len(output_name) + 6 : -4]),
+    )
+    written = concat(
+        [
+            read_csv(
+                os.path.join(output_dir, f), dtype=str, keep_default_na=False
+            )
+            for f in chunk_files
+        ],
+        ignore_index=True,
+    )
+    checked = 0
+    with open(json_file, encoding="utf-8") as f:
+        for row, line in enumerate(f):
+            for key in ("id", "count", "phone"):
+                value = json.loads(line).get(key)
+                expected = "" if value is None else str(value)
+                if written.at[row, key] != expected:
+                    raise AssertionError(
+                        f"Row {row} {key}: expected {expected!r}, written {written.at[row, key]!r}"
+                    )
+                checked += 1
+    return checked
+
+
+# Main function
+# variables:
+async def main():
+    app_name = "BenchmarkConvertJSONToCSV"
+    print(
+        "\nCheck that Convert JSON To CSV writes the values of a JSON lines file unchanged and time it.\n"
+    )
+    logger = initLogging(app_name)
+    rows = askSelectOptionQuestion(
+        "Enter the number of lines (200000 for a typical file)", 1000, 10000000
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_file = os.path.join(temp_dir, "benchmark.json")
+        output_dir = os.path.join(temp_dir, "output")
+        os.makedirs(output_dir)
+        output_path = os.path.join(output_dir, "benchmark.json")
+        writeBenchmarkFile(json_file, rows)
+
+        tick = time.perf_counter()
+        convertJSONToCSV(json_file, output_path, 100000)
+        seconds = time.perf_counter() - tick
+        loggingHandler(
+            logger, f"Converted {rows} lines in {seconds:.2f}s, {rows / seconds:.0f} lines/s"
+        )
+        checked = checkValuesUnchanged(json_file, output_path)
+        loggingHandler(logger, f"Checked {checked} int and null values, all unchanged")
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(main())
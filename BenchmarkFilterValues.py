@@ -0,0 +1,88 @@
+import os
+import time
+import tempfile
+import numpy as np
+from datetime import datetime
+from pandas import DataFrame, read_csv
+from pypeepa import initLogging, loggingHandler, askSelectOptionQuestion
+from FilterValues import calculate_age, calculateAges, dob_years
+
+
+def writeBenchmarkFile(output_path: str, rows: int, chunk_rows: int = 100000):
+    """
+    Write a csv with a date of birth column in the formats found in the datasets, eg:- 1985-03-07, 03/07/1985,
+    07.03.1985, 'March 7 1985', with empty and invalid values mixed in. Most dates repeat like in a real file.
+    """
+    rng = np.random.default_rng(0)
+    formats = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%d.%m.%Y", "%B %d %Y", "%d %b %Y"]
+    days = rng.integers(-20000, 19000, 30000).astype("datetime64[D]").astype(object)
+    pool = [day.strftime(formats[i % len(formats)]) for i, day in enumerate(days)]
+    pool += ["", "unknown", "00/00/0000", "31/02/1990"]
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        for start in range(0, rows, chunk_rows):
+            count = min(chunk_rows, rows - start)
+            DataFrame(
+                {
+                    "id": np.arange(start, start + count),
+                    "dob": [pool[i] for i in rng.integers(0, len(pool), count)],
+                }
+            ).to_csv(f, index=False, header=start == 0)
+
+
+# Main function
+# variables:
+async def main():
+    app_name = "BenchmarkFilterValues"
+    print(
+        "\nTime the age calculation of Filter ACN on a file of dates of birth and check it against the row by row one.\n"
+    )
+    logger = initLogging(app_name)
+    rows = askSelectOptionQuestion(
+        "Enter the number of rows (1000000 for a typical file)", 1000, 100000000
+    )
+    sample_rows = askSelectOptionQuestion(
+        "Enter the number of rows to also run row by row, which is much slower", 100, 100000
+    )
+    current_year = datetime.now().year
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_file = os.path.join(temp_dir, "benchmark.csv")
+        writeBenchmarkFile(csv_file, rows)
+
+        # Start with nothing parsed, like a new run
+        dob_years.clear()
+        seconds = 0.0
+        sample = None
+        for chunk in read_csv(csv_file, chunksize=100000, dtype={"dob": str}):
+            # Made text the same way as filterDataFrameByAgeAndCommonValues does
+            chunk["dob"] = chunk["dob"].astype(str)
+            tick = time.perf_counter()
+            ages = calculateAges(chunk["dob"], current_year)
+            seconds += time.perf_counter() - tick
+            if sample is None:
+                sample = chunk["dob"].head(sample_rows), ages.head(sample_rows)
+        loggingHandler(
+            logger,
+            f"calculateAges: {rows} rows in {seconds:.2f}s, {rows / seconds:.0f} rows/s",
+        )
+
+        dobs, ages = sample
+        tick = time.perf_counter()
+        expected = dobs.apply(lambda dob: calculate_age(dob, current_year))
+        row_seconds = time.perf_counter() - tick
+        loggingHandler(
+            logger,
+            f"calculate_age row by row: {len(dobs)} rows in {row_seconds:.2f}s, {len(dobs) / row_seconds:.0f} rows/s",
+        )
+        different = ages.values != expected.values
+        if different.any():
+            row = int(np.argmax(different))
+            raise AssertionError(
+                f"Row {row} {dobs.iloc[row]!r}: age {ages.iloc[row]}, expected {expected.iloc[row]}"
+            )
+        loggingHandler(logger, f"Checked {len(dobs)} ages, all the same")
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+import os
+import time
+import tempfile
+import concurrent.futures
+import numpy
+from pandas import DataFrame, read_csv
+from pypeepa import initLogging, loggingHandler, askSelectOptionQuestion
+from JoinMultipleCSV import (
+    countJoinPartitions,
+    partitionRightFiles,
+    outOfCoreJoinCSVFiles,
+)
+
+try:
+    import resource
+except ImportError:  # Not on Windows
+    resource = None
+
+
+def customerId(numbers) -> list:
+    return [f"c{number:09d}" for number in numbers]
+
+
+def writeBenchmarkFiles(
+    left_path: str, right_path: str, left_rows: int, right_rows: int, block_size=100000
+):
+    """
+    Write a left file with ids of which about half are in the right file and 1 in 10 are empty, and a right file
+    with every id once in a random order followed by a few duplicates with other values, which have to be ignored.
+    The id is the only thing needed to know the values a left row should get from the right file.
+    """
+    random = numpy.random.default_rng(0)
+    for start in range(0, left_rows, block_size):
+        numbers = random.integers(0, right_rows * 2, min(block_size, left_rows - start))
+        ids = customerId(numbers)
+        for position in range(start % 10, len(ids), 10):
+            ids[position] = ""
+        DataFrame(
+            {"id": ids, "name": [f"name {row}" for row in range(start, start + len(ids))]}
+        ).to_csv(left_path, mode="a", header=start == 0, index=False)
+
+    order = random.permutation(right_rows)
+    for start in range(0, right_rows, block_size):
+        numbers = order[start : start + block_size]
+        DataFrame(
+            {
+                "id": customerId(numbers),
+                "email": [f"user{number}@example.com" for number in numbers],
+                "note": ["x" * 80] * len(numbers),
+            }
+        ).to_csv(right_path, mode="a", header=start == 0, index=False)
+    duplicates = order[: max(1, right_rows // 100)]
+    DataFrame(
+        {
+            "id": customerId(duplicates),
+            "email": ["duplicate@example.com"] * len(duplicates),
+            "note": ["duplicate"] * len(duplicates),
+        }
+    ).to_csv(right_path, mode="a", header=False, index=False)
+
+
+def runJoin(left_path: str, right_path: str, output_path: str, memory_limit_mb: int):
+    """The out of core join as run by JoinMultipleCSV, in a process of its own so its peak memory can be read."""
+    chunk_size = 100000
+    spill_dir = tempfile.mkdtemp(dir=os.path.dirname(output_path))
+    partitions = countJoinPartitions([left_path], [right_path], memory_limit_mb)
+    right_partitions = partitionRightFiles(
+        [(right_path, "id")], spill_dir, partitions, chunk_size
+    )
+    config = {
+        "left_col": "id",
+        "partitions": partitions,
+        "right_partitions": right_partitions,
+        "spill_dir": spill_dir,
+    }
+    rows = outOfCoreJoinCSVFiles(left_path, output_path, config, chunk_size)
+    return partitions, rows
+
+
+def checkJoinedValues(left_path: str, output_path: str, right_rows: int):
+    """
+    Check that the output has the left rows in their original order, each with the email of the first right row
+    with its id and empty values when there is none.\n
+    @return: The number of rows checked.
+    """
+    checked = 0
+    left_chunks = read_csv(left_path, dtype=str, keep_default_na=False, chunksize=100000)
+    output_chunks = read_csv(
+        output_path, dtype=str, keep_default_na=False, chunksize=100000
+    )
+    for left, output in zip(left_chunks, output_chunks):
+        output.index = left.index
+        if not left["name"].equals(output["name"]):
+            raise AssertionError(f"Rows out of order after row {checked}")
+        numbers = left["id"].str[1:].replace("", "-1").astype(numpy.int64)
+        matched = (numbers >= 0) & (numbers < right_rows)
+        expected = ("user" + numbers.astype(str) + "@example.com").where(matched, "")
+        wrong = expected != output["email"]
+        if wrong.any():
+            row = wrong.idxmax()
+            raise AssertionError(
+                f"Row {row}: expected {expected[row]!r}, written {output.at[row, 'email']!r}"
+            )
+        checked += len(left.index)
+    if next(output_chunks, None) is not None or checked == 0:
+        raise AssertionError("The output does not have the same number of rows as the left file")
+    return checked
+
+
+# Main function
+# variables:
+async def main():
+    app_name = "BenchmarkJoinMultipleCSV"
+    print(
+        "\nCheck the out of core join of Join Multiple CSV with a right file larger than its memory limit and time it.\n"
+    )
+    logger = initLogging(app_name)
+    left_rows = askSelectOptionQuestion(
+        "Enter the number of left rows (1000000 for a typical file)", 1000, 100000000
+    )
+    right_rows = askSelectOptionQuestion(
+        "Enter the number of right rows (2000000 writes about 230MB)", 1000, 100000000
+    )
+    memory_limit_mb = askSelectOptionQuestion(
+        "Enter the memory limit in MB, less than the size of the right file", 64, 1048576
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        left_path = os.path.join(temp_dir, "left.csv")
+        right_path = os.path.join(temp_dir, "right.csv")
+        output_path = os.path.join(temp_dir, "joined.csv")
+        writeBenchmarkFiles(left_path, right_path, left_rows, right_rows)
+        loggingHandler(
+            logger,
+            f"Right file is {os.path.getsize(right_path) / 1048576:.0f}MB for a memory limit of {memory_limit_mb}MB",
+        )
+
+        tick = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            partitions, rows = executor.submit(
+                runJoin, left_path, right_path, output_path, memory_limit_mb
+            ).result()
+        seconds = time.perf_counter() - tick
+        loggingHandler(
+            logger,
+            f"Joined {rows} rows in {partitions} partitions in {seconds:.2f}s, {rows / seconds:.0f} rows/s",
+        )
+        if resource is not None:
+            # Kilobytes on linux
+            peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+            loggingHandler(logger, f"Peak memory of the join: {peak_mb:.0f}MB")
+        checked = checkJoinedValues(left_path, output_path, right_rows)
+        loggingHandler(logger, f"Checked {checked} rows, all in order and joined")
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+import time
+import numpy as np
+from typing import Tuple
+from pandas import DataFrame
+from pypeepa import initLogging, loggingHandler, askSelectOptionQuestion
+from helpers import splitAddress
+from SplitToMultipleColumns import splitName, splitColumnValues
+
+NAME_COLUMNS = ["firstName", "middleName", "lastName"]
+ADDRESS_COLUMNS = ["city", "state", "country", "postalCode"]
+
+
+def randomValues(rng, words: np.ndarray, count: int, distinct: int) -> list:
+    """
+    `count` values drawn from `distinct` random values of 0 to 5 words, with extra, leading and trailing spaces,
+    empty values, None, NaN and numbers mixed in, the cases where splitting by unique value could go wrong.
+    """
+    pool = []
+    for _ in range(distinct):
+        value = " ".join(rng.choice(words, rng.integers(0, 6)))
+        match rng.integers(0, 10):
+            case 0:
+                value = value.replace(" ", "  ")
+            case 1:
+                value = f" {value} "
+            case 2:
+                value = None
+            case 3:
+                value = np.nan
+            case 4:
+                value = int(rng.integers(0, 100000))
+        pool.append(value)
+    return [pool[position] for position in rng.integers(0, distinct, count)]
+
+
+def makeBenchmarkFrame(rows: int, distinct: int, seed: int = 0) -> DataFrame:
+    """A chunk of `rows` random names and addresses, the same for the same `seed`."""
+    rng = np.random.default_rng(seed)
+    name_words = np.array(
+        ["john", "Diane", "peter", "maría", "o'neil", "van", "der", "berg", "j.", ""]
+    )
+    address_words = np.array(
+        ["Springfield", "New", "York", "CA", "NY", "US", "usa", "93516", "A1B", "2C3", "1234-5"]
+    )
+    return DataFrame(
+        {
+            "id": np.arange(rows),
+            "name": randomValues(rng, name_words, rows, distinct),
+            "address": randomValues(rng, address_words, rows, distinct),
+        }
+    )
+
+
+def splitWithApply(chunk: DataFrame) -> DataFrame:
+    """The row by row split the factorized one replaced, each value is split with Series.apply."""
+    chunk = chunk.copy()
+    chunk[ADDRESS_COLUMNS] = DataFrame(
+        chunk["address"].apply(splitAddress).tolist(), index=chunk.index
+    )
+    chunk.drop(columns=["address"], inplace=True)
+    chunk[NAME_COLUMNS] = DataFrame(
+        chunk["name"].apply(splitName).tolist(), index=chunk.index
+    )
+    chunk.drop(columns=["name"], inplace=True)
+    return chunk
+
+
+def compareSplits(chunk: DataFrame, config) -> Tuple[float, float]:
+    """
+    Split a chunk both ways and check that every value is the same.\n
+    @return: The seconds taken by the factorized split and by the Series.apply split.
+    """
+    tick = time.perf_counter()
+    expected = splitWithApply(chunk)
+    apply_seconds = time.perf_counter() - tick
+    tick = time.perf_counter()
+    result = splitColumnValues(chunk.copy(), config)
+    factorized_seconds = time.perf_counter() - tick
+    if list(result.columns) != list(expected.columns):
+        raise AssertionError(f"Columns {list(result.columns)} != {list(expected.columns)}")
+    different = (result != expected).any(axis=1)
+    if different.any():
+        row = different.idxmax()
+        raise AssertionError(
+            f"Row {row} {chunk.loc[row].tolist()}: split to {result.loc[row].tolist()}, expected {expected.loc[row].tolist()}"
+        )
+    return factorized_seconds, apply_seconds
+
+
+# Main function
+# variables:
+async def main():
+    app_name = "BenchmarkSplitToMultipleColumns"
+    print(
+        "\nCheck that Split To Multiple Columns splits random names and addresses the same as splitting them one by one and time it.\n"
+    )
+    logger = initLogging(app_name)
+    rows = askSelectOptionQuestion(
+        "Enter the number of rows (1000000 for a typical file)", 1000, 100000000
+    )
+    distinct = askSelectOptionQuestion(
+        "Enter the number of different names and addresses", 1, 10000000
+    )
+    config = {
+        "address_columns": ADDRESS_COLUMNS,
+        "split_address_column": "address",
+        "address_parser": {"parser": "heuristic", "cache_size": 100000, "options": {}},
+        "name_columns": NAME_COLUMNS,
+        "split_name_column": "name",
+    }
+    chunk_size = 100000
+    # Differential check on small random inputs first, with few rows each value repeats in different ways
+    for seed in range(20):
+        distinct_values = int(np.random.default_rng(seed).integers(1, 1000))
+        compareSplits(makeBenchmarkFrame(1000, distinct_values, seed), config)
+    loggingHandler(logger, "20 random files split the same both ways")
+
+    data = makeBenchmarkFrame(rows, distinct)
+    factorized_seconds = apply_seconds = 0.0
+    for start in range(0, rows, chunk_size):
+        seconds = compareSplits(data.iloc[start : start + chunk_size], config)
+        factorized_seconds += seconds[0]
+        apply_seconds += seconds[1]
+    loggingHandler(
+        logger,
+        f"Factorized split: {rows / factorized_seconds:.0f} rows/s, Series.apply split: {rows / apply_seconds:.0f} rows/s, {apply_seconds / factorized_seconds:.1f}x faster",
+    )
+    loggingHandler(logger, f"Checked {rows} rows, all split the same")
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(main())
@@ -1,31 +1,135 @@
-import chardet
-import csv
 import os
+import copy
+import codecs
+import numpy as np
+from chardet.universaldetector import UniversalDetector
 from pypeepa import initLogging, getFilePath, listDir, createDirectory, loggingHandler
 
 
-def convertLargeCSVToUTF8(file_path, output_path, logger, chunk_size=8192):
+def findNonASCIISamples(file_path, sample_size, block_size=16 * 1024 * 1024):
+    """
+    Go through a file in large blocks and give the offsets of the samples to check, the start of the file and a
+    sample around every byte above 127 not already in the sample before it. A file with no such byte is ascii.
+    """
+    yield 0
+    last_sample_end = sample_size
     with open(file_path, "rb") as f:
-        raw_data = f.read()
-        encoding_info = chardet.detect(raw_data)
-        original_encoding = encoding_info["encoding"]
+        block_start = 0
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            non_ascii = block_start + np.flatnonzero(
+                np.frombuffer(block, dtype=np.uint8) >= 128
+            )
+            # Jump to the first byte past the sample before, a mostly non-ascii block only gives a few samples
+            index = int(np.searchsorted(non_ascii, last_sample_end))
+            while index < len(non_ascii):
+                # Start a little before the byte so the characters around it are in the sample too
+                sample_start = max(0, int(non_ascii[index]) - 64)
+                last_sample_end = sample_start + sample_size
+                yield sample_start
+                index = int(np.searchsorted(non_ascii, last_sample_end))
+            block_start += len(block)
+
+
+def detectEncoding(
+    file_path,
+    sample_size=16 * 1024,
+    max_samples=32,
+    min_confidence=0.9,
+    check_every=4,
+):
+    """
+    Detect the encoding of a file from samples of it instead of reading the whole file into chardet.\n
+    The start of the file and samples around the bytes above 127 are fed to chardet in the order they are found,
+    so the samples always have the bytes that tell the encodings apart, a file without any is ascii. Detection stops
+    as soon as chardet is done or its result reaches `min_confidence`, which is checked every `check_every`
+    samples.\n
+    @param:`file_path`: Path of the file.\n
+    @param:`sample_size`: (Optional) Size in bytes of each sample.\n
+    @param:`max_samples`: (Optional) Most samples fed to chardet.\n
+    @param:`min_confidence`: (Optional) Confidence at which the detection stops.\n
+    @param:`check_every`: (Optional) Number of samples fed between checks of the confidence.\n
+    @return: The detected encoding and its confidence.
+    """
+    detector = UniversalDetector()
+    samples_fed = 0
+    with open(file_path, "rb") as f:
+        for sample_start in findNonASCIISamples(file_path, sample_size):
+            f.seek(sample_start)
+            detector.feed(f.read(sample_size))
+            samples_fed += 1
+            if detector.done or samples_fed >= max_samples:
+                break
+            if samples_fed % check_every != 0:
+                continue
+            # Check the result so far on a copy, closing the detector ends the detection
+            partial_detector = copy.deepcopy(detector)
+            partial_detector.close()
+            if partial_detector.result["confidence"] >= min_confidence:
+                break
+    detector.close()
+    return detector.result["encoding"], detector.result["confidence"]
+
 
-    with open(
-        file_path, "r", encoding=original_encoding, errors="replace"
-    ) as f_read, open(output_path, "w", encoding="utf-8") as f_write:
-        csv_reader = csv.reader(f_read)
-        csv_writer = csv.writer(f_write)
+# Where the decoder of transcodeToUTF8 replaced bytes, offsets into the bytes it was given
+replaced_bytes = []
 
+
+def recordReplacedBytes(err):
+    replaced_bytes.append(err.start)
+    return "\ufffd", err.end
+
+
+codecs.register_error("ChangeEncoding.replace", recordReplacedBytes)
+
+
+def transcodeToUTF8(file_path, output_path, encoding, chunk_size, max_offsets=20):
+    """
+    Transcode the bytes of a file to utf-8 in large blocks, the incremental decoder keeps characters split between
+    blocks whole. Bytes that are not valid in `encoding` are replaced with U+FFFD, the rest of the file is still
+    decoded as `encoding`.\n
+    @return: The number of invalid bytes replaced and the file offsets of the first `max_offsets` of them.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ChangeEncoding.replace")
+    replaced, offsets = 0, []
+    block_start = 0
+    with open(file_path, "rb") as f_read, open(output_path, "wb") as f_write:
         while True:
             chunk = f_read.read(chunk_size)
-            if not chunk:
+            final = not chunk
+            # The decoder prepends the bytes of a character left unfinished at the end of the block before
+            data_start = block_start - len(decoder.getstate()[0])
+            replaced_bytes.clear()
+            f_write.write(decoder.decode(chunk, final=final).encode("utf-8"))
+            replaced += len(replaced_bytes)
+            offsets.extend(
+                data_start + start for start in replaced_bytes[: max_offsets - len(offsets)]
+            )
+            if final:
                 break
+            block_start += len(chunk)
+    return replaced, offsets
+
 
-            csv_reader = csv.reader(chunk.splitlines())
-            for row in csv_reader:
-                csv_writer.writerow(row)
+def convertLargeCSVToUTF8(file_path, output_path, logger, chunk_size=16 * 1024 * 1024):
+    original_encoding, confidence = detectEncoding(file_path)
+    if original_encoding is None or original_encoding.lower() == "ascii":
+        original_encoding = "utf-8"
 
-    loggingHandler(logger, f"Converted {file_path} from {original_encoding} to UTF-8.")
+    replaced, offsets = transcodeToUTF8(
+        file_path, output_path, original_encoding, chunk_size
+    )
+    if replaced:
+        loggingHandler(
+            logger,
+            f"{file_path} has {replaced} bytes that are not valid {original_encoding}, replaced with U+FFFD, at byte offsets {offsets}{'...' if replaced > len(offsets) else ''}",
+        )
+    loggingHandler(
+        logger,
+        f"Converted {file_path} from {original_encoding}(confidence:{confidence}) to UTF-8.",
+    )
 
 
 async def main():
@@ -49,7 +153,7 @@ async def main():
     for input_file in input_dir_content:
         input_path = os.path.join(input_dir, input_file)
         output_file_path = os.path.join(output_dir, f"{input_file}.csv")
-        convertLargeCSVToUTF8(input_path, output_file_path, logger, 10000)
+        convertLargeCSVToUTF8(input_path, output_file_path, logger)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
 import os
+import json
+from io import BytesIO
+from itertools import islice
+from typing import List, Tuple
 from traceback import format_exc
 
-from pandas import read_json
+from pandas import DataFrame, concat, read_csv
 from pypeepa import (
     getFilePath,
     initLogging,
@@ -10,46 +14,122 @@ from pypeepa import (
     createDirectory,
     ProgressSaver,
     askSelectOptionQuestion,
-    countTotalRows,
 )
+from helpers import countFileLines, parseToolArgs, ColumnarWriter
 import time
 
 
-def convertJSONToCSV(input_path, output_path, chunksize):
-    # Open the input JSON file for reading
-    with open(input_path, "r") as json_file:
-        # Initialize a CSV output file for writing
-        with open(f"{output_path}_chunk0.csv", "w") as csv_file:
-            header_written = False  # To ensure the header is written only once
-
-            # Process the JSON file line by line
-            for line_count, line in enumerate(json_file, 1):
-                # Load JSON data from the line
-                data = read_json(line, lines=True, encoding_errors="ignore")
-
-                # Write the header row if it hasn't been written yet
-                if not header_written:
-                    header = data.columns.tolist()
-                    csv_file.write(",".join(header) + "\n")
-                    header_written = True
-
-                # Write the data to the CSV file
-                data.to_csv(
-                    csv_file,
-                    header=False,
-                    index=False,
-                    mode="a",
-                    lineterminator="\n",
-                    errors="ignore",
+def writeCSVChunkFile(
+    body_path: str, segments: List[Tuple[int, int, int]], columns: List[str], output_file: str
+):
+    """
+    Write the header and the body of one chunk file, blocks written before the last columns were found are padded
+    with empty values so every row has all the columns.
+    """
+    with open(output_file, "wb") as csv_file, open(body_path, "rb") as body_file:
+        csv_file.write(
+            DataFrame(columns=columns)
+            .to_csv(index=False, lineterminator="\n")
+            .encode("utf-8")
+        )
+        for start, end, width in segments:
+            body_file.seek(start)
+            block_csv = body_file.read(end - start)
+            if width < len(columns):
+                block_csv = (
+                    read_csv(
+                        BytesIO(block_csv),
+                        header=None,
+                        names=columns[:width],
+                        dtype=str,
+                        keep_default_na=False,
+                    )
+                    .reindex(columns=columns, fill_value="")
+                    .to_csv(header=False, index=False, lineterminator="\n")
+                    .encode("utf-8")
                 )
-
-                # Check if it's time to create a new CSV file (chunk)
-                if line_count % chunksize == 0:
-                    csv_file.close()  # Close the current chunk
-                    chunk_number = line_count // chunksize
-                    new_output_file = f"{output_path}_chunk{chunk_number}.csv"
-                    csv_file = open(new_output_file, "w")  # Open a new chunk file
-                    header_written = False
+            csv_file.write(block_csv)
+
+
+def writeColumnarChunkFile(frames: List[DataFrame], columns: List[str], output_file: str):
+    """Write the blocks of one chunk to a .parquet or .arrow file, with every column found in any of them."""
+    with ColumnarWriter(output_file) as writer:
+        if frames:
+            writer.write(concat(frames, ignore_index=True).reindex(columns=columns))
+
+
+def convertJSONToCSV(
+    input_path, output_path, chunksize, block_size=10000, output_format="csv"
+):
+    """
+    Convert a JSON lines file to csv files of `chunksize` lines each, named `output_path`_chunk0.csv, _chunk1.csv...\n
+    The lines are parsed `block_size` at a time and written with one to_csv call, the values are written as they
+    are in the JSON, eg:- ids stay ints even when other lines have nulls. The header of each chunk file is the union
+    of the columns of all its lines in the order they were found.\n
+    With `output_format` 'parquet' or 'arrow' the blocks of a chunk are kept in memory and written as one
+    _chunk0.parquet or _chunk0.arrow file instead.
+    """
+    columnar = output_format != "csv"
+    # Open the input JSON file for reading
+    with open(input_path, "r", encoding="utf-8", errors="ignore") as json_file:
+        chunk_number = 0
+        while True:
+            lines_left = chunksize
+            columns: List[str] = []
+            segments: List[Tuple[int, int, int]] = []
+            frames: List[DataFrame] = []
+            body_path = f"{output_path}_chunk{chunk_number}.csv.body"
+            # The body is removed even when a line of the chunk isnt valid JSON
+            try:
+                with open(body_path, "wb") as body_file:
+                    while lines_left > 0:
+                        lines = list(islice(json_file, min(block_size, lines_left)))
+                        if not lines:
+                            break
+                        lines_left -= len(lines)
+                        records = [json.loads(line) for line in lines if line.strip()]
+                        if not records:
+                            continue
+                        # Kept as the python values json gave, a column of ints with a null would become floats
+                        data = DataFrame(records, dtype=object)
+
+                        # Add the columns not seen before to the end of the header
+                        columns.extend(
+                            column for column in data.columns if column not in columns
+                        )
+                        if columnar:
+                            frames.append(data)
+                            continue
+                        start = body_file.tell()
+                        body_file.write(
+                            data.reindex(columns=columns)
+                            .to_csv(header=False, index=False, lineterminator="\n")
+                            .encode("utf-8", errors="ignore")
+                        )
+                        segments.append((start, body_file.tell(), len(columns)))
+
+                if lines_left == chunksize:
+                    # Nothing left in the input
+                    break
+                if columnar:
+                    writeColumnarChunkFile(
+                        frames,
+                        columns,
+                        f"{output_path}_chunk{chunk_number}.{output_format}",
+                    )
+                else:
+                    writeCSVChunkFile(
+                        body_path,
+                        segments,
+                        columns,
+                        f"{output_path}_chunk{chunk_number}.csv",
+                    )
+                if lines_left > 0:
+                    break
+            finally:
+                if os.path.exists(body_path):
+                    os.remove(body_path)
+            chunk_number += 1
 
 
 # Main function
@@ -57,6 +137,7 @@ def convertJSONToCSV(input_path, output_path, chunksize):
 async def main():
     app_name = "ConvertJSONToCSV"
     print("\nConvert any JSON dataset to CSV\n")
+    args = parseToolArgs()
     # Initialising Logger
     logger = initLogging(app_name)
     # User inputs
@@ -90,12 +171,10 @@ async def main():
         if input_full_path not in progress.saved_data:
             try:
                 # Output the file to output folder with same name.
+                # Only used to choose if the output is split, an estimate is enough
+                total_lines_in_input = countFileLines(input_full_path, estimate=True)
                 loggingHandler(
-                    logger, f"Counting total lines for {input_file}, please wait..."
-                )
-                total_lines_in_input = countTotalRows(input_full_path)
-                loggingHandler(
-                    logger, f"Found {total_lines_in_input} lines in {input_file}!"
+                    logger, f"Found about {total_lines_in_input} lines in {input_file}!"
                 )
                 if total_lines_in_input > 10000:
                     chunkify = True
@@ -106,7 +185,12 @@ async def main():
                         1000000,
                     )
                 output_path = os.path.join(output_dir, input_file)
-                convertJSONToCSV(input_full_path, output_path, chunksize)
+                convertJSONToCSV(
+                    input_full_path,
+                    output_path,
+                    chunksize,
+                    output_format=args.output_format or "csv",
+                )
                 loggingHandler(
                     logger,
                     f"Results for {input_file}, Time taken:{time.time()-task_tick}s -> {output_path}",
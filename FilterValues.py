@@ -1,13 +1,12 @@
 import os
 import time
 from dateparser import parse
+import numpy
 from datetime import datetime
-from traceback import format_exc
-from pandas import read_csv, DataFrame
+from typing import Dict, List, Optional
+from pandas import to_datetime, factorize, DataFrame, Series
 from pypeepa import (
-    ProgressSaver,
     getFilePath,
-    processCSVInChunks,
     initLogging,
     loggingHandler,
     createDirectory,
@@ -18,6 +17,33 @@ from pypeepa import (
     askSelectOptionQuestion,
     askHeaderForMultipleCSV,
 )
+from helpers import (
+    streamCSVInChunks,
+    parseToolArgs,
+    processFilesInPool,
+    CheckpointSaver,
+    readCSVColumns,
+    outputFileName,
+    getValueMatcher,
+    MATCH_MODES,
+    MATCH_METHODS,
+)
+
+
+# Formats tried with pandas before falling back to dateparser, only the year is used so day/month order doesnt matter
+DOB_FORMATS = [
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%Y/%m/%d",
+    "%m-%d-%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%Y-%m-%d %H:%M:%S",
+]
+# Years of birth already parsed in this process keyed on the date of birth string, None if it couldnt be parsed
+dob_years: Dict[str, Optional[int]] = {}
+MAX_CACHED_DOBS = 1000000
 
 
 def calculate_age(date_str, current_year):
@@ -28,6 +54,65 @@ def calculate_age(date_str, current_year):
     return -1  # Return a default value for NaN or invalid values
 
 
+def parseBirthYears(dob_strings: List[str], dob_formats: List[str]):
+    """
+    Parse the year of birth of each string into the `dob_years` cache, using vectorized pandas parsing for the
+    `dob_formats` and dateparser only for the strings none of them could parse.
+    """
+    remaining = Series(dob_strings, dtype=object)
+    for dob_format in dob_formats:
+        if remaining.empty:
+            break
+        parsed = to_datetime(remaining, format=dob_format, errors="coerce")
+        parsed_mask = parsed.notna()
+        dob_years.update(
+            zip(remaining[parsed_mask], parsed[parsed_mask].dt.year.astype(int))
+        )
+        remaining = remaining[~parsed_mask]
+    for dob_string in remaining:
+        dob = parse(dob_string)
+        dob_years[dob_string] = dob.year if dob else None
+
+
+def calculateAges(
+    dob_column: Series, current_year: int, dob_formats: List[str] = DOB_FORMATS
+) -> Series:
+    """
+    Vectorized version of calculate_age, each distinct date of birth is parsed only once per process.
+
+    @param:`dob_column`: Series of date of birth strings.
+    @param:`current_year`: Current year used for age calculation.
+    @param:`dob_formats`: (Optional) Explicit formats tried before falling back to dateparser.
+    @return:
+        Series of ages with -1 for the values that couldnt be parsed, same as calculate_age.
+    """
+    codes, uniques = factorize(dob_column)
+    new_dobs = [dob for dob in uniques if dob not in dob_years]
+    if len(dob_years) + len(new_dobs) > MAX_CACHED_DOBS:
+        dob_years.clear()
+        new_dobs = list(uniques)
+    if new_dobs:
+        parseBirthYears(new_dobs, dob_formats)
+    unique_ages = numpy.array(
+        [
+            -1 if dob_years[dob] is None else current_year - dob_years[dob]
+            for dob in uniques
+        ],
+        dtype=numpy.int64,
+    )
+    return Series(unique_ages[codes], index=dob_column.index)
+
+
+def valueMatcherConfig(process_config: dict) -> dict:
+    """The config of the ValueMatcher comparing the common values, see filterDataFrameByAgeAndCommonValues."""
+    return {
+        "values": process_config["common_values"],
+        "mode": process_config.get("match_mode") or "lower",
+        "method": process_config.get("match_method") or "equal",
+        "max_distance": process_config.get("max_distance") or 1,
+    }
+
+
 def filterDataFrameByAgeAndCommonValues(chunk: DataFrame, process_config: dict):
     """
     Filter a DataFrame based on age and common values.
@@ -39,19 +124,21 @@ def filterDataFrameByAgeAndCommonValues(chunk: DataFrame, process_config: dict):
             @key:`dob_column` (str or None): Column name containing date of birth.\n
             @key:`age_value` (int or None): Minimum age for filtering.\n
             @key:`common_values` (list or None): List of common values to filter by.\n
+            @key:`match_mode` (str or None): How the values are compared, one of MATCH_MODES, defaults to 'lower'.\n
+            @key:`match_method` (str or None): Approximate matching, one of MATCH_METHODS, defaults to 'equal'.\n
+            @key:`max_distance` (int or None): Most edits for the 'edit' method, defaults to 1.\n
             @key:`common_value_header` (str or None): Column header for common values.\n
-            @key:`reverse_filter` (boolean or False): Remove the match and keep the non match
+            @key:`reverse_filter` (boolean or False): Remove the match and keep the non match\n
+            @key:`dob_formats` (list or None): Date of birth formats to try before dateparser, defaults to DOB_FORMATS.
     @return:
         Filtered DataFrame containing rows that satisfy the age and common value criteria.
     """
-    (
-        current_year,
-        dob_column,
-        age_value,
-        common_values,
-        common_value_header,
-        reverse_filter,
-    ) = process_config.values()
+    current_year = process_config["current_year"]
+    dob_column = process_config["dob_column"]
+    age_value = process_config["age_value"]
+    common_value_header = process_config["common_value_header"]
+    reverse_filter = process_config["reverse_filter"]
+    dob_formats = process_config.get("dob_formats") or DOB_FORMATS
     # Setting all to true so that and logic can work so if multiple filters are chosen when both are satisfied then keep those only
     value_matches = filter_age = True
     # Filter age
@@ -59,25 +146,63 @@ def filterDataFrameByAgeAndCommonValues(chunk: DataFrame, process_config: dict):
         chunk[dob_column] = chunk[dob_column].astype(
             str
         )  # Ensure the column is of string type
-        chunk["age"] = chunk[dob_column].apply(calculate_age, args=(current_year,))
+        chunk["age"] = calculateAges(chunk[dob_column], current_year, dob_formats)
         filter_age = chunk["age"] > age_value
 
     # Filter values
     if common_value_header is not None:
-        common_values_lower = [name.lower() for name in common_values]
-        value_matches = (
-            chunk[common_value_header].str.lower().isin(common_values_lower)
-            if not reverse_filter
-            else ~chunk[common_value_header].str.lower().isin(common_values_lower)
-        )
+        # The matcher is built once per process and reused for every chunk and file
+        value_matcher = getValueMatcher(valueMatcherConfig(process_config))
+        value_matches = value_matcher.matchColumn(chunk[common_value_header])
+        if reverse_filter:
+            value_matches = ~value_matches
 
     filtered_df = chunk[filter_age & value_matches]
 
     return filtered_df
 
 
+def filterValuesInFile(
+    input_path: str,
+    output_path: str,
+    process_config: dict,
+    chunk_size: int,
+    hide_progress_bar: bool,
+    chunk_workers: int,
+    checkpoint_dir: Optional[str] = None,
+):
+    """
+    Filter one file.\n
+    @return: Dictionary containing the following keys.\n
+        @key:`rows`: The number of rows written.\n
+        @key:`value_matches`: The stats of the value matcher for this file, None if no values were matched in this
+        process, eg:- with chunk workers.
+    """
+    value_matcher = None
+    if process_config["common_value_header"] is not None:
+        value_matcher = getValueMatcher(valueMatcherConfig(process_config))
+        # The normalized cells are kept between files, only the stats start again
+        value_matcher.resetStats()
+    rows = streamCSVInChunks(
+        input_path,
+        output_path,
+        filterDataFrameByAgeAndCommonValues,
+        process_config,
+        chunk_size,
+        hide_progress_bar,
+        chunk_workers,
+        None,
+        checkpoint_dir,
+    )
+    match_stats = None
+    if value_matcher is not None and value_matcher.rows:
+        match_stats = value_matcher.stats()
+    return {"rows": rows, "value_matches": match_stats}
+
+
 async def main():
     app_name = "FilterValues"
+    args = parseToolArgs()
     logger = initLogging(app_name)
     # User inputs
     input_dir = getFilePath(
@@ -90,7 +215,7 @@ async def main():
 
     chunk_size = 100000
 
-    progress = ProgressSaver(app_name)
+    progress = CheckpointSaver(app_name)
 
     # If saved_data length more than 0 ask users if they want to continue previous process
     progress.askToContinue(logger)
@@ -105,6 +230,36 @@ async def main():
     reverse_filter = askYNQuestion(
         "Reverse filter: Remove the match and keep the non match?(y/n)"
     )
+    match_mode = match_method = max_distance = None
+    if filter_values:
+        match_modes = list(MATCH_MODES)
+        print(
+            "\nHow the values are compared: exact, lower/casefold ignore the case, accents also ignores the accents"
+        )
+        printArray(match_modes)
+        match_mode = match_modes[
+            askSelectOptionQuestion(
+                "Enter the index of the match mode", 1, len(match_modes)
+            )
+            - 1
+        ]
+        match_methods = list(MATCH_METHODS)
+        print(
+            "\nAlso match values that are not equal: edit allows a few typos, phonetic matches values that sound the same, prefix matches values starting with a common value"
+        )
+        printArray(match_methods)
+        match_method = match_methods[
+            askSelectOptionQuestion(
+                "Enter the index of the match method", 1, len(match_methods)
+            )
+            - 1
+        ]
+        if match_method == "edit":
+            max_distance = askSelectOptionQuestion(
+                "Enter the most characters that can be different (1 or 2 for names)",
+                1,
+                3,
+            )
     # TODO Use this for loop to iterate files so that user doesnt have to keep repeating header values for each file
     # input_files_value_headers=askHeaderForMultipleCSV(input_files, input_dir,"values")
     # input_files_dob_headers=askHeaderForMultipleCSV(input_files, input_dir,"dob")
@@ -112,86 +267,102 @@ async def main():
     #     print(f'String 1: {value_header}, Filename: {filename}')
     #     print(f'String 2: {dob_header}, Filename: {filename}')
 
-    # Start the process on each input directory files
-    tick = time.time()
+    # Ask for the columns of every file that still needs processing before any work starts
+    tasks = []
     first_file = True
     for input_file in input_files:
-        task_tick = time.time()
         input_full_path = os.path.join(input_dir, input_file)
         if input_full_path not in progress.saved_data and (filter_values or filter_age):
-            try:
-                if not file_columns_same or first_file:
-                    # Get the first line for header names
-                    all_columns = read_csv(input_full_path, nrows=1).columns
-                    dob_index = names_index = None
-                    printArray(all_columns)
-                    if filter_age:
-                        dob_index = askSelectOptionQuestion(
-                            question=f"Enter the index of the column containing the date of births.",
-                            min=1,
-                            max=len(all_columns),
-                        )
-                        age = askSelectOptionQuestion(
-                            question=f"Enter the age to filter, output will include provided age and older",
-                            min=1,
-                            max=120,
-                        )
-                        current_year = datetime.now().year
-
-                    if filter_values:
-                        names_index = askSelectOptionQuestion(
-                            question=f"Enter the index of the column containing the values you want to filter.",
-                            min=1,
-                            max=len(all_columns),
-                        )
-                        reference_json_file_path = getFilePath(
-                            "Enter the file containing the common values: ",
-                            (".json"),
-                            False,
-                        )
-                        common_values = readJSON(reference_json_file_path)
-
-                process_config = {
-                    "current_year": None if not filter_age else current_year,
-                    "dob_column": None
-                    if not filter_age
-                    else all_columns[dob_index - 1],
-                    "age_value": None if not filter_age else age,
-                    "common_values": None if not filter_values else common_values,
-                    "common_value_header": None
-                    if not filter_values
-                    else all_columns[names_index - 1],
-                    "reverse_filter": reverse_filter,
-                }
-                df = processCSVInChunks(
-                    input_full_path,
-                    filterDataFrameByAgeAndCommonValues,
-                    process_config,
-                    chunk_size,
-                )
-                # Output the file to output folder with same name as input file.
-                output_path = os.path.join(output_dir, input_file)
-                df.to_csv(output_path, index=False)
-                loggingHandler(
-                    logger,
-                    f"Results for {input_file}, Time taken:{time.time()-task_tick}s -> {output_path}",
-                )
+            if not file_columns_same or first_file:
+                # Get the first line for header names
+                try:
+                    all_columns = readCSVColumns(input_full_path)
+                except Exception as err:
+                    loggingHandler(
+                        logger, f"Exception occurred reading {input_file}: {str(err)}"
+                    )
+                    continue
+                dob_index = names_index = None
+                printArray(all_columns)
+                if filter_age:
+                    dob_index = askSelectOptionQuestion(
+                        question="Enter the index of the column containing the date of births.",
+                        min=1,
+                        max=len(all_columns),
+                    )
+                    age = askSelectOptionQuestion(
+                        question="Enter the age to filter, output will include provided age and older",
+                        min=1,
+                        max=120,
+                    )
+                    current_year = datetime.now().year
 
-                # Add to the completed files list
-                progress.saveToJSON(input_full_path, input_file, logger)
+                if filter_values:
+                    names_index = askSelectOptionQuestion(
+                        question="Enter the index of the column containing the values you want to filter.",
+                        min=1,
+                        max=len(all_columns),
+                    )
+                    reference_json_file_path = getFilePath(
+                        "Enter the file containing the common values: ",
+                        (".json"),
+                        False,
+                    )
+                    common_values = readJSON(reference_json_file_path)
                 first_file = False
 
-            except Exception as err:
-                traceback = format_exc()
-                loggingHandler(
-                    logger,
-                    f"Exception occurred: {str(err)}\n{traceback}",
+            process_config = {
+                "current_year": None if not filter_age else current_year,
+                "dob_column": None if not filter_age else all_columns[dob_index - 1],
+                "age_value": None if not filter_age else age,
+                "common_values": None if not filter_values else common_values,
+                "common_value_header": None
+                if not filter_values
+                else all_columns[names_index - 1],
+                "match_mode": match_mode,
+                "match_method": match_method,
+                "max_distance": max_distance,
+                "reverse_filter": reverse_filter,
+            }
+            # Output the file to output folder with same name as input file.
+            output_path = os.path.join(
+                output_dir, outputFileName(input_file, args.output_format)
+            )
+            tasks.append(
+                (
+                    input_full_path,
+                    input_file,
+                    (
+                        input_full_path,
+                        output_path,
+                        process_config,
+                        chunk_size,
+                        args.workers > 1,
+                        args.chunk_workers,
+                        progress.checkpoint_dir,
+                    ),
                 )
-
+            )
         else:
             loggingHandler(
                 logger, f"Skipping file as already complete -> {input_full_path}"
             )
+
+    # Start the process on each input directory files
+    tick = time.time()
+    results = processFilesInPool(
+        filterValuesInFile, tasks, args.workers, progress, logger
+    )
+    for input_full_path, result in results.items():
+        match_stats = result["value_matches"]
+        if match_stats is not None:
+            matched_values = {
+                value: count for value, count in match_stats["values"].items() if count
+            }
+            loggingHandler(
+                logger,
+                f"{input_full_path}: {match_stats['matched']} of {match_stats['rows']} rows matched, {len(match_stats['values']) - len(matched_values)} values never matched, rows per value {matched_values}",
+            )
     loggingHandler(
         logger,
         f"Total time taken:{time.time()-tick}s",
@@ -1,19 +1,34 @@
 import os
+import math
 import time
 import numpy
-from typing import List, Tuple
-from traceback import format_exc
-from pandas import read_csv, DataFrame
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from pandas import read_csv, read_pickle, concat, DataFrame
+from pandas.util import hash_pandas_object
 from pypeepa import (
     initLogging,
-    ProgressSaver,
     askYNQuestion,
     createDirectory,
     getFilePath,
     listDir,
     loggingHandler,
-    processCSVInChunks,
-    askHeaderForMultipleCSV,
+    askSelectOptionQuestion,
+)
+from helpers import (
+    openChunkWriter,
+    fileSignature,
+    readCSVColumns,
+    readDataFile,
+    readFileChunks,
+    askColumnForFiles,
+    outputFileName,
+    profileColumnTypes,
+    streamCSVInChunks,
+    parseToolArgs,
+    processFilesInPool,
+    CheckpointSaver,
 )
 
 
@@ -33,18 +48,86 @@ def dropColumns(df: DataFrame, delete_columns: List[str]):
     return df
 
 
+def indexRightFrame(right_df: DataFrame, right_col: str) -> DataFrame:
+    """Remove nulls and duplicates from the join column of a right DataFrame and make it the index."""
+    right_df = removeNullFromColumn(right_df, [right_col])
+    right_df[right_col] = right_df[right_col].astype(str)
+    right_df.drop_duplicates(subset=right_col, keep="first", inplace=True)
+    return right_df.set_index(right_col)
+
+
+def buildRightIndex(
+    right_file: str, right_col: str, index_dir: Optional[str] = None
+) -> DataFrame:
+    """
+    Build the lookup table for one right file, nulls removed and deduplicated on the join column.
+
+    @param:`right_file`: Path to the right csv, .parquet or .arrow file.
+    @param:`right_col`: The column of the right file to join on.
+    @param:`index_dir`: (Optional) If provided the built index is saved to this directory and reused on later
+    runs as long as the path, size and modification time of the right file and the --categories setting are
+    unchanged.
+    @return:pd.DataFrame: The right file indexed on `right_col`, which is no longer one of its columns.
+    """
+    # Read as category with --categories, which changes the index so it is part of the key
+    dtype = profileColumnTypes(right_file)
+    index_path = None
+    if index_dir is not None:
+        index_path = os.path.join(
+            index_dir,
+            f"{fileSignature(right_file, right_col, sorted((dtype or {}).items()))}.pkl",
+        )
+        if os.path.exists(index_path):
+            return read_pickle(index_path)
+
+    right_df = indexRightFrame(
+        readDataFile(
+            right_file,
+            low_memory=False,
+            encoding_errors="ignore",
+            dtype=dtype,
+        ),
+        right_col,
+    )
+
+    if index_path is not None:
+        createDirectory(index_dir)
+        # Written to a file of this process first, so other workers never read a half written index
+        temp_path = f"{index_path}.{os.getpid()}.part"
+        right_df.to_pickle(temp_path)
+        os.replace(temp_path, index_path)
+    return right_df
+
+
+# Right indexes already built in this process, keyed on (right file, right column)
+right_indexes: Dict[Tuple[str, str], DataFrame] = {}
+
+
+def getRightIndex(
+    right_file: str, right_col: str, index_dir: Optional[str] = None
+) -> DataFrame:
+    """Return the lookup table for a right file, building it only the first time it is asked for."""
+    key = (right_file, right_col)
+    if key not in right_indexes:
+        right_indexes[key] = buildRightIndex(right_file, right_col, index_dir)
+    return right_indexes[key]
+
+
 def innerJoinCSVFiles(chunk: DataFrame, config):
     """
     Perform left join on a DataFrame with multiple CSV files, removing duplicates from right CSVs.
+    Each right file is read only once per run, every chunk after that probes the same in memory index.
 
     @param:`dataframe`: The initial DataFrame.
     @param:`config`: Dictionary containing configurations for the join.
         @key: `left_col`: The column of the left file\n
-        @key: `right_files_and_headers`: The column of the left file\n
+        @key: `right_files_and_headers`: The right files and the column of each to join on\n
+        @key: `index_dir`: (Optional) Directory to save the right indexes in for later runs\n
         Example config:
             {\n
             'left_col': 'id',\n
-            'right_files_and_headers': [('path/to/1.csv', "E-mail"), ('path/to/2.csv', "email")]\n
+            'right_files_and_headers': [('path/to/1.csv', "E-mail"), ('path/to/2.csv', "email")],\n
+            'index_dir': 'saves/JoinMultipleCSV.index'\n
             }\n
 
     @return:pd.DataFrame: DataFrame with all columns from right CSVs joined based on the specified configurations.
@@ -53,32 +136,243 @@ def innerJoinCSVFiles(chunk: DataFrame, config):
     left_col = config["left_col"]
     left_df[left_col] = left_df[left_col].astype(str)
 
-    for right_file in config["right_files_and_headers"]:
-        right_df = read_csv(right_file[0], low_memory=False, encoding_errors="ignore")
-
-        right_col = right_file[1]
-        right_df = removeNullFromColumn(right_df, [right_col])
-        right_df[right_col] = right_df[right_col].astype(str)
-        right_df.drop_duplicates(subset=right_col, keep="first", inplace=True)
-
-        # print(
-        #     "Shapes before merge - left_df:",
-        #     left_df.info(),
-        #     "right_df:",
-        #     right_df.info(),
-        # )
-
-        merged_df = left_df.merge(
-            right_df,
-            how="left",
-            left_on=left_col,
-            right_on=right_col,
+    for right_file, right_col in config["right_files_and_headers"]:
+        right_index = getRightIndex(right_file, right_col, config.get("index_dir"))
+        left_df = left_df.join(right_index, on=left_col, lsuffix="_x", rsuffix="_y")
+
+    return left_df
+
+
+# Rough ratio between the size of a csv file on disk and the size of its DataFrame in memory
+MEMORY_PER_CSV_BYTE = 4
+# Column added to the left partitions to restore the original row order after the join
+ROW_COLUMN = "__left_row__"
+# Name of the left partition holding the rows with a null key
+NULL_PARTITION = "null"
+
+
+def countJoinPartitions(
+    left_files: List[str], right_files: List[str], memory_limit_mb: int
+) -> int:
+    """Number of hash partitions needed so one left partition and one right partition fit in `memory_limit_mb`."""
+    largest_left = max(os.path.getsize(left_file) for left_file in left_files)
+    largest_right = max(os.path.getsize(right_file) for right_file in right_files)
+    needed_bytes = (largest_left + largest_right) * MEMORY_PER_CSV_BYTE
+    return max(1, math.ceil(needed_bytes / (memory_limit_mb * 1024 * 1024)))
+
+
+def partitionCSV(
+    csv_file: str,
+    key_col: str,
+    partition_dir: str,
+    partitions: int,
+    chunk_size: int,
+    left: bool,
+) -> int:
+    """
+    Split a csv, .parquet or .arrow file into `partitions` csv files on the hash of `key_col`, so equal keys of the left and right files
+    always end up in partitions with the same number.
+
+    @param:`csv_file`: Path to the csv, .parquet or .arrow file.
+    @param:`key_col`: The column to join on.
+    @param:`partition_dir`: Directory to write the partition files to, named 0.csv, 1.csv...
+    @param:`partitions`: Number of partitions.
+    @param:`chunk_size`: Number of rows read at a time.
+    @param:`left`: If True the rows are numbered in ROW_COLUMN and the rows with a null key are written to
+    NULL_PARTITION instead, else the rows with a null key are removed. A null key can never match, so these rows
+    dont all have to go to the one partition "nan" hashes to.
+    @return:int: The number of rows partitioned.
+    """
+    createDirectory(partition_dir)
+    headers_written = set()
+    row_count = 0
+    read_options = (
+        {"on_bad_lines": "skip"} if left else {}
+    )  # Same options as the in memory join
+
+    def appendToPartition(partition_id, group: DataFrame):
+        group.to_csv(
+            os.path.join(partition_dir, f"{partition_id}.csv"),
+            mode="a",
+            header=partition_id not in headers_written,
+            index=False,
         )
+        headers_written.add(partition_id)
 
-        left_df = merged_df.drop(columns=[right_col])
-        # print("Shape after merge and drop:", left_df.info())
+    for chunk in readFileChunks(
+        csv_file,
+        chunk_size,
+        low_memory=False,
+        encoding_errors="ignore",
+        dtype=profileColumnTypes(csv_file),
+        **read_options,
+    ):
+        null_keys = chunk[key_col].isna()
+        if left:
+            chunk[ROW_COLUMN] = numpy.arange(row_count, row_count + len(chunk.index))
+            row_count += len(chunk.index)
+            if null_keys.any():
+                appendToPartition(NULL_PARTITION, chunk[null_keys])
+        chunk = chunk[~null_keys]
+        if not left:
+            row_count += len(chunk.index)
+        chunk[key_col] = chunk[key_col].astype(str)
+        partition_ids = hash_pandas_object(chunk[key_col], index=False) % partitions
+        for partition_id, group in chunk.groupby(partition_ids.values):
+            appendToPartition(partition_id, group)
+    return row_count
 
-    return left_df
+
+def readPartition(partition_path: str, columns: List[str]) -> DataFrame:
+    """Read a partition file back as text so the values are written out exactly as they were read."""
+    if not os.path.exists(partition_path):
+        return DataFrame(columns=columns, dtype=str)
+    return read_csv(partition_path, dtype=str, keep_default_na=False)
+
+
+def partitionRightFiles(
+    right_files_and_headers: List[Tuple[str, str]],
+    spill_dir: str,
+    partitions: int,
+    chunk_size: int,
+) -> List[Tuple[str, str, List[str]]]:
+    """
+    Partition every right file once for the whole run.
+    @return: List of tuples containing the partition directory, the join column and the columns of each right file.
+    """
+    right_partitions = []
+    for right_number, (right_file, right_col) in enumerate(right_files_and_headers):
+        partition_dir = os.path.join(spill_dir, "right", str(right_number))
+        partitionCSV(right_file, right_col, partition_dir, partitions, chunk_size, False)
+        right_columns = readCSVColumns(right_file)
+        right_partitions.append((partition_dir, right_col, right_columns))
+    return right_partitions
+
+
+def readInRowOrder(partition_paths: List[str], total_rows: int, window_size: int):
+    """
+    Merge joined partition files, each already sorted on ROW_COLUMN, back into the original left row order.
+    Each partition is read `window_size` / number of partitions rows at a time, so about 2 windows of rows are
+    in memory however many partitions there are.
+    """
+    read_size = max(1, window_size // max(1, len(partition_paths)))
+    readers = [
+        read_csv(path, dtype=str, keep_default_na=False, chunksize=read_size)
+        for path in partition_paths
+    ]
+    buffers = [DataFrame() for _ in partition_paths]
+    for window_end in range(window_size, total_rows + window_size, window_size):
+        window = []
+        for index, reader in enumerate(readers):
+            # Read more of this partition until it passes the end of the window
+            while reader is not None and (
+                buffers[index].empty or buffers[index][ROW_COLUMN].iloc[-1] < window_end
+            ):
+                chunk = next(reader, None)
+                if chunk is None:
+                    readers[index] = reader = None
+                    break
+                chunk[ROW_COLUMN] = chunk[ROW_COLUMN].astype(numpy.int64)
+                buffers[index] = (
+                    chunk
+                    if buffers[index].empty
+                    else concat([buffers[index], chunk], ignore_index=True)
+                )
+            if buffers[index].empty:
+                continue
+            in_window = buffers[index][ROW_COLUMN] < window_end
+            window.append(buffers[index][in_window])
+            buffers[index] = buffers[index][~in_window]
+        if window:
+            yield concat(window).sort_values(ROW_COLUMN).drop(columns=[ROW_COLUMN])
+
+
+def outOfCoreJoinCSVFiles(
+    left_file: str, output_path: str, config, chunk_size: int
+) -> int:
+    """
+    Grace hash join of a left file with multiple right files that dont fit in memory, same result as
+    innerJoinCSVFiles except that all values are kept as text.
+    Both sides are hash partitioned on their join column, each left partition is then joined with the matching
+    partition of every right file and the partitions are merged back in the original left row order.
+
+    @param:`left_file`: Path to the left csv, .parquet or .arrow file.
+    @param:`output_path`: Path of the output csv, .parquet or .arrow file.
+    @param:`config`: Dictionary containing configurations for the join.
+        @key: `left_col`: The column of the left file\n
+        @key: `partitions`: Number of partitions\n
+        @key: `right_partitions`: The output of partitionRightFiles\n
+        @key: `spill_dir`: Directory for the partition files\n
+    @param:`chunk_size`: Number of rows read at a time.
+    @return:int: The number of rows written.
+    """
+    left_col = config["left_col"]
+    partitions = config["partitions"]
+    left_dir = os.path.join(config["spill_dir"], fileSignature(left_file))
+    try:
+        left_partition_dir = os.path.join(left_dir, "left")
+        total_rows = partitionCSV(
+            left_file, left_col, left_partition_dir, partitions, chunk_size, True
+        )
+        left_columns = readCSVColumns(left_file) + [ROW_COLUMN]
+
+        joined_dir = os.path.join(left_dir, "joined")
+        createDirectory(joined_dir)
+        joined_paths = []
+        for partition_id in range(partitions):
+            partition_file = f"{partition_id}.csv"
+            left_df = readPartition(
+                os.path.join(left_partition_dir, partition_file), left_columns
+            )
+            if left_df.empty:
+                continue
+            for partition_dir, right_col, right_columns in config["right_partitions"]:
+                right_index = indexRightFrame(
+                    readPartition(
+                        os.path.join(partition_dir, partition_file), right_columns
+                    ),
+                    right_col,
+                )
+                left_df = left_df.join(
+                    right_index, on=left_col, lsuffix="_x", rsuffix="_y"
+                )
+            joined_path = os.path.join(joined_dir, partition_file)
+            left_df.to_csv(joined_path, index=False)
+            joined_paths.append(joined_path)
+
+        null_partition_path = os.path.join(
+            left_partition_dir, f"{NULL_PARTITION}.csv"
+        )
+        if os.path.exists(null_partition_path):
+            # Joined with empty right files so they get the same columns, a chunk at a time as there can be many
+            empty_right_indexes = [
+                indexRightFrame(DataFrame(columns=right_columns, dtype=str), right_col)
+                for _, right_col, right_columns in config["right_partitions"]
+            ]
+            joined_path = os.path.join(joined_dir, f"{NULL_PARTITION}.csv")
+            for null_number, left_df in enumerate(
+                read_csv(
+                    null_partition_path,
+                    dtype=str,
+                    keep_default_na=False,
+                    chunksize=chunk_size,
+                )
+            ):
+                for right_index in empty_right_indexes:
+                    left_df = left_df.join(
+                        right_index, on=left_col, lsuffix="_x", rsuffix="_y"
+                    )
+                left_df.to_csv(
+                    joined_path, mode="a", header=null_number == 0, index=False
+                )
+            joined_paths.append(joined_path)
+
+        with openChunkWriter(output_path) as writer:
+            for window in readInRowOrder(joined_paths, total_rows, chunk_size):
+                writer.write(window)
+        return writer.rows_written
+    finally:
+        shutil.rmtree(left_dir, ignore_errors=True)
 
 
 def main():
@@ -86,6 +380,7 @@ def main():
     print(
         "Before running this, make sure you have the files you want to join to (left) in one folder.\nAnd the files you want to join with (right) in another folder."
     )
+    args = parseToolArgs()
     logger = initLogging(app_name)
     # User inputs
     left_dir = getFilePath(
@@ -101,7 +396,7 @@ def main():
 
     chunk_size = 100000
 
-    progress = ProgressSaver(app_name)
+    progress = CheckpointSaver(app_name)
 
     # If saved_data length more than 0 ask users if they want to continue previous process
     progress.askToContinue(logger)
@@ -112,45 +407,97 @@ def main():
     right_files = listDir(right_dir, "files")
 
     # Get the list of tuples containing the full paths and header names for left directory files.
-    left_files_and_headers = askHeaderForMultipleCSV(left_files, left_dir)
+    left_files_and_headers = askColumnForFiles(left_files, left_dir)
     # Get the list of tuples containing the full paths and header names for right directory files.
-    right_files_and_headers = askHeaderForMultipleCSV(right_files, right_dir)
+    right_files_and_headers = askColumnForFiles(right_files, right_dir)
+    out_of_core = askYNQuestion(
+        "Are the right files too large to fit in memory? They will be joined from disk in partitions.(y/n)"
+    )
+    if out_of_core:
+        memory_limit_mb = askSelectOptionQuestion(
+            "Enter the memory limit in MB for joining each partition",
+            64,
+            1048576,
+        )
+    else:
+        save_index = askYNQuestion(
+            "Save the right files index to disk so later runs can skip building it?(y/n)"
+        )
+        index_dir = os.path.join("saves", f"{app_name}.index") if save_index else None
 
-    # Start the process on each input directory files
-    tick = time.time()
-    for left_file in left_files_and_headers:
-        task_tick = time.time()
-        left_full_path = left_file[0]
+    # Collect the files that still need processing before any work starts
+    remaining_files_and_headers = []
+    for left_full_path, left_col in left_files_and_headers:
         if left_full_path not in progress.saved_data:
-            try:
-                process_config = {
-                    "left_col": left_file[1],
-                    "right_files_and_headers": right_files_and_headers,
-                }
-                df = processCSVInChunks(
-                    left_full_path, innerJoinCSVFiles, process_config, chunk_size
-                )
-                output_path = os.path.join(output_dir, os.path.basename(left_file[0]))
-                df.to_csv(output_path, index=False)
-                # Add to the completed files list
-                progress.saveToJSON(
-                    left_full_path, os.path.basename(left_file[0]), logger
-                )
-
-            except Exception as err:
-                # Log the exception message along with the traceback information
-                traceback = format_exc()
-                loggingHandler(
-                    logger,
-                    f"Exception occurred: {str(err)}\n{traceback}",
-                )
+            remaining_files_and_headers.append((left_full_path, left_col))
         else:
             loggingHandler(
                 logger, f"Skipping file as already complete -> {left_full_path}"
             )
+    if len(remaining_files_and_headers) == 0:
+        return
+
+    tick = time.time()
+    spill_dir = None
+    if out_of_core:
+        partitions = countJoinPartitions(
+            [left_full_path for left_full_path, _ in remaining_files_and_headers],
+            [right_full_path for right_full_path, _ in right_files_and_headers],
+            memory_limit_mb,
+        )
+        spill_dir = tempfile.mkdtemp(prefix="join-spill-", dir=output_dir)
         loggingHandler(
-            logger, f"Time taken to complete {left_file[0]} -> {time.time()-task_tick}s"
+            logger, f"Partitioning the right files in {partitions} partitions..."
+        )
+        right_partitions = partitionRightFiles(
+            right_files_and_headers, spill_dir, partitions, chunk_size
+        )
+
+    tasks = []
+    for left_full_path, left_col in remaining_files_and_headers:
+        output_path = os.path.join(
+            output_dir,
+            outputFileName(os.path.basename(left_full_path), args.output_format),
+        )
+        if out_of_core:
+            process_config = {
+                "left_col": left_col,
+                "partitions": partitions,
+                "right_partitions": right_partitions,
+                "spill_dir": spill_dir,
+            }
+            task_args = (left_full_path, output_path, process_config, chunk_size)
+        else:
+            process_config = {
+                "left_col": left_col,
+                "right_files_and_headers": right_files_and_headers,
+                "index_dir": index_dir,
+            }
+            task_args = (
+                left_full_path,
+                output_path,
+                innerJoinCSVFiles,
+                process_config,
+                chunk_size,
+                args.workers > 1,
+                1,
+                None,
+                progress.checkpoint_dir,
+            )
+        tasks.append((left_full_path, os.path.basename(left_full_path), task_args))
+
+    # Start the process on each input directory files, every worker builds the right indexes once
+    try:
+        processFilesInPool(
+            outOfCoreJoinCSVFiles if out_of_core else streamCSVInChunks,
+            tasks,
+            args.workers,
+            progress,
+            logger,
         )
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
     loggingHandler(logger, f"Time taken to complete all files -> {time.time()-tick}s")
 
 
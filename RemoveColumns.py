@@ -1,7 +1,6 @@
 import os
 import time
 from typing import List
-from traceback import format_exc
 from pandas import DataFrame
 from pypeepa import (
     initLogging,
@@ -11,16 +10,21 @@ from pypeepa import (
     readJSON,
     loggingHandler,
     askYNQuestion,
-    processCSVInChunks,
-    ProgressSaver,
+)
+from helpers import (
+    streamCSVInChunks,
+    parseToolArgs,
+    processFilesInPool,
+    readCSVColumns,
+    outputFileName,
+    CheckpointSaver,
 )
 
 
 def dropColumns(df: DataFrame, delete_columns: List[str]):
     """Remove multiple columns from a dataframe"""
     columns_to_drop = [col for col in delete_columns if col in df.columns]
-    df.drop(columns=columns_to_drop, errors="ignore")
-    return df
+    return df.drop(columns=columns_to_drop, errors="ignore")
 
 
 # Main function
@@ -30,6 +34,7 @@ async def main():
     print(
         f"Before running this make sure you have a .json file with all the\ncolumn names listed on an array.\n  eg:- ['column1','column2']"
     )
+    args = parseToolArgs()
     # Initialising logging
     logger = initLogging(app_name)
     # User inputs
@@ -44,50 +49,61 @@ async def main():
         "Enter the .json file containing the columns to delete: ", (".json"), False
     )
     chunk_size = 100000
-    progress = ProgressSaver(app_name)
+    progress = CheckpointSaver(app_name)
     progress.askToContinue(logger)
 
     del_cols = readJSON(del_cols_path)
     # Get the list of input directory files.
     input_files = listDir(input_dir, get="files")
 
-    # Start the process on each input directory files
+    # Collect the files that still need processing before any work starts
+    tasks = []
     for input_file in input_files:
-        task_tick = time.time()
         input_full_path = os.path.join(input_dir, input_file)
         # Check saved_data for file
         if input_full_path not in progress.saved_data:
+            # Output the file to output folder with same name.
+            output_path = os.path.join(
+                output_dir, outputFileName(input_file, args.output_format)
+            )
             try:
-                df = processCSVInChunks(
-                    input_full_path,
-                    dropColumns,
-                    del_cols,
-                    chunk_size,
-                )
-                # Output the file to output folder with same name.
-                output_path = os.path.join(output_dir, input_file)
-                df.to_csv(output_path, index=False)
+                # Only the columns that are kept get parsed
+                keep_cols = [
+                    col
+                    for col in readCSVColumns(input_full_path)
+                    if col not in del_cols
+                ]
+            except Exception as err:
                 loggingHandler(
-                    logger,
-                    f"Results for {input_file}, Time taken:{time.time()-task_tick}s -> {output_path}",
+                    logger, f"Exception occurred reading {input_file}: {str(err)}"
                 )
-                # Add to the completed files list
-                progress.saveToJSON(input_full_path, input_file, logger)
-
-            except Exception as err:
-                traceback_info = format_exc()
-                # Log the exception message along with the traceback information
-                log_message = (
-                    f"Exception occurred: {str(err)}\nTraceback:\n{traceback_info}"
+                continue
+            tasks.append(
+                (
+                    input_full_path,
+                    input_file,
+                    (
+                        input_full_path,
+                        output_path,
+                        dropColumns,
+                        del_cols,
+                        chunk_size,
+                        args.workers > 1,
+                        args.chunk_workers,
+                        keep_cols,
+                        progress.checkpoint_dir,
+                    ),
                 )
-                loggingHandler(logger, log_message)
+            )
         else:
             loggingHandler(
                 logger, f"Skipping file as already complete -> {input_full_path}"
             )
-        loggingHandler(
-            logger, f"Time taken to complete {input_file} -> {time.time()-task_tick}s"
-        )
+
+    # Start the process on each input directory files
+    tick = time.time()
+    processFilesInPool(streamCSVInChunks, tasks, args.workers, progress, logger)
+    loggingHandler(logger, f"Time taken to complete all files-> {time.time()-tick}s")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import os
 import time
-from typing import List
-from traceback import format_exc
+from itertools import compress
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
 from pandas import DataFrame
 from pypeepa import (
     initLogging,
@@ -11,27 +12,237 @@ from pypeepa import (
     readJSON,
     loggingHandler,
     askYNQuestion,
-    processCSVInChunks,
-    ProgressSaver,
+    askSelectOptionQuestion,
+    progressBarIterator,
 )
+from helpers import (
+    openChunkWriter,
+    fileFormat,
+    outputFileName,
+    readFileChunks,
+    streamCSVInChunks,
+    parseToolArgs,
+    processFilesInPool,
+    readCSVColumns,
+    profileColumnTypes,
+    makeRecordFieldCounter,
+    chunkBytesForRows,
+    readColumnarSchema,
+    CheckpointSaver,
+)
+
+READ_OPTIONS = {"low_memory": False, "encoding_errors": "ignore", "on_bad_lines": "skip"}
+LINE_BATCH_BYTES = 16 * 1024 * 1024
+
+
+def keepRowsMask(df: DataFrame, columns: List[str], how: str) -> np.ndarray:
+    """
+    Find the rows to keep.\n
+    @param:`df`: The DataFrame to check, all of `columns` must be in it.\n
+    @param:`columns`: The columns checked for nulls.\n
+    @param:`how`: "all" removes a row only if all the columns are null, "any" removes it if any of them is null.\n
+    @return: A boolean array, True for the rows to keep.
+    """
+    if not columns:
+        return np.ones(len(df.index), dtype=bool)
+    not_null = df[columns].notnull().to_numpy()
+    if how == "all":
+        return not_null.any(axis=1)
+    return not_null.all(axis=1)
+
+
+def removeNullFromColumn(df: DataFrame, process_config: Dict[str, Any]):
+    """
+    Remove the rows with null values in the columns specified.\n
+    @param:`process_config`: Dictionary containing the following keys.\n
+        @key:`columns`: The columns checked for nulls.\n
+        @key:`how`: "all" removes a row only if all the columns are null, "any" removes it if any of them is null.
+    """
+    columns = [col for col in process_config["columns"] if col in df.columns]
+    return df[keepRowsMask(df, columns, process_config["how"])]
+
+
+def scanNullRows(
+    csv_file: str, columns: List[str], how: str, chunk_size: int
+) -> Dict[str, Any]:
+    """
+    First phase of the two phase mode, only the checked columns are parsed to find the rows to keep.\n
+    @return: Dictionary containing the following keys.\n
+        @key:`bitmap`: The rows to keep packed 8 per byte with numpy.packbits.\n
+        @key:`rows`: The number of rows parsed.\n
+        @key:`kept`: The number of rows to keep.\n
+        @key:`nulls`: The number of rows removed that were null on each column.
+    """
+    masks = []
+    nulls = dict.fromkeys(columns, 0)
+    # With no columns to check only the first column is parsed to count the rows
+    usecols = columns or readCSVColumns(csv_file)[:1]
+    for chunk in readFileChunks(
+        csv_file,
+        chunk_size,
+        usecols,
+        dtype=profileColumnTypes(csv_file),
+        **READ_OPTIONS,
+    ):
+        keep = keepRowsMask(chunk, columns, how)
+        countRemovedNulls(chunk, keep, nulls)
+        masks.append(keep)
+    keep = np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+    return {
+        "bitmap": np.packbits(keep),
+        "rows": len(keep),
+        "kept": int(keep.sum()),
+        "nulls": nulls,
+    }
+
+
+def countLinesAndFields(csv_file: str) -> Tuple[int, int, int, int]:
+    """
+    Count the physical lines of a file and the fields of the records they make, found with the same quote rules as
+    the chunked reads so a new line or a comma inside a quoted value doesnt end a record or a field. A last line
+    without a line break is counted too.\n
+    @return: Tuple of the number of lines, the number of records, the fields of the header and the most fields of
+    any record after it.
+    """
+    lines = records = header_fields = widest = 0
+    last_byte = b"\n"
+    countRecordFields = makeRecordFieldCounter()
+
+    def addFieldCounts(field_counts: np.ndarray):
+        nonlocal records, header_fields, widest
+        row_fields = field_counts
+        if records == 0 and len(field_counts):
+            header_fields = int(field_counts[0])
+            row_fields = field_counts[1:]
+        records += len(field_counts)
+        if len(row_fields):
+            widest = max(widest, int(row_fields.max()))
+
+    with open(csv_file, "rb") as f:
+        while True:
+            block = f.read(LINE_BATCH_BYTES)
+            if not block:
+                break
+            lines += block.count(b"\n")
+            addFieldCounts(countRecordFields(block))
+            last_byte = block[-1:]
+    if last_byte != b"\n":
+        lines += 1
+        addFieldCounts(countRecordFields(b"\n"))
+    return lines, records, header_fields, widest
 
 
-def removeNullFromColumn(df: DataFrame, check_for_null_columns: List[str]):
-    """Remove any null values in the column specified, if more than one column is specified then if all are null only
-    remove those."""
-    for col in check_for_null_columns:
-        if col in df.columns:
-            df = df[df[col].notnull()]
-    return df
+def copyKeptLines(csv_file: str, output_path: str, keep: np.ndarray):
+    """Copy the header and the lines of the rows to keep from `csv_file` as they are, without parsing them."""
+    temp_path = f"{output_path}.part"
+    try:
+        with open(csv_file, "rb") as f, open(temp_path, "wb") as out:
+            out.write(f.readline())
+            row = 0
+            while True:
+                lines = f.readlines(LINE_BATCH_BYTES)
+                if not lines:
+                    break
+                out.writelines(compress(lines, keep[row : row + len(lines)]))
+                row += len(lines)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def countRemovedNulls(chunk: DataFrame, keep: np.ndarray, nulls: Dict[str, int]):
+    """Add the number of rows removed from a chunk that were null on each column to `nulls`."""
+    removed = chunk[~keep]
+    for col in nulls:
+        nulls[col] += int(removed[col].isnull().sum())
+
+
+def writeKeptRows(
+    csv_file: str,
+    output_path: str,
+    columns: List[str],
+    how: str,
+    chunk_size: int,
+    hide_progress_bar: Optional[bool] = False,
+) -> Dict[str, Any]:
+    """
+    Parse the full rows and write only the rows to keep, bad lines are skipped the same as in every other mode.\n
+    @return: The same stats as scanNullRows without the bitmap.
+    """
+    stats = {"rows": 0, "kept": 0, "nulls": dict.fromkeys(columns, 0)}
+    chunk_reader = readFileChunks(
+        csv_file, chunk_size, dtype=profileColumnTypes(csv_file), **READ_OPTIONS
+    )
+    if not hide_progress_bar:
+        if fileFormat(csv_file) != "csv":
+            total_chunks = -(-readColumnarSchema(csv_file)[1] // chunk_size)
+        else:
+            total_chunks = -(
+                -os.path.getsize(csv_file) // chunkBytesForRows(csv_file, chunk_size)
+            )
+        chunk_reader = progressBarIterator(
+            chunk_reader, max(1, total_chunks), "Writing rows -> "
+        )
+    with openChunkWriter(output_path) as writer:
+        for chunk in chunk_reader:
+            keep = keepRowsMask(chunk, columns, how)
+            countRemovedNulls(chunk, keep, stats["nulls"])
+            writer.write(chunk[keep])
+            stats["rows"] += len(chunk.index)
+            stats["kept"] += int(keep.sum())
+    return stats
+
+
+def removeNullRowsTwoPhase(
+    csv_file: str,
+    output_path: str,
+    process_config: Dict[str, Any],
+    chunk_size: Optional[int] = 100000,
+    hide_progress_bar: Optional[bool] = False,
+) -> Dict[str, Any]:
+    """
+    Remove the rows with null values without parsing and writing the full rows again when possible.\n
+    When every line of a csv file is one record with no more fields than the header, found by reading the bytes
+    with the same quote rules as the chunked reads, a first pass parses only the checked columns to build a bitmap
+    of the rows to keep and a second pass copies the lines in the bitmap as they are. Otherwise, eg:- with quoted
+    values containing new lines, blank lines or bad lines, and for Parquet and Arrow IPC files, the full rows are
+    parsed once and written again.\n
+    @param:`csv_file`: Path to the csv, .parquet or .arrow file.\n
+    @param:`output_path`: Path of the output csv, .parquet or .arrow file.\n
+    @param:`process_config`: Same as removeNullFromColumn.\n
+    @param:`chunk_size`: (Optional) Number of rows parsed at a time.\n
+    @param:`hide_progress_bar`: (Optional) Set to True if you dont want the progress bar.\n
+    @return: The stats of scanNullRows without the bitmap, plus `copied` True if the lines were copied as they are.
+    """
+    columns, how = process_config["columns"], process_config["how"]
+    if fileFormat(csv_file) == "csv" and fileFormat(output_path) == "csv":
+        lines, records, header_fields, widest = countLinesAndFields(csv_file)
+        # The scan only parses some columns so it would keep bad lines with too many fields
+        if lines == records and widest <= header_fields:
+            stats = scanNullRows(csv_file, columns, how, chunk_size)
+            # Blank lines are records that dont give a row
+            if stats["rows"] + 1 == records:
+                keep = np.unpackbits(stats.pop("bitmap"), count=stats["rows"])
+                copyKeptLines(csv_file, output_path, keep.astype(bool))
+                stats["copied"] = True
+                return stats
+    stats = writeKeptRows(
+        csv_file, output_path, columns, how, chunk_size, hide_progress_bar
+    )
+    stats["copied"] = False
+    return stats
 
 
 # Main function
 # variables:
 async def main():
-    app_name = "ReorderColumns"
+    app_name = "RemoveNullValues"
     print(
-        f"Before running this make sure you have a .json file with all the\ncolumn names listed on an array. If multiple columns are provided, only\nthose values will be removed which are null on all the columns provided.\n  eg:- ['column1','column2']"
+        "Before running this make sure you have a .json file with all the\ncolumn names listed on an array.\n  eg:- ['column1','column2']"
     )
+    args = parseToolArgs()
     # Initialising logging
     logger = initLogging(app_name)
     # User inputs
@@ -47,8 +258,17 @@ async def main():
         (".json"),
         False,
     )
+    how_index = askSelectOptionQuestion(
+        "Remove a row when:\n  1. All the columns are null\n  2. Any of the columns is null\nEnter the option: ",
+        1,
+        2,
+    )
+    how = "all" if how_index == 1 else "any"
+    two_phase = askYNQuestion(
+        "Scan the columns first and then copy the rows kept? Faster when most rows are kept (y/n)"
+    )
     chunk_size = 100000
-    progress = ProgressSaver(app_name)
+    progress = CheckpointSaver(app_name)
 
     check_cols = readJSON(check_cols_path)
     progress.askToContinue(logger)
@@ -56,43 +276,73 @@ async def main():
     # Get the list of input directory files.
     input_files = listDir(input_dir, get="files")
 
-    # Start the process on each input directory files
+    # Collect the files that still need processing before any work starts
+    tasks = []
     for input_file in input_files:
-        task_tick = time.time()
         input_full_path = os.path.join(input_dir, input_file)
         # Check saved_data for file
         if input_full_path not in progress.saved_data:
+            # Output the file to output folder with same name.
+            output_path = os.path.join(
+                output_dir, outputFileName(input_file, args.output_format)
+            )
             try:
-                df = processCSVInChunks(
-                    input_full_path,
-                    removeNullFromColumn,
-                    check_cols,
-                    chunk_size,
+                # Check the header once instead of every chunk
+                file_cols = readCSVColumns(input_full_path)
+            except Exception as err:
+                loggingHandler(
+                    logger, f"Exception occurred reading {input_file}: {str(err)}"
                 )
-                # Output the file to output folder with same name.
-                output_path = os.path.join(output_dir, input_file)
-                df.to_csv(output_path, index=False)
+                continue
+            file_check_cols = [col for col in check_cols if col in file_cols]
+            if len(file_check_cols) != len(check_cols):
                 loggingHandler(
                     logger,
-                    f"Results for {input_file}, Time taken:{time.time()-task_tick}s -> {output_path}",
+                    f"Columns not found in {input_file}: {[col for col in check_cols if col not in file_cols]}",
                 )
-                # Add to the completed files list
-                progress.saveToJSON(input_full_path, input_file, logger)
-
-            except Exception as err:
-                traceback_info = format_exc()
-                # Log the exception message along with the traceback information
-                log_message = (
-                    f"Exception occurred: {str(err)}\nTraceback:\n{traceback_info}"
+            process_config = {"columns": file_check_cols, "how": how}
+            if two_phase:
+                task_args = (
+                    input_full_path,
+                    output_path,
+                    process_config,
+                    chunk_size,
+                    args.workers > 1,
+                )
+            else:
+                task_args = (
+                    input_full_path,
+                    output_path,
+                    removeNullFromColumn,
+                    process_config,
+                    chunk_size,
+                    args.workers > 1,
+                    args.chunk_workers,
+                    None,
+                    progress.checkpoint_dir,
                 )
-                loggingHandler(logger, log_message)
+            tasks.append((input_full_path, input_file, task_args))
         else:
             loggingHandler(
                 logger, f"Skipping file as already complete -> {input_full_path}"
             )
-        loggingHandler(
-            logger, f"Time taken to complete {input_file} -> {time.time()-task_tick}s"
-        )
+
+    # Start the process on each input directory files
+    tick = time.time()
+    results = processFilesInPool(
+        removeNullRowsTwoPhase if two_phase else streamCSVInChunks,
+        tasks,
+        args.workers,
+        progress,
+        logger,
+    )
+    if two_phase:
+        for input_full_path, stats in results.items():
+            loggingHandler(
+                logger,
+                f"{input_full_path}: kept {stats['kept']} of {stats['rows']} rows, nulls on the removed rows per column: {stats['nulls']}, lines copied as they are: {stats['copied']}",
+            )
+    loggingHandler(logger, f"Time taken to complete all files-> {time.time()-tick}s")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,6 @@
 import os
 import time
 from typing import List
-from traceback import format_exc
 from pandas import DataFrame
 from pypeepa import (
     initLogging,
@@ -11,16 +10,21 @@ from pypeepa import (
     readJSON,
     loggingHandler,
     askYNQuestion,
-    processCSVInChunks,
-    ProgressSaver,
+)
+from helpers import (
+    streamCSVInChunks,
+    parseToolArgs,
+    processFilesInPool,
+    readCSVColumns,
+    outputFileName,
+    CheckpointSaver,
 )
 
 
 def reorderColumns(df: DataFrame, ordered_columns: List[str]):
-    """Change the order of the columns according to a provided list of columns"""
-    columns_to_reorder = [col for col in ordered_columns if col in df.columns]
-    df.reindex(columns=columns_to_reorder, fill_value="")
-    return df
+    """Change the order of the columns according to a provided list of columns, the columns in the list that are not
+    in the dataframe are added empty"""
+    return df.reindex(columns=ordered_columns, fill_value="")
 
 
 # Main function
@@ -30,6 +34,7 @@ async def main():
     print(
         f"Before running this make sure you have a .json file with all the\ncolumn names listed on an array. The order will be maintained.\n  eg:- ['column1','column2']"
     )
+    args = parseToolArgs()
     # Initialising logging
     logger = initLogging(app_name)
     # User inputs
@@ -39,11 +44,12 @@ async def main():
     output_dir = getFilePath(
         "Enter the output location: ",
     )
+    createDirectory(output_dir)
     reorder_cols_path = getFilePath(
         "Enter the .json file containing the columns to reorder: ", (".json"), False
     )
     chunk_size = 100000
-    progress = ProgressSaver(app_name)
+    progress = CheckpointSaver(app_name)
 
     reorder_cols = readJSON(reorder_cols_path)
     progress.askToContinue(logger)
@@ -51,41 +57,51 @@ async def main():
     # Get the list of input directory files.
     input_files = listDir(input_dir, get="files")
 
-    # Start the process on each input directory files
-    tick = time.time()
+    # Collect the files that still need processing before any work starts
+    tasks = []
     for input_file in input_files:
-        task_tick = time.time()
         input_full_path = os.path.join(input_dir, input_file)
         # Check saved_data for file
         if input_full_path not in progress.saved_data:
+            # Output the file to output folder with same name.
+            output_path = os.path.join(
+                output_dir, outputFileName(input_file, args.output_format)
+            )
             try:
-                df = processCSVInChunks(
-                    input_full_path,
-                    reorderColumns,
-                    reorder_cols,
-                    chunk_size,
-                )
-                # Output the file to output folder with same name.
-                createDirectory(output_dir)
-                output_path = os.path.join(output_dir, input_file)
-                df.to_csv(output_path, index=False)
-                loggingHandler(
-                    logger,
-                    f"Results for {input_file}, Time taken:{time.time()-task_tick}s -> {output_path}",
-                )
-                # Add to the completed files list
-                progress.saveToJSON(input_full_path, input_file, logger)
-
+                # Only the columns in the list get parsed
+                file_cols = readCSVColumns(input_full_path)
             except Exception as err:
-                traceback_info = format_exc()
-                # Log the exception message along with the traceback information
                 loggingHandler(
-                    logger, f"Exception occurred: {str(err)}\n{traceback_info}"
+                    logger, f"Exception occurred reading {input_file}: {str(err)}"
+                )
+                continue
+            # With none of the columns in the file one column is still read, usecols=[] would give no rows
+            read_cols = [col for col in reorder_cols if col in file_cols] or file_cols[:1]
+            tasks.append(
+                (
+                    input_full_path,
+                    input_file,
+                    (
+                        input_full_path,
+                        output_path,
+                        reorderColumns,
+                        reorder_cols,
+                        chunk_size,
+                        args.workers > 1,
+                        args.chunk_workers,
+                        read_cols,
+                        progress.checkpoint_dir,
+                    ),
                 )
+            )
         else:
             loggingHandler(
                 logger, f"Skipping file as already complete -> {input_full_path}"
             )
+
+    # Start the process on each input directory files
+    tick = time.time()
+    processFilesInPool(streamCSVInChunks, tasks, args.workers, progress, logger)
     loggingHandler(logger, f"Time taken to complete all files-> {time.time()-tick}s")
 
 
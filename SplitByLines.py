@@ -1,45 +1,302 @@
 import os
 import time
+import codecs
+import concurrent.futures
+import numpy as np
+from itertools import chain
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 from pypeepa import (
-    checkEncoding,
     loggingHandler,
     initLogging,
     createDirectory,
     getFilePath,
     askSelectOptionQuestion,
-    loggingHandler,
-    countTotalRows,
     progressBarIterator,
 )
 from traceback import format_exc
+from helpers import (
+    parseToolArgs,
+    countFileLines,
+    blockCodes,
+    makeRecordEndFinder,
+    readHeaderRecord,
+)
+
+BLOCK_SIZE = 16 * 1024 * 1024
+# Encodings where a newline is not a single 0x0A byte, checked in order as the utf-32 BOM starts with the utf-16 one
+WIDE_ENCODING_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32", 4),
+    (codecs.BOM_UTF32_BE, "utf-32", 4),
+    (codecs.BOM_UTF16_LE, "utf-16", 2),
+    (codecs.BOM_UTF16_BE, "utf-16", 2),
+]
+NEWLINE = 10
+
+
+def detectWideEncoding(file_path: str):
+    """
+    Check the BOM of a file for utf-16 or utf-32, any other encoding can be split as bytes.\n
+    @return: The encoding and the bytes per character, or None if the file can be split as bytes.
+    """
+    with open(file_path, "rb") as f:
+        start = f.read(4)
+    for bom, encoding, char_size in WIDE_ENCODING_BOMS:
+        if start.startswith(bom):
+            return encoding, char_size
+    return None
+
+
+def findLineEnds(block: Union[bytes, str]) -> np.ndarray:
+    """The offsets right after every newline of a block."""
+    return np.flatnonzero(blockCodes(block) == NEWLINE) + 1
+
+
+def makeRowCutter(max_rows: int) -> Callable[[np.ndarray, int], np.ndarray]:
+    """Make a function choosing the offsets to end the parts at so each has `max_rows` rows."""
+    # Rows still missing in the current part
+    remaining = max_rows
+
+    def findCuts(ends: np.ndarray, block_length: int) -> np.ndarray:
+        nonlocal remaining
+        cuts = ends[remaining - 1 :: max_rows]
+        remaining = (remaining - len(ends) - 1) % max_rows + 1
+        return cuts
+
+    return findCuts
+
+
+def makeSizeCutter(max_bytes: int) -> Callable[[np.ndarray, int], List[int]]:
+    """Make a function choosing the offsets to end the parts at, at the first row end after `max_bytes`."""
+    # Size of the current part before the block
+    part_size = 0
+
+    def findCuts(ends: np.ndarray, block_length: int) -> List[int]:
+        nonlocal part_size
+        cuts = []
+        part_start = -part_size
+        while True:
+            index = np.searchsorted(ends, part_start + max_bytes)
+            if index == len(ends):
+                break
+            part_start = int(ends[index])
+            cuts.append(part_start)
+        part_size = block_length - part_start
+        return cuts
+
+    return findCuts
+
+
+def splitBlocks(
+    blocks: Iterable[Union[bytes, str]],
+    openPart: Callable[[int], object],
+    findEnds: Callable[[Union[bytes, str]], np.ndarray],
+    findCuts: Callable[[np.ndarray, int], Iterable[int]],
+) -> int:
+    """
+    Write blocks of a file to parts, whole slices of the blocks are written at once.\n
+    @param:`blocks`: The blocks of the file in order, bytes or str.\n
+    @param:`openPart`: Function opening the part file with the number given.\n
+    @param:`findEnds`: Function returning the offsets in a block where a part is allowed to end.\n
+    @param:`findCuts`: Function choosing which of those offsets end a part.\n
+    @return: The number of parts written.
+    """
+    part_number = 0
+    part_file = None
+    try:
+        for block in blocks:
+            start = 0
+            for cut in findCuts(findEnds(block), len(block)):
+                if part_file is None:
+                    part_number += 1
+                    part_file = openPart(part_number)
+                part_file.write(block[start:cut])
+                part_file.close()
+                part_file = None
+                start = cut
+            if start < len(block):
+                if part_file is None:
+                    part_number += 1
+                    part_file = openPart(part_number)
+                part_file.write(block[start:])
+    finally:
+        if part_file is not None:
+            part_file.close()
+    return part_number
+
+
+def readBlocks(file, block_size: int):
+    while True:
+        block = file.read(block_size)
+        if not block:
+            return
+        yield block
 
 
-def splitByLines(input_file_path, output_dir, max_lines, file_encoding, total_lines):
-    with open(input_file_path, "r", encoding=file_encoding) as input_file:
-        file_number = 1
-        line_count = 0
-        output_file = None
-
-        for line in progressBarIterator(input_file, total_lines):
-            if line_count % max_lines == 0:
-                if output_file:
-                    output_file.close()
-                output_file = open(
-                    os.path.join(output_dir, f"{file_number}.txt"),
-                    "w",
-                    encoding=file_encoding,
+def openInput(input_file_path: str, output_dir: str, extension: str):
+    """
+    Open a file to be split, as bytes or as text for utf-16 and utf-32 files.\n
+    @return: The open file, the size of the blocks to read and a function opening the part with the number given.
+    """
+    wide_encoding = detectWideEncoding(input_file_path)
+    if wide_encoding is None:
+
+        def openPart(part_number):
+            return open(os.path.join(output_dir, f"{part_number}{extension}"), "wb")
+
+        return open(input_file_path, "rb"), BLOCK_SIZE, openPart
+
+    file_encoding, char_size = wide_encoding
+
+    def openPart(part_number):
+        return open(
+            os.path.join(output_dir, f"{part_number}{extension}"),
+            "w",
+            encoding=file_encoding,
+            newline="",
+        )
+
+    input_file = open(input_file_path, "r", encoding=file_encoding, newline="")
+    return input_file, BLOCK_SIZE // char_size, openPart
+
+
+def splitByLines(
+    input_file_path: str,
+    output_dir: str,
+    max_lines: int,
+    hide_progress_bar: Optional[bool] = False,
+) -> int:
+    """
+    Split a file to parts of `max_lines` lines named 1.txt, 2.txt...\n
+    The file is read in blocks of BLOCK_SIZE bytes and split on newline bytes without decoding, so any encoding
+    where a newline is the 0x0A byte works, the parts are byte for byte the same as the lines of the input.
+    Files starting with a utf-16 or utf-32 BOM are decoded and split as text instead.\n
+    @param:`input_file_path`: Path of the file to split.\n
+    @param:`output_dir`: Directory to write the parts to.\n
+    @param:`max_lines`: The max no. of lines in each part.\n
+    @param:`hide_progress_bar`: (Optional) Set to True if you dont want the progress bar.\n
+    @return: The number of parts written.
+    """
+    total_blocks = max(1, -(-os.path.getsize(input_file_path) // BLOCK_SIZE))
+    input_file, block_size, openPart = openInput(input_file_path, output_dir, ".txt")
+    with input_file:
+        blocks = readBlocks(input_file, block_size)
+        if not hide_progress_bar:
+            blocks = progressBarIterator(blocks, total_blocks, "Splitting file -> ")
+        return splitBlocks(blocks, openPart, findLineEnds, makeRowCutter(max_lines))
+
+
+def copyPart(
+    input_file_path: str, header: bytes, start: int, end: int, part_path: str
+) -> str:
+    """Write the header and the bytes from `start` to `end` of the input to a part."""
+    with open(input_file_path, "rb") as input_file, open(part_path, "wb") as part_file:
+        part_file.write(header)
+        input_file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = input_file.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            part_file.write(block)
+            remaining -= len(block)
+    return part_path
+
+
+def findPartOffsets(
+    input_file_path: str, data_start: int, max_bytes: int, hide_progress_bar: bool
+) -> List[Tuple[int, int]]:
+    """Find the byte ranges of the parts of a csv file, each ending at the first row end after `max_bytes`."""
+    file_size = os.path.getsize(input_file_path)
+    findRecordEnds = makeRecordEndFinder()
+    findCuts = makeSizeCutter(max_bytes)
+    ranges = []
+    part_start = block_start = data_start
+    with open(input_file_path, "rb") as input_file:
+        input_file.seek(data_start)
+        blocks = readBlocks(input_file, BLOCK_SIZE)
+        if not hide_progress_bar:
+            blocks = progressBarIterator(
+                blocks,
+                max(1, -(-(file_size - data_start) // BLOCK_SIZE)),
+                "Finding parts -> ",
+            )
+        for block in blocks:
+            for cut in findCuts(findRecordEnds(block), len(block)):
+                ranges.append((part_start, block_start + cut))
+                part_start = block_start + cut
+            block_start += len(block)
+    if part_start < file_size:
+        ranges.append((part_start, file_size))
+    return ranges
+
+
+def splitCSVFile(
+    input_file_path: str,
+    output_dir: str,
+    max_rows: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    workers: Optional[int] = 1,
+    hide_progress_bar: Optional[bool] = False,
+) -> int:
+    """
+    Split a csv file to parts named 1.csv, 2.csv... with the header of the file at the top of every part.\n
+    The parts only end at a new line outside quotes, so values with new lines inside quotes are never cut, this
+    is found from the number of quotes before each new line in one streaming pass over the file.\n
+    @param:`input_file_path`: Path of the csv file to split.\n
+    @param:`output_dir`: Directory to write the parts to.\n
+    @param:`max_rows`: The max no. of rows in each part, not counting the header.\n
+    @param:`max_bytes`: Used when `max_rows` is not given, the size each part is filled up to, the part ends at the
+    end of the row that goes over it. Counted in characters for utf-16 and utf-32 files.\n
+    @param:`workers`: (Optional) With `max_bytes`, the ranges of all the parts are found first and then written by
+    this many threads. Not used for utf-16 and utf-32 files.\n
+    @param:`hide_progress_bar`: (Optional) Set to True if you dont want the progress bar.\n
+    @return: The number of parts written.
+    """
+    extension = os.path.splitext(input_file_path)[1] or ".csv"
+    total_blocks = max(1, -(-os.path.getsize(input_file_path) // BLOCK_SIZE))
+    input_file, block_size, openPart = openInput(
+        input_file_path, output_dir, extension
+    )
+    with input_file:
+        header, rest = readHeaderRecord(input_file, block_size)
+
+        if max_rows is None and workers > 1 and isinstance(header, bytes):
+            ranges = findPartOffsets(
+                input_file_path, len(header), max_bytes, hide_progress_bar
+            )
+            part_paths = [
+                os.path.join(output_dir, f"{part_number}{extension}")
+                for part_number in range(1, len(ranges) + 1)
+            ]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                copied = executor.map(
+                    lambda part: copyPart(input_file_path, header, *part),
+                    [(start, end, path) for (start, end), path in zip(ranges, part_paths)],
                 )
-                file_number += 1
-            output_file.write(line)
-            line_count += 1
+                if not hide_progress_bar:
+                    copied = progressBarIterator(copied, len(ranges), "Writing parts -> ")
+                for _ in copied:
+                    pass
+            return len(ranges)
 
-        if output_file:
-            output_file.close()
+        def openPartWithHeader(part_number):
+            part_file = openPart(part_number)
+            part_file.write(header)
+            return part_file
+
+        blocks = chain([rest], readBlocks(input_file, block_size))
+        if not hide_progress_bar:
+            blocks = progressBarIterator(blocks, total_blocks, "Splitting file -> ")
+        findCuts = (
+            makeRowCutter(max_rows) if max_rows is not None else makeSizeCutter(max_bytes)
+        )
+        return splitBlocks(blocks, openPartWithHeader, makeRecordEndFinder(), findCuts)
 
 
 async def main():
     app_name = "SplitByLines"
     print("Split a file to multiple files based on a number of lines")
+    args = parseToolArgs()
     # Initialising logging
     logger = initLogging(app_name)
     # User inputs
@@ -50,16 +307,28 @@ async def main():
         "Enter the output location: ",
     )
     createDirectory(output_dir)
-    # Get the total lines and ask user to select max_lines
-    loggingHandler(None, "Counting lines please wait...")
-    count_line_tick = time.time()
-    total_lines = countTotalRows(input_file)
+    file_size = max(1, os.path.getsize(input_file))
     loggingHandler(
-        logger, f"Total lines found:{total_lines} -> {time.time()-count_line_tick}s"
+        logger,
+        f"Found about {countFileLines(input_file, estimate=True)} lines in {input_file}",
     )
-    max_lines = askSelectOptionQuestion(
-        "Select the max no. of lines in each part", 1, total_lines
+    split_mode = askSelectOptionQuestion(
+        "Split by:\n  1. Lines, for any text file\n  2. Rows of a csv file, with the header in every part\n  3. Size of a csv file in MB, with the header in every part\nEnter the option: ",
+        1,
+        3,
     )
+    max_lines = max_mb = None
+    if split_mode == 3:
+        max_mb = askSelectOptionQuestion(
+            "Select the max size in MB of each part",
+            1,
+            max(1, -(-file_size // (1024 * 1024))),
+        )
+    else:
+        # A line is at least one byte so the file size is the most lines there can be
+        max_lines = askSelectOptionQuestion(
+            "Select the max no. of lines in each part", 1, file_size
+        )
     # Main process
     task_tick = time.time()
     try:
@@ -71,17 +340,19 @@ async def main():
         if not os.path.isfile(input_file):
             raise Exception(f"'{input_file}' is not a regular file.")
 
-        # Detect the file's encoding
-        loggingHandler(None, "Checking encoding of the file, please wait...")
-        file_encoding = checkEncoding(input_file)
-
-        if not file_encoding:
-            raise Exception(f"Unable to detect the encoding for '{input_file}'.")
-        else:
-            loggingHandler(logger, f"Encoding of the file is:{file_encoding}")
-
         # Start the splitting process
-        splitByLines(input_file, output_dir, max_lines, file_encoding, total_lines)
+        if split_mode == 1:
+            parts = splitByLines(input_file, output_dir, max_lines)
+        elif split_mode == 2:
+            parts = splitCSVFile(input_file, output_dir, max_rows=max_lines)
+        else:
+            parts = splitCSVFile(
+                input_file,
+                output_dir,
+                max_bytes=max_mb * 1024 * 1024,
+                workers=args.workers,
+            )
+        loggingHandler(logger, f"Split {input_file} to {parts} parts")
     except Exception as err:
         traceback_info = format_exc()
         # Log the exception message along with the traceback information
@@ -1,71 +1,206 @@
 import os
 import time
-from typing import Any
+import numpy
+from typing import Any, Callable, Dict, List
 from traceback import format_exc
-from pandas import DataFrame, read_csv
+from pandas import DataFrame, Series, factorize, isnull
 from pypeepa import (
     initLogging,
-    createDirectory,
     getFilePath,
     listDir,
     loggingHandler,
     askYNQuestion,
-    processCSVInChunks,
     askSelectOptionQuestion,
-    askHeaderForMultipleCSV,
-    ProgressSaver,
+    progressBarIterator,
 )
+from helpers import (
+    PartitionWriter,
+    ColumnarPartitionWriter,
+    ChunkCheckpoint,
+    CheckpointSaver,
+    readCSVByteChunks,
+    chunkBytesForRows,
+    fileFormat,
+    outputFileName,
+    readColumnarSchema,
+    readFileChunks,
+    askColumnForFiles,
+    parseToolArgs,
+    readCSV,
+    profileColumnTypes,
+)
+
+
+def compileReferenceIndex(common_vals: Dict[str, List[Any]]) -> Series:
+    """
+    Turn the reference file columns into one lookup of every value to the categories(columns) it is found in.
+    Empty cells of the reference file are left out, they are only there because the columns have different lengths.
+    """
+    value_categories: Dict[Any, List[str]] = {}
+    for category, names_list in common_vals.items():
+        for name in names_list:
+            if isnull(name):
+                continue
+            categories = value_categories.setdefault(name, [])
+            if category not in categories:
+                categories.append(category)
+    return Series(value_categories, dtype=object)
 
 
 def splitOnReferenceColumns(chunk: DataFrame, process_config: Any):
-    for category, names_list in process_config["common_vals"].items():
-        # Filter the data based on the names
-        filtered_data = chunk[chunk[process_config["column_name"]].isin(names_list)]
-
-        # Output only if there is filtered data
-        if len(filtered_data.index) != 0:
-            category_dir = os.path.join(process_config["output_dir"], category)
-            createDirectory(category_dir)
-            output_file = os.path.join(category_dir, process_config["input_file"])
-            filtered_data.to_csv(
-                output_file,
-                mode="a",
-                header=not os.path.exists(output_file),
-                index=False,
-            )
-            loggingHandler(
-                logger=process_config["logger"],
-                log_mssg=f"Saved {len(filtered_data)} records to {output_file}",
-            )
+    # Route every row to its categories in one pass, rows in more than one category are repeated by explode
+    # Each different value is looked up once, the None added at the end is taken by the rows with a null value
+    codes, uniques = factorize(chunk[process_config["column_name"]])
+    value_categories = Series(numpy.asarray(uniques, dtype=object)).map(
+        process_config["reference_index"]
+    )
+    routed = Series(numpy.append(value_categories.values, None)[codes])
+    routed = routed.dropna().explode()
+
+    files_written = records_written = 0
+    for category, positions in routed.groupby(routed, sort=False).indices.items():
+        filtered_data = chunk.iloc[routed.index[positions]]
+        output_file = os.path.join(
+            process_config["output_dir"], category, process_config["input_file"]
+        )
+        process_config["writer"].write(output_file, filtered_data)
+        files_written += 1
+        records_written += len(filtered_data.index)
+    loggingHandler(
+        logger=process_config["logger"],
+        log_mssg=f"Saved {records_written} records to {files_written} files",
+    )
 
 
 def splitOnColumnValues(df: DataFrame, props: Any):
-    for ind_ethnic_code, group in df.groupby(props["column_to_split"]):
-        ind_output_dir = os.path.join(
+    files_written = records_written = 0
+    # Only the values in this chunk, a category column would also give empty groups for its other categories
+    for ind_ethnic_code, group in df.groupby(props["column_to_split"], observed=True):
+        output_file = os.path.join(
             props["output_dir"],
             str(ind_ethnic_code),
-        )
-        # Create output folder if it doesn't exist
-        createDirectory(ind_output_dir)
-        output_file = os.path.join(
-            ind_output_dir,
             props["input_file"],
         )
+        # Output the file to its destination, the writer creates the folder if it doesn't exist
+        props["writer"].write(output_file, group)
+        files_written += 1
+        records_written += len(group.index)
+    loggingHandler(
+        logger=props["logger"],
+        log_mssg=f"Saved {records_written} records to {files_written} files",
+    )
+
+
+def splitCSVWithCheckpoints(
+    input_full_path: str,
+    split_function: Callable[[DataFrame, Any], None],
+    process_config: Dict[str, Any],
+    chunk_size: int,
+    checkpoint_dir: str,
+):
+    """
+    Split one input file chunk by chunk, saving a checkpoint around every write to the category files.\n
+    The chunks are buffered until the writer needs a flush. Before the buffers are written the sizes of the files
+    they go to are saved with the offset of the first buffered chunk, after they are written the offset of the next
+    chunk is saved. When an unfinished file is continued the category files are cut
+    back to the saved sizes and the input is read again from the saved offset. The category files are only made
+    sure to be on the disk at every checkpoint when the writer was created with `sync`, eg:- with --sync.\n
+    .parquet and .arrow files are split by splitFileInChunks instead, as they can't be cut back to a checkpoint.\n
+    @param:`process_config`: The config of `split_function`, its `writer` must be a PartitionWriter created with
+    `flush_only` or a ColumnarPartitionWriter.
+    """
+    writer = process_config["writer"]
+    if (
+        isinstance(writer, ColumnarPartitionWriter)
+        or fileFormat(input_full_path) != "csv"
+    ):
+        return splitFileInChunks(
+            input_full_path, split_function, process_config, chunk_size
+        )
+    checkpoint = ChunkCheckpoint(
+        checkpoint_dir, input_full_path, process_config["output_dir"]
+    )
+    state = checkpoint.load() or {}
+    PartitionWriter.restoreFileSizes(state.get("output_sizes", {}))
 
-        # Output the file to its destination
-        group.to_csv(
-            output_file, mode="a", header=not os.path.exists(output_file), index=False
+    file_size = os.path.getsize(input_full_path)
+    chunk_bytes = chunkBytesForRows(input_full_path, chunk_size)
+    start_offset = state.get("input_offset")
+    chunk_reader = progressBarIterator(
+        readCSVByteChunks(
+            input_full_path,
+            chunk_bytes,
+            start_offset,
+            None,
+            profileColumnTypes(input_full_path),
+        ),
+        max(1, -(-(file_size - (start_offset or 0)) // chunk_bytes)),
+        "Processing file -> ",
+    )
+    # Offset of the first chunk with rows buffered but not written, None when nothing is buffered
+    buffered_start = None
+    for chunk, chunk_start, chunk_end in chunk_reader:
+        if buffered_start is None:
+            buffered_start = chunk_start
+        split_function(chunk, process_config)
+        if writer.needsFlush():
+            checkpoint.save(
+                {
+                    "input_offset": buffered_start,
+                    "output_sizes": writer.pendingFileSizes(),
+                }
+            )
+            writer.flush()
+            checkpoint.save({"input_offset": chunk_end})
+            buffered_start = None
+    if buffered_start is not None:
+        checkpoint.save(
+            {"input_offset": buffered_start, "output_sizes": writer.pendingFileSizes()}
         )
-        loggingHandler(
-            logger=props["logger"],
-            log_mssg=f"Saved {len(group)} records to {output_file}",
+    writer.close()
+    checkpoint.clear()
+
+
+def splitFileInChunks(
+    input_full_path: str,
+    split_function: Callable[[DataFrame, Any], None],
+    process_config: Dict[str, Any],
+    chunk_size: int,
+):
+    """
+    Split one input file chunk by chunk without checkpoints, .parquet and .arrow inputs are read by their record
+    batches.\n
+    @param:`process_config`: The config of `split_function`.
+    """
+    if fileFormat(input_full_path) != "csv":
+        total_chunks = -(-readColumnarSchema(input_full_path)[1] // chunk_size)
+    else:
+        total_chunks = -(
+            -os.path.getsize(input_full_path)
+            // chunkBytesForRows(input_full_path, chunk_size)
         )
+    chunk_reader = progressBarIterator(
+        readFileChunks(
+            input_full_path,
+            chunk_size,
+            low_memory=False,
+            encoding_errors="ignore",
+            on_bad_lines="skip",
+            dtype=profileColumnTypes(input_full_path),
+        ),
+        max(1, total_chunks),
+        "Processing file -> ",
+    )
+    for chunk in chunk_reader:
+        split_function(chunk, process_config)
+    process_config["writer"].close()
 
 
 # Main function
 # variables:
 async def main():
     app_name = "SplitCSV"
+    args = parseToolArgs()
     # Initialising logging
     logger = initLogging(app_name)
 
@@ -98,13 +233,13 @@ async def main():
     selected_split_type = split_types[split_type_index - 1]["name"]
     loggingHandler(logger, f"Type Selected: {selected_split_type}")
 
-    progress = ProgressSaver(app_name)
+    progress = CheckpointSaver(app_name)
     # If saved_data length more than 0 ask users if they want to continue previous process
     progress.askToContinue(logger)
 
     # Get the list of input directory files.
     input_files = listDir(input_dir, get="files")
-    input_files_and_headers = askHeaderForMultipleCSV(input_files, input_dir)
+    input_files_and_headers = askColumnForFiles(input_files, input_dir)
 
     # Final user inputs required for Reference File Columns split type
     if selected_split_type == "Reference File Columns":
@@ -113,12 +248,13 @@ async def main():
             endswith=tuple(".csv"),
             folder=False,
         )
-        common_vals = read_csv(
+        common_vals = readCSV(
             common_vals_path,
             low_memory=False,
             encoding_errors="ignore",
             on_bad_lines="skip",
         ).to_dict(orient="list")
+        reference_index = compileReferenceIndex(common_vals)
 
     # Start the process on each input files and headers
     tick = time.time()
@@ -129,37 +265,53 @@ async def main():
         input_full_path = input_file_and_header[0]
         input_col = input_file_and_header[1]
         input_file = os.path.basename(input_full_path)
+        # Name of the file written in every category folder
+        output_file = outputFileName(input_file, args.output_format)
 
         # Check saved_data for file
         if input_full_path not in progress.saved_data:
+            # Keeps the category files open and buffered while this input file is split, with checkpoints only
+            # splitCSVWithCheckpoints decides when the buffers are written
+            writer = (
+                ColumnarPartitionWriter()
+                if fileFormat(output_file) != "csv"
+                else PartitionWriter(
+                    flush_only=fileFormat(input_full_path) == "csv", sync=args.sync
+                )
+            )
             try:
                 # Switch based on the split type selected
                 match selected_split_type:
                     case "Column Values":
                         process_config = {
                             "output_dir": output_dir,
-                            "input_file": input_file,
+                            "input_file": output_file,
                             "column_to_split": input_col,
+                            "logger": logger,
+                            "writer": writer,
                         }
-                        processCSVInChunks(
-                            csv_file=input_full_path,
-                            process_function=splitOnColumnValues,
-                            pf_args=process_config,
-                            chunk_size=chunk_size,
+                        splitCSVWithCheckpoints(
+                            input_full_path,
+                            splitOnColumnValues,
+                            process_config,
+                            chunk_size,
+                            progress.checkpoint_dir,
                         )
                     case "Reference File Columns":
                         process_config = {
                             "output_dir": output_dir,
-                            "input_file": input_file,
-                            "common_vals": common_vals,
+                            "input_file": output_file,
+                            "reference_index": reference_index,
                             "column_name": input_col,
                             "logger": logger,
+                            "writer": writer,
                         }
-                        processCSVInChunks(
-                            csv_file=input_full_path,
-                            process_function=splitOnReferenceColumns,
-                            pf_args=process_config,
-                            chunk_size=chunk_size,
+                        splitCSVWithCheckpoints(
+                            input_full_path,
+                            splitOnReferenceColumns,
+                            process_config,
+                            chunk_size,
+                            progress.checkpoint_dir,
                         )
                 loggingHandler(
                     logger,
@@ -175,6 +327,9 @@ async def main():
                     logger,
                     f"Exception occurred: {str(err)}\nTraceback:\n{traceback_info}",
                 )
+            finally:
+                # Only the rows of a chunk that didnt complete can be left, they are split again when continued
+                writer.discard()
         else:
             loggingHandler(
                 logger, f"Skipping file as already complete -> {input_full_path}"
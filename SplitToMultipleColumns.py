@@ -1,10 +1,9 @@
 import os
-from traceback import format_exc
-
-from pandas import read_csv
+import numpy as np
+from typing import Callable, Optional, Tuple
+from pandas import DataFrame, Series, factorize
 from pypeepa import (
     getFilePath,
-    processCSVInChunks,
     initLogging,
     loggingHandler,
     listDir,
@@ -12,8 +11,16 @@ from pypeepa import (
     askYNQuestion,
     printArray,
     askSelectOptionQuestion,
-    # concurrentFutures, # For multiprocessing
-    ProgressSaver,
+)
+from helpers import (
+    streamCSVInChunks,
+    parseToolArgs,
+    processFilesInPool,
+    getAddressParserEngine,
+    ADDRESS_PARSERS,
+    CheckpointSaver,
+    readCSVColumns,
+    outputFileName,
 )
 import time
 
@@ -26,45 +33,46 @@ def splitName(s):
     return firstName, middleName, lastName
 
 
-def splitAddress(s):
-    parts = str(s).rsplit(" ", 1)  # Split only once from the right
-    city = ""
-    state = ""
-    country = ""
-    zip_code = ""
+def splitUniqueValues(
+    values: Series, split_function: Callable[[str], Tuple], column_count: int
+) -> DataFrame:
+    """
+    Split a whole column with `split_function`, called only once per unique value and the results are taken back
+    to every row with the codes from pandas.factorize.\n
+    @param:`values`: The column to split.\n
+    @param:`split_function`: Function splitting one value to a tuple of `column_count` values.\n
+    @param:`column_count`: Number of values returned by `split_function`.\n
+    @return: DataFrame with one column per value returned by `split_function`, on the same index as `values`.
+    """
+    # Same string values the split functions would see, also keeps None and NaN apart
+    codes, uniques = factorize(values.astype(str))
+    split_values = np.array(
+        list(map(split_function, uniques)), dtype=object
+    ).reshape(len(uniques), column_count)
+    return DataFrame(split_values[codes], index=values.index)
 
-    if len(parts) == 2:
-        address_parts = parts[0].rsplit(" ", 2)
-        if len(address_parts) >= 1:
-            city = address_parts[0]
-        if len(address_parts) >= 2:
-            # Check if the second-to-last part is a valid state code
-            if address_parts[-2].isalpha() and len(address_parts[-2]) <= 3:
-                state = address_parts[-2]
-                country = address_parts[-1]
-            else:
-                country = address_parts[-2]
-                state = address_parts[-1]
-        zip_code = parts[1]
 
-    return city, state, country, zip_code
+def splitNames(names: Series) -> DataFrame:
+    """Same as splitName for a whole column, returns the first, middle and last names."""
+    return splitUniqueValues(names, splitName, 3)
 
 
 # Define the splitColumn function
 def splitColumnValues(chunk, config):
-    # Apply the split_string function to the 'address' column
+    # Split the 'address' column
     if config["split_address_column"] != None:
-        chunk[config["address_columns"]] = (
-            chunk[config["split_address_column"]].apply(splitAddress).to_list()
-        )
+        address_engine = getAddressParserEngine(config["address_parser"])
+        chunk[config["address_columns"]] = address_engine.parseColumn(
+            chunk[config["split_address_column"]]
+        ).set_axis(config["address_columns"], axis=1)
         # Drop the original 'address' column
         chunk.drop(columns=[config["split_address_column"]], inplace=True)
 
-    # Apply the split_string function to the 'name' column
+    # Split the 'name' column
     if config["split_name_column"] != None:
-        chunk[config["name_columns"]] = (
-            chunk[config["split_name_column"]].apply(splitName).to_list()
-        )
+        chunk[config["name_columns"]] = splitNames(
+            chunk[config["split_name_column"]]
+        ).set_axis(config["name_columns"], axis=1)
         # Drop the original 'name' column
         chunk.drop(columns=[config["split_name_column"]], inplace=True)
 
@@ -75,6 +83,44 @@ def splitColumnValues(chunk, config):
     return chunk
 
 
+def splitColumnsInFile(
+    input_path: str,
+    output_path: str,
+    config,
+    chunk_size: int,
+    hide_progress_bar: bool,
+    chunk_workers: int,
+    checkpoint_dir: Optional[str] = None,
+):
+    """
+    Split the columns of one file.\n
+    @return: Dictionary containing the following keys.\n
+        @key:`rows`: The number of rows written.\n
+        @key:`address_parser`: The stats of the address parser for this file, None if no addresses were split in
+        this process, eg:- with chunk workers.
+    """
+    address_engine = None
+    if config["split_address_column"] != None:
+        address_engine = getAddressParserEngine(config["address_parser"])
+        # The cache is kept between files, only the stats start again
+        address_engine.resetStats()
+    rows = streamCSVInChunks(
+        input_path,
+        output_path,
+        splitColumnValues,
+        config,
+        chunk_size,
+        hide_progress_bar,
+        chunk_workers,
+        None,
+        checkpoint_dir,
+    )
+    address_stats = None
+    if address_engine is not None and address_engine.rows:
+        address_stats = address_engine.stats()
+    return {"rows": rows, "address_parser": address_stats}
+
+
 # Main function
 # variables:
 # D:\Downloads\MGM_Grand_Hotels1
@@ -83,6 +129,7 @@ async def main():
     print(
         "\nSplit names or addresses from one column to multiple columns. Before you run this make sure to have the input files in one folder.\n"
     )
+    args = parseToolArgs()
     # Initialising Logger
     logger = initLogging(app_name)
     # User inputs
@@ -97,7 +144,7 @@ async def main():
     chunk_size = 100000
 
     # Initialise progress saver
-    progress = ProgressSaver(app_name)
+    progress = CheckpointSaver(app_name)
 
     # If saved_data length more than 0 ask users if they want to continue previous process
     progress.askToContinue(logger)
@@ -107,125 +154,111 @@ async def main():
 
     split_names = askYNQuestion("Do you want to split names?(y/n)")
     split_address = askYNQuestion("Do you want to split address?(y/n)")
+    address_parser_config = None
+    if split_address:
+        parser_names = list(ADDRESS_PARSERS)
+        printArray(parser_names)
+        parser_index = askSelectOptionQuestion(
+            question="Enter the index of the address parser to use.",
+            min=1,
+            max=len(parser_names),
+        )
+        address_parser_config = {
+            "parser": parser_names[int(parser_index) - 1],
+            "cache_size": 100000,
+            "options": {},
+        }
+        if address_parser_config["parser"] == "lookup":
+            address_parser_config["options"]["lookup_file"] = getFilePath(
+                "Enter the .csv file with the state and country columns: ",
+                (".csv"),
+                False,
+            )
     file_columns_same = askYNQuestion(
         "Are all the column names the same for all the files in the input dir?(y/n)"
     )
-    # ##### Multiprocessing ##### Start the processing input directory files
-    # concurrentFutures(
-    #     process_function=taskProcessor,
-    #     divided_tasks=input_files,
-    #     additional_args=(
-    #         input_dir,
-    #         split_column_config,
-    #         chunk_size,
-    #         output_dir,
-    #         logger,
-    #         progress,
-    #     ),
-    #     max_workers=4,
-    #     logger=logger,
-    # )
-
-    #### No multiprocessing ##### Start the process on each input directory files
-    tick = time.time()
+    # Ask for the columns of every file that still needs processing before any work starts
+    tasks = []
     count = 0
     for input_file in input_files:
-        task_tick = time.time()
         input_full_path = os.path.join(input_dir, input_file)
         if input_full_path not in progress.saved_data:
-            try:
-                if not file_columns_same or count == 0:
-                    columns = read_csv(input_full_path, nrows=1).columns
-                    address_index = names_index = None
-                    printArray(columns)
-                    if split_names:
-                        names_index = askSelectOptionQuestion(
-                            question=f"Enter the index of the column containing the names.",
-                            min=1,
-                            max=len(columns),
-                        )
-                    if split_address:
-                        address_index = askSelectOptionQuestion(
-                            question=f"Enter the index of the column containing the addresses.",
-                            min=1,
-                            max=len(columns),
-                        )
-                split_column_config = {
-                    "address_columns": ["city", "state", "country", "postalCode"],
-                    "split_address_column": None
-                    if not split_address
-                    else columns[int(address_index) - 1],
-                    "name_columns": ["firstName", "middleName", "lastName"],
-                    "split_name_column": None
-                    if not split_names
-                    else columns[int(names_index) - 1],
-                }
-                df = processCSVInChunks(
+            if not file_columns_same or count == 0:
+                try:
+                    columns = readCSVColumns(input_full_path)
+                except Exception as err:
+                    loggingHandler(
+                        logger, f"Exception occurred reading {input_file}: {str(err)}"
+                    )
+                    continue
+                address_index = names_index = None
+                printArray(columns)
+                if split_names:
+                    names_index = askSelectOptionQuestion(
+                        question="Enter the index of the column containing the names.",
+                        min=1,
+                        max=len(columns),
+                    )
+                if split_address:
+                    address_index = askSelectOptionQuestion(
+                        question="Enter the index of the column containing the addresses.",
+                        min=1,
+                        max=len(columns),
+                    )
+            split_column_config = {
+                "address_columns": ["city", "state", "country", "postalCode"],
+                "split_address_column": None
+                if not split_address
+                else columns[int(address_index) - 1],
+                "address_parser": address_parser_config,
+                "name_columns": ["firstName", "middleName", "lastName"],
+                "split_name_column": None
+                if not split_names
+                else columns[int(names_index) - 1],
+            }
+            # Output the file to output folder with same name.
+            output_path = os.path.join(
+                output_dir, outputFileName(input_file, args.output_format)
+            )
+            tasks.append(
+                (
                     input_full_path,
-                    splitColumnValues,
-                    split_column_config,
-                    chunk_size,
-                )
-                # Output the file to output folder with same name.
-                output_path = os.path.join(output_dir, input_file)
-                df.to_csv(output_path, index=False)
-                loggingHandler(
-                    logger,
-                    f"Results for {input_file}, Time taken:{time.time()-task_tick}s -> {output_path}",
-                )
-                # Add to the completed files list
-                progress.saveToJSON(input_full_path, input_full_path, logger)
-                count += 1
-            except Exception as err:
-                traceback_info = format_exc()
-                # Log the exception message along with the traceback information
-                log_message = (
-                    f"Exception occurred: {str(err)}\nTraceback:\n{traceback_info}"
+                    input_full_path,
+                    (
+                        input_full_path,
+                        output_path,
+                        split_column_config,
+                        chunk_size,
+                        args.workers > 1,
+                        args.chunk_workers,
+                        progress.checkpoint_dir,
+                    ),
                 )
-                loggingHandler(logger, log_message)
+            )
+            count += 1
         else:
             loggingHandler(
                 logger, f"Skipping file as already complete -> {input_full_path}"
             )
+
+    # Start the process on each input directory files
+    tick = time.time()
+    results = processFilesInPool(
+        splitColumnsInFile, tasks, args.workers, progress, logger
+    )
+    for input_full_path, result in results.items():
+        address_stats = result["address_parser"]
+        if address_stats is not None:
+            loggingHandler(
+                logger,
+                f"{input_full_path}: {address_stats['rows']} addresses, {address_stats['misses']} parsed and {address_stats['hits']} found in the cache, hit rate {address_stats['hit_rate']:.1%}",
+            )
     loggingHandler(
         logger,
         f"Total time taken:{time.time()-tick}s",
     )
 
 
-# def taskProcessor(
-#     input_file: str,
-#     input_dir: str,
-#     split_column_config,
-#     chunk_size: int,
-#     output_dir: str,
-#     logger: Logger,
-#     progress: ProgressSaver,
-# ):
-#     input_full_path = os.path.join(input_dir, input_file)
-#     if input_full_path not in progress.saved_data:
-#         try:
-#             df = processCSVInChunks(
-#                 input_full_path,
-#                 splitColumn,
-#                 split_column_config,
-#                 chunk_size,
-#             )
-#             # Output the file to output folder with same name.
-#             output_path = os.path.join(output_dir, input_file)
-#             df.to_csv(output_path, index=False)
-#             loggingHandler(logger, f"Results for {input_file} -> {output_path}")
-#             # Add to the completed files list
-#             progress.saveToJSON(input_full_path, input_full_path, logger)
-
-#         except Exception as err:
-#             logger.exception("Exception Occurred:  " + str(err))
-#     else:
-#         loggingHandler(
-#             logger, f"Skipping file as already complete -> {input_full_path}"
-#         )
-
-
 if __name__ == "__main__":
     import asyncio
 
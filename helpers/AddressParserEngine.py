@@ -0,0 +1,198 @@
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+import numpy as np
+from pandas import DataFrame, Series, factorize
+from .readCSV import readCSV
+
+AddressParts = Tuple[str, str, str, str]
+
+
+def splitAddress(s) -> AddressParts:
+    """
+    The default heuristic, the last part is the zip code and the two before it are the state and the country, the
+    one that is at most 3 letters is taken as the state.\n
+    @return: Tuple of the city, state, country and zip code.
+    """
+    parts = str(s).rsplit(" ", 1)  # Split only once from the right
+    city = ""
+    state = ""
+    country = ""
+    zip_code = ""
+
+    if len(parts) == 2:
+        address_parts = parts[0].rsplit(" ", 2)
+        if len(address_parts) >= 1:
+            city = address_parts[0]
+        if len(address_parts) >= 2:
+            # Check if the second-to-last part is a valid state code
+            if address_parts[-2].isalpha() and len(address_parts[-2]) <= 3:
+                state = address_parts[-2]
+                country = address_parts[-1]
+            else:
+                country = address_parts[-2]
+                state = address_parts[-1]
+        zip_code = parts[1]
+
+    return city, state, country, zip_code
+
+
+# Tried in order, the first one matching the whole address is used
+ADDRESS_GRAMMAR = [
+    re.compile(
+        r"^(?P<city>.+?)\s+(?P<state>[A-Za-z]{2,3})\s+(?P<country>[A-Za-z]{2,3})\s+(?P<zip>[A-Za-z0-9-]*\d[A-Za-z0-9-]*)$"
+    ),
+    re.compile(
+        r"^(?P<city>.+?)\s+(?P<state>[A-Za-z]{2,3})\s+(?P<zip>[A-Za-z0-9-]*\d[A-Za-z0-9-]*)$"
+    ),
+    re.compile(r"^(?P<city>.+?)\s+(?P<state>[A-Za-z]{2,3})\s+(?P<country>[A-Za-z]{2,3})$"),
+    re.compile(r"^(?P<city>.+?)\s+(?P<zip>[A-Za-z0-9-]*\d[A-Za-z0-9-]*)$"),
+]
+
+
+def makeRegexParser(**_) -> Callable[[Any], AddressParts]:
+    """Parser matching the address against ADDRESS_GRAMMAR, an address matching none of it is kept as the city."""
+
+    def parseAddress(s) -> AddressParts:
+        address = str(s).strip()
+        for pattern in ADDRESS_GRAMMAR:
+            match = pattern.match(address)
+            if match:
+                parts = match.groupdict()
+                return (
+                    parts["city"],
+                    parts.get("state") or "",
+                    parts.get("country") or "",
+                    parts.get("zip") or "",
+                )
+        return address, "", "", ""
+
+    return parseAddress
+
+
+def makeLookupParser(lookup_file: str, **_) -> Callable[[Any], AddressParts]:
+    """
+    Parser using a table of known state codes, read once from `lookup_file`.\n
+    @param:`lookup_file`: Csv file with the columns `state` and `country`, and optionally `postalCode` to find the
+    state and country of addresses that only have a zip code.
+    """
+    table = readCSV(lookup_file, dtype=str, keep_default_na=False)
+    states = dict(zip(table["state"].str.upper(), table["country"]))
+    countries = set(table["country"].str.upper())
+    postal_codes = {}
+    if "postalCode" in table.columns:
+        postal_codes = dict(
+            zip(table["postalCode"], zip(table["state"], table["country"]))
+        )
+
+    def parseAddress(s) -> AddressParts:
+        tokens = str(s).split()
+        zip_code = state = country = ""
+        if tokens and any(char.isdigit() for char in tokens[-1]):
+            zip_code = tokens.pop()
+        if (
+            len(tokens) > 1
+            and tokens[-1].upper() in countries
+            and tokens[-2].upper() in states
+        ):
+            country = tokens.pop()
+            state = tokens.pop()
+        elif tokens and tokens[-1].upper() in states:
+            state = tokens.pop()
+            country = states[state.upper()]
+        elif tokens and tokens[-1].upper() in countries:
+            country = tokens.pop()
+        if not state and zip_code in postal_codes:
+            state, country = postal_codes[zip_code]
+        return " ".join(tokens), state, country, zip_code
+
+    return parseAddress
+
+
+# Name of each parser and the function that builds it from the options of the engine
+ADDRESS_PARSERS: Dict[str, Callable[..., Callable[[Any], AddressParts]]] = {
+    "heuristic": lambda **_: splitAddress,
+    "regex": makeRegexParser,
+    "lookup": makeLookupParser,
+}
+
+
+def registerAddressParser(
+    name: str, parser_factory: Callable[..., Callable[[Any], AddressParts]]
+):
+    """Add a parser that can be selected by `name`, `parser_factory` gets the options of the engine as keywords."""
+    ADDRESS_PARSERS[name] = parser_factory
+
+
+class AddressParserEngine:
+    """
+    Splits addresses to the city, state, country and zip code with one of the parsers in ADDRESS_PARSERS, the
+    results are kept in a least recently used cache keyed on the raw address so repeated addresses are parsed once.\n
+    Each process gets its own engine and cache from getAddressParserEngine, the cache is not shared between workers.\n
+    @init\n
+        @param: `config`: Dictionary containing the following keys.\n
+            @key: `parser`: Name of the parser in ADDRESS_PARSERS.\n
+            @key: `cache_size`: (Optional) Most addresses kept in the cache, defaults to 100000.\n
+            @key: `options`: (Optional) Keyword arguments for the parser, eg:- {'lookup_file': 'states.csv'}.\n
+    @func: `parse`: Split one address.\n
+    @func: `parseColumn`: Split a whole column, each unique address of the column is looked up once.\n
+    @func: `stats`: Rows split, rows found in the cache (hits) and rows parsed (misses) and the hit rate since the
+    last `resetStats`.\n
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        if config["parser"] not in ADDRESS_PARSERS:
+            raise ValueError(
+                f"Unknown address parser {config['parser']}, expected one of {list(ADDRESS_PARSERS)}"
+            )
+        self.parser = ADDRESS_PARSERS[config["parser"]](**config.get("options", {}))
+        self.cache_size = config.get("cache_size", 100000)
+        self.cache: "OrderedDict[str, AddressParts]" = OrderedDict()
+        self.resetStats()
+
+    def resetStats(self):
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "rows": self.rows,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def parse(self, address: str) -> AddressParts:
+        if address in self.cache:
+            self.cache.move_to_end(address)
+            self.hits += 1
+            return self.cache[address]
+        self.misses += 1
+        parts = self.parser(address)
+        self.cache[address] = parts
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return parts
+
+    def parseColumn(self, addresses: Series) -> DataFrame:
+        codes, uniques = factorize(addresses.astype(str))
+        self.rows += len(codes)
+        split_values = np.array(
+            list(map(self.parse, uniques)), dtype=object
+        ).reshape(len(uniques), 4)
+        # parse counted each unique address once, the other rows with the same address are found without parsing
+        self.hits += len(codes) - len(uniques)
+        return DataFrame(split_values[codes], index=addresses.index)
+
+
+address_engines: Dict[str, AddressParserEngine] = {}
+
+
+def getAddressParserEngine(config: Dict[str, Any]) -> AddressParserEngine:
+    """Return the engine for a config, building it only the first time in each process."""
+    key = repr(sorted(config.items()))
+    if key not in address_engines:
+        address_engines[key] = AddressParserEngine(config)
+    return address_engines[key]
@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+from logging import Logger
+from typing import Any, Dict, Optional
+from pypeepa import ProgressSaver, askYNQuestion
+from .fileSignature import fileSignature
+
+
+class ChunkCheckpoint:
+    """
+    Saves how far a tool got in one input file after every chunk, so an unfinished file can be continued instead of
+    started again. The checkpoint is a small json file in `checkpoint_dir` named after the input file, its size and
+    modification time and any `extra` values, so a checkpoint is never used for a file that changed.\n
+    @init\n
+        @param: `checkpoint_dir`: Directory to keep the checkpoints in.\n
+        @param: `input_file`: Path of the input file.\n
+        @param: `extra`: (Optional) Any additional values that should be part of the key eg:- the output path.\n
+    @func: `load`: The last saved state, or None if there is no checkpoint.\n
+    @func: `save`: Replace the saved state, the file is replaced at once so a crash never leaves half a checkpoint.\n
+        @param: `state`: Dictionary of json values.\n
+    @func: `clear`: Delete the checkpoint, call it once the file is complete.\n
+    """
+
+    def __init__(self, checkpoint_dir: str, input_file: str, *extra) -> None:
+        self.path = os.path.join(
+            checkpoint_dir, f"{fileSignature(input_file, *extra)}.json"
+        )
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, state: Dict[str, Any]):
+        temp_path = f"{self.path}.part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CheckpointSaver(ProgressSaver):
+    """
+    pypeepa's ProgressSaver with a directory for the chunk checkpoints of the files not completed yet, at
+    `saves/{app_name}.checkpoints`. The checkpoints are deleted too when the saved progress is reset, and the user
+    is asked to continue when there are checkpoints even if no file was completed.\n
+    @init\n
+        @param: `app_name`: Name of the file where the progress states will be saved in.\n
+    """
+
+    def __init__(self, app_name) -> None:
+        super().__init__(app_name)
+        self.checkpoint_dir = os.path.join(
+            self.save_directory, f"{app_name}.checkpoints"
+        )
+
+    def resetSavedData(self, logger: Optional[Logger] = None):
+        super().resetSavedData(logger)
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    def askToContinue(self, logger: Optional[Logger] = None):
+        has_checkpoints = os.path.isdir(self.checkpoint_dir) and any(
+            os.scandir(self.checkpoint_dir)
+        )
+        if len(self.saved_data) > 0 or has_checkpoints:
+            continue_from_before = askYNQuestion("Continue from before?(y/n)")
+            if not continue_from_before:
+                self.resetSavedData(logger)
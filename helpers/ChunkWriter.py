@@ -0,0 +1,86 @@
+import os
+from typing import Dict, List, Optional, Tuple
+from pandas import DataFrame
+
+
+class ChunkWriter:
+    """
+    Appends processed chunks to an output file as soon as they are ready, so the whole output never has to be in memory.\n
+    The chunks are written to `output_path`.part and only renamed to `output_path` when `commit` is called, so an
+    unfinished output is never mistaken for a complete one.\n
+    @init\n
+        @param: `output_path`: Path of the final output file.\n
+        @param: `resume`: (Optional) A state returned by `sync`, `output_path`.part is cut back to that size and the
+        chunks are appended after it.\n
+        @param: `keep_partial`: (Optional) Keep `output_path`.part when an exception happens, to resume it later.\n
+    @func: `write`: Append a chunk to the output, the header is written only with the first chunk.\n
+        @param: `chunk`: The DataFrame to append, None is ignored.\n
+    @func: `writeCSVText`: Append a chunk that was already serialized without its header.\n
+        @param: `result`: Tuple of the columns, the row count and the csv text, None is ignored.\n
+    @func: `sync`: Write everything to the disk and return the state to resume from.\n
+    @func: `commit`: Close the file and move it to `output_path`.\n
+    @func: `abort`: Close the file and delete the unfinished output, unless `keep_partial` is set.\n
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        resume: Optional[Dict[str, int]] = None,
+        keep_partial: Optional[bool] = False,
+    ) -> None:
+        self.output_path = output_path
+        self.temp_path = f"{output_path}.part"
+        self.keep_partial = keep_partial
+        if resume is not None:
+            # Anything after the state was written by a chunk that didnt complete
+            os.truncate(self.temp_path, resume["output_size"])
+            self.rows_written = resume["rows_written"]
+            self.header_written = resume["output_size"] > 0
+            self.file = open(self.temp_path, "a", encoding="utf-8", newline="")
+        else:
+            self.rows_written = 0
+            self.header_written = False
+            self.file = open(self.temp_path, "w", encoding="utf-8", newline="")
+
+    def write(self, chunk: Optional[DataFrame]):
+        if chunk is None:
+            return
+        chunk.to_csv(self.file, index=False, header=not self.header_written)
+        self.header_written = True
+        self.rows_written += len(chunk.index)
+
+    def writeCSVText(self, result: Optional[Tuple[List[str], int, str]]):
+        if result is None:
+            return
+        columns, row_count, csv_text = result
+        if not self.header_written:
+            DataFrame(columns=columns).to_csv(self.file, index=False)
+            self.header_written = True
+        self.file.write(csv_text)
+        self.rows_written += row_count
+
+    def sync(self) -> Dict[str, int]:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {
+            "output_size": os.fstat(self.file.fileno()).st_size,
+            "rows_written": self.rows_written,
+        }
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_path, self.output_path)
+
+    def abort(self):
+        self.file.close()
+        if not self.keep_partial and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
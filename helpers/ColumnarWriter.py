@@ -0,0 +1,310 @@
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from pandas import DataFrame, CategoricalDtype, concat
+from pypeepa import createDirectory
+from .ChunkWriter import ChunkWriter
+from .importPyArrow import importPyArrow
+from .PartitionWriter import defaultOpenFileLimit
+from .readColumnarBatches import fileFormat, iterArrowBatches
+
+
+def textArrowColumn(pa, values):
+    """Store a column as strings the same way to_csv would write them."""
+    return pa.array(
+        values.where(values.isna(), values.astype(str)),
+        type=pa.string(),
+        from_pandas=True,
+    )
+
+
+def inferArrowColumn(pa, values):
+    """
+    Convert one column to an Arrow array of the type of its values, columns with only empty values get the null
+    type so a later chunk can give them their type. Python objects other than numbers, booleans, text and dates
+    are stored as text.
+    """
+    if values.isna().all():
+        return pa.nulls(len(values.index))
+    try:
+        array = pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return textArrowColumn(pa, values)
+    if not (
+        pa.types.is_integer(array.type)
+        or pa.types.is_floating(array.type)
+        or pa.types.is_boolean(array.type)
+        or pa.types.is_string(array.type)
+        or pa.types.is_temporal(array.type)
+    ):
+        return textArrowColumn(pa, values)
+    return array
+
+
+def toArrowColumn(pa, values, field_type=None):
+    """
+    Convert one column to an Arrow array of `field_type` when its values fit in it, else of the type inferred from
+    them, so a chunk whose values changed type gets a type the file can be promoted to with promoteArrowType.
+    """
+    if isinstance(values.dtype, CategoricalDtype):
+        values = values.astype(object)
+    if field_type is None or pa.types.is_null(field_type):
+        return inferArrowColumn(pa, values)
+    try:
+        return pa.array(values, type=field_type, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        if pa.types.is_string(field_type):
+            return textArrowColumn(pa, values)
+    return inferArrowColumn(pa, values)
+
+
+def promoteArrowType(pa, current_type, new_type):
+    """
+    The type a column has to be written as to hold the values of both types, null gives way to any type, ints and
+    floats become floats and everything else becomes text.
+    """
+    if current_type == new_type or pa.types.is_null(new_type):
+        return current_type
+    if pa.types.is_null(current_type):
+        return new_type
+    numbers = (pa.types.is_integer, pa.types.is_floating)
+    if any(check(current_type) for check in numbers) and any(
+        check(new_type) for check in numbers
+    ):
+        return pa.float64()
+    return pa.string()
+
+
+def toArrowTable(pa, chunk: DataFrame, schema=None):
+    """
+    Convert a chunk to an Arrow table with the types of `schema` where its values fit them, or with the schema
+    inferred from it when not given.
+    """
+    arrays = [
+        toArrowColumn(
+            pa,
+            chunk.iloc[:, position],
+            None if schema is None else schema.field(position).type,
+        )
+        for position in range(len(chunk.columns))
+    ]
+    return pa.Table.from_arrays(arrays, names=[str(c) for c in chunk.columns])
+
+
+class ColumnarWriter:
+    """
+    Same as ChunkWriter for Parquet and Arrow IPC outputs, the format is chosen by the extension of `output_path`.\n
+    The schema is taken from the first chunk, every chunk is written as its own row group or record batch. When a
+    later chunk has values that dont fit a column, eg:- 1.5 in a column of ints or text in a column of numbers, the
+    column is promoted to float or text and what was already written is copied to a file with the new schema.
+    The file is written to `output_path`.part and only renamed to `output_path` when `commit` is called.\n
+    @init\n
+        @param: `output_path`: Path of the final output file, ending with .parquet or .arrow.\n
+    @func: `write`: Append a chunk to the output.\n
+        @param: `chunk`: The DataFrame to append, None is ignored.\n
+    @func: `writeTable`: Append an Arrow table with the same columns to the output.\n
+    @func: `commit`: Close the file and move it to `output_path`.\n
+    @func: `abort`: Close the file and delete the unfinished output.\n
+    """
+
+    def __init__(self, output_path: str) -> None:
+        self.pa = importPyArrow()
+        self.output_path = output_path
+        self.temp_path = f"{output_path}.part"
+        self.format = fileFormat(output_path)
+        self.writer = None
+        self.schema = None
+        self.rows_written = 0
+
+    def openWriter(self, schema):
+        self.schema = schema
+        if self.format == "parquet":
+            self.writer = self.pa.parquet.ParquetWriter(self.temp_path, schema)
+        else:
+            self.writer = self.pa.ipc.new_file(self.temp_path, schema)
+
+    def promoteSchema(self, schema):
+        """Copy what was written so far to a new .part file with `schema`, a row group or batch at a time."""
+        self.writer.close()
+        old_path = f"{self.temp_path}.old"
+        os.replace(self.temp_path, old_path)
+        self.openWriter(schema)
+        for table in iterColumnarTables(self.pa, old_path, self.format):
+            self.writer.write_table(table.cast(schema))
+        os.remove(old_path)
+
+    def writeTable(self, table):
+        if self.writer is None:
+            self.openWriter(table.schema)
+        elif not table.schema.equals(self.schema):
+            schema = self.pa.schema(
+                [
+                    field.with_type(
+                        promoteArrowType(self.pa, field.type, table.schema.field(position).type)
+                    )
+                    for position, field in enumerate(self.schema)
+                ]
+            )
+            if not schema.equals(self.schema):
+                self.promoteSchema(schema)
+            table = table.cast(schema)
+        self.writer.write_table(table)
+        self.rows_written += table.num_rows
+
+    def write(self, chunk: Optional[DataFrame]):
+        if chunk is None:
+            return
+        self.writeTable(toArrowTable(self.pa, chunk, self.schema))
+
+    def commit(self):
+        if self.writer is None:
+            # Nothing was written, still leave a valid empty file
+            self.openWriter(self.pa.schema([]))
+        self.writer.close()
+        os.replace(self.temp_path, self.output_path)
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def iterColumnarTables(pa, file_path: str, file_format: str):
+    """The row groups of a Parquet file or the record batches of an Arrow IPC file, each as an Arrow table."""
+    if file_format == "parquet":
+        parquet_file = pa.parquet.ParquetFile(file_path)
+        for row_group in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(row_group)
+    else:
+        for batch in iterArrowBatches(pa, file_path):
+            yield pa.Table.from_batches([batch])
+
+
+def openChunkWriter(output_path: str):
+    """ColumnarWriter for .parquet and .arrow outputs, ChunkWriter for everything else."""
+    if fileFormat(output_path) != "csv":
+        return ColumnarWriter(output_path)
+    return ChunkWriter(output_path)
+
+
+class ColumnarPartitionWriter:
+    """
+    Same as PartitionWriter for Parquet and Arrow IPC files, eg:- one per category when splitting a file.\n
+    The chunks are buffered in memory per file and written as one row group or batch when `flush_rows` is reached.
+    These files can't be appended to once closed, so at most `max_open_files` ColumnarWriters are kept open and
+    the least recently used one is closed as a segment of its file, the next rows of that file start a new segment.
+    The segments of each file are copied into the file in order by `close`.\n
+    @init\n
+        @param: `max_open_files`: (Optional) Most files kept open at once, defaults to half of the open files limit.\n
+        @param: `flush_rows`: (Optional) Rows buffered for a file before they get written.\n
+        @param: `max_buffered_rows`: (Optional) Rows in all the buffers before all of them are written.\n
+    @func: `write`: Append a DataFrame to a file.\n
+        @param: `output_file`: Path of the .parquet or .arrow file.\n
+        @param: `chunk`: The DataFrame to append.\n
+    @func: `flush`: Nothing to do, the buffers are written when they are large enough and by `close`.\n
+    @func: `close`: Write all the buffers and close all the files.\n
+    @func: `discard`: Drop the buffers and delete all the unfinished files.\n
+    """
+
+    def __init__(
+        self,
+        max_open_files: Optional[int] = None,
+        flush_rows: Optional[int] = 100000,
+        max_buffered_rows: Optional[int] = 1000000,
+    ) -> None:
+        self.max_open_files = max_open_files or defaultOpenFileLimit()
+        self.flush_rows = flush_rows
+        self.max_buffered_rows = max_buffered_rows
+        self.writers: "OrderedDict[str, ColumnarWriter]" = OrderedDict()
+        # Paths of the closed segments of each file, in the order they were written
+        self.segments: Dict[str, List[str]] = {}
+        self.buffers: Dict[str, List[DataFrame]] = {}
+        self.buffered_rows: Dict[str, int] = {}
+        self.total_buffered = 0
+
+    def write(self, output_file: str, chunk: DataFrame):
+        self.buffers.setdefault(output_file, []).append(chunk)
+        self.buffered_rows[output_file] = (
+            self.buffered_rows.get(output_file, 0) + len(chunk.index)
+        )
+        self.total_buffered += len(chunk.index)
+        if self.buffered_rows[output_file] >= self.flush_rows:
+            self.flushFile(output_file)
+        if self.total_buffered >= self.max_buffered_rows:
+            self.flushAll()
+
+    def segmentPath(self, output_file: str) -> str:
+        name, extension = os.path.splitext(output_file)
+        return f"{name}.segment{len(self.segments.get(output_file, []))}{extension}"
+
+    def getWriter(self, output_file: str) -> ColumnarWriter:
+        if output_file in self.writers:
+            self.writers.move_to_end(output_file)
+            return self.writers[output_file]
+        if len(self.writers) >= self.max_open_files:
+            oldest_file, oldest_writer = self.writers.popitem(last=False)
+            oldest_writer.commit()
+            self.segments.setdefault(oldest_file, []).append(oldest_writer.output_path)
+        createDirectory(os.path.dirname(output_file))
+        writer = ColumnarWriter(self.segmentPath(output_file))
+        self.writers[output_file] = writer
+        return writer
+
+    def flushFile(self, output_file: str):
+        frames = self.buffers.pop(output_file, None)
+        self.total_buffered -= self.buffered_rows.pop(output_file, 0)
+        if not frames:
+            return
+        self.getWriter(output_file).write(
+            frames[0] if len(frames) == 1 else concat(frames, ignore_index=True)
+        )
+
+    def flushAll(self):
+        for output_file in list(self.buffers):
+            self.flushFile(output_file)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flushAll()
+        for output_file, writer in self.writers.items():
+            writer.commit()
+            self.segments.setdefault(output_file, []).append(writer.output_path)
+        self.writers.clear()
+        for output_file, segment_paths in self.segments.items():
+            if len(segment_paths) == 1:
+                os.replace(segment_paths[0], output_file)
+                continue
+            with ColumnarWriter(output_file) as writer:
+                for segment_path in segment_paths:
+                    for table in iterColumnarTables(
+                        writer.pa, segment_path, writer.format
+                    ):
+                        writer.writeTable(table)
+            for segment_path in segment_paths:
+                os.remove(segment_path)
+        self.segments.clear()
+
+    def discard(self):
+        self.buffers.clear()
+        self.buffered_rows.clear()
+        self.total_buffered = 0
+        for writer in self.writers.values():
+            writer.abort()
+        self.writers.clear()
+        for segment_paths in self.segments.values():
+            for segment_path in segment_paths:
+                if os.path.exists(segment_path):
+                    os.remove(segment_path)
+        self.segments.clear()
@@ -0,0 +1,159 @@
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from pandas import DataFrame
+from pypeepa import createDirectory
+
+
+def defaultOpenFileLimit() -> int:
+    """Half of the soft limit of open files for this process, or 256 where the limit can't be read."""
+    try:
+        import resource
+
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        return max(16, min(soft_limit // 2, 1024))
+    except (ImportError, ValueError, OSError):
+        return 256
+
+
+class PartitionWriter:
+    """
+    Appends DataFrames to many csv files, eg:- one per category when splitting a file.\n
+    Small writes are buffered in memory per file and only written when `flush_bytes` is reached, the files are kept
+    open in a pool of at most `max_open_files` handles where the least recently used one is closed first, and the
+    directories and headers already created are remembered so they are checked only once per file.\n
+    @init\n
+        @param: `max_open_files`: (Optional) Most files kept open at once, defaults to half of the open files limit.\n
+        @param: `flush_bytes`: (Optional) Size in bytes of the buffer of a file before it gets written.\n
+        @param: `max_buffered_bytes`: (Optional) Size in bytes of all the buffers before all of them are written.\n
+        @param: `flush_only`: (Optional) Only write the buffers when `flush` is called, so with checkpoints the files
+        only change between two checkpoints. The caller flushes when `needsFlush` says the buffers are full.\n
+        @param: `sync`: (Optional) Make sure every file is written to the disk when it is flushed and before its handle
+        is closed, so the files survive a power cut and not only a crash of the process. One fsync per file, slow with
+        thousands of files.\n
+    @func: `write`: Append a DataFrame to a csv file, the header is written only if the file didnt exist before.\n
+        @param: `output_file`: Path of the csv file.\n
+        @param: `chunk`: The DataFrame to append.\n
+    @func: `needsFlush`: True when all the buffers together reached `max_buffered_bytes`.\n
+    @func: `pendingFileSizes`: The sizes of the files that have buffers to write, -1 for files that dont exist yet.\n
+    @func: `restoreFileSizes`: Cut files back to the sizes from `pendingFileSizes`, deleting the ones that didnt
+    exist, to undo a flush that didnt complete.\n
+    @func: `flush`: Write all the buffers to their files.\n
+    @func: `close`: Write all the buffers and close all the files.\n
+    @func: `discard`: Drop the buffers not written yet and close all the files.\n
+    """
+
+    def __init__(
+        self,
+        max_open_files: Optional[int] = None,
+        flush_bytes: Optional[int] = 1024 * 1024,
+        max_buffered_bytes: Optional[int] = 64 * 1024 * 1024,
+        flush_only: Optional[bool] = False,
+        sync: Optional[bool] = False,
+    ) -> None:
+        self.flush_only = flush_only
+        self.sync = sync
+        self.max_open_files = max_open_files or defaultOpenFileLimit()
+        self.flush_bytes = flush_bytes
+        self.max_buffered_bytes = max_buffered_bytes
+        self.handles: "OrderedDict[str, object]" = OrderedDict()
+        self.buffers: Dict[str, List[str]] = {}
+        self.buffered_sizes: Dict[str, int] = {}
+        self.total_buffered = 0
+        self.known_dirs = set()
+        self.known_files = set()
+        self.headers: Dict[tuple, str] = {}
+
+    def getHeader(self, chunk: DataFrame) -> str:
+        columns = tuple(chunk.columns)
+        if columns not in self.headers:
+            self.headers[columns] = DataFrame(columns=chunk.columns).to_csv(index=False)
+        return self.headers[columns]
+
+    def write(self, output_file: str, chunk: DataFrame):
+        csv_text = chunk.to_csv(index=False, header=False)
+        if output_file not in self.known_files:
+            output_dir = os.path.dirname(output_file)
+            if output_dir not in self.known_dirs:
+                createDirectory(output_dir)
+                self.known_dirs.add(output_dir)
+            if not os.path.exists(output_file):
+                csv_text = self.getHeader(chunk) + csv_text
+            self.known_files.add(output_file)
+
+        self.buffers.setdefault(output_file, []).append(csv_text)
+        self.buffered_sizes[output_file] = (
+            self.buffered_sizes.get(output_file, 0) + len(csv_text)
+        )
+        self.total_buffered += len(csv_text)
+        if self.flush_only:
+            return
+        if self.buffered_sizes[output_file] >= self.flush_bytes:
+            self.flushFile(output_file)
+        if self.needsFlush():
+            self.flush()
+
+    def needsFlush(self) -> bool:
+        return self.total_buffered >= self.max_buffered_bytes
+
+    def getHandle(self, output_file: str):
+        if output_file in self.handles:
+            self.handles.move_to_end(output_file)
+            return self.handles[output_file]
+        if len(self.handles) >= self.max_open_files:
+            _, oldest_handle = self.handles.popitem(last=False)
+            if self.sync:
+                oldest_handle.flush()
+                os.fsync(oldest_handle.fileno())
+            oldest_handle.close()
+        handle = open(output_file, "a", encoding="utf-8", newline="")
+        self.handles[output_file] = handle
+        return handle
+
+    def pendingFileSizes(self) -> Dict[str, int]:
+        return {
+            output_file: os.path.getsize(output_file)
+            if os.path.exists(output_file)
+            else -1
+            for output_file in self.buffers
+        }
+
+    @staticmethod
+    def restoreFileSizes(file_sizes: Dict[str, int]):
+        for output_file, size in file_sizes.items():
+            if size < 0:
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+            elif os.path.exists(output_file) and os.path.getsize(output_file) > size:
+                os.truncate(output_file, size)
+
+    def flushFile(self, output_file: str):
+        buffer = self.buffers.pop(output_file, None)
+        if not buffer:
+            return
+        handle = self.getHandle(output_file)
+        handle.write("".join(buffer))
+        self.total_buffered -= self.buffered_sizes.pop(output_file)
+        if self.sync:
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def flush(self):
+        for output_file in list(self.buffers):
+            self.flushFile(output_file)
+        for handle in self.handles.values():
+            handle.flush()
+
+    def close(self):
+        self.flush()
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+    def discard(self):
+        self.buffers.clear()
+        self.buffered_sizes.clear()
+        self.total_buffered = 0
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
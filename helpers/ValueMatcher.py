@@ -0,0 +1,320 @@
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Set
+import numpy as np
+from pandas import Index, Series, factorize
+from pandas.api.types import infer_dtype
+
+
+def stripAccents(s: str) -> str:
+    """Casefold and remove the accents, eg:- 'José' and 'JOSE' both become 'jose'."""
+    decomposed = unicodedata.normalize("NFKD", s.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+# Name of each match mode and the function normalizing the reference values and the cells before they are compared
+MATCH_MODES: Dict[str, Callable[[str], str]] = {
+    "exact": lambda s: s,
+    "lower": str.lower,
+    "casefold": str.casefold,
+    "accents": stripAccents,
+}
+# The modes that pandas string methods can normalize a whole column with, and the name of the method
+VECTORIZED_MODES: Dict[str, Optional[str]] = {
+    "exact": None,
+    "lower": "lower",
+    "casefold": "casefold",
+}
+MAX_CACHED_CELLS = 1000000
+
+
+def editDistance(a: str, b: str) -> int:
+    """
+    Number of characters inserted, removed, replaced or swapped with the next one to turn `a` into `b` (optimal
+    string alignment distance), eg:- 'jhon' is 1 from 'john'.
+    """
+    before_previous: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        for j in range(1, len(b) + 1):
+            distance = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, before_previous[j - 2] + 1)
+            current.append(distance)
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+def deletions(value: str, max_distance: int) -> Set[str]:
+    """The value and every string made by removing up to `max_distance` characters from it."""
+    variants = level = {value}
+    for _ in range(max_distance):
+        level = {v[:i] + v[i + 1 :] for v in level for i in range(len(v))}
+        variants = variants | level
+    return variants
+
+
+class EditDistanceIndex:
+    """
+    Finds the reference value closest to a value within `max_distance` edits. Two values within k edits always
+    share a string made by removing at most k characters from each (a swap by removing the same letter from both),
+    so every such string of the reference values is indexed once and a lookup only measures the distance to the
+    reference values sharing one with the value. This is much faster than a BK-tree in python, which measures the
+    distance to a large part of the references.\n
+    @init\n
+        @param: `values`: The normalized reference values.\n
+        @param: `config`: The config of the ValueMatcher, `max_distance` defaults to 1.\n
+    @func: `find`: Position of the closest reference value, the first one for a tie, -1 if none is close enough.\n
+    """
+
+    def __init__(self, values: List[str], config: Dict[str, Any]) -> None:
+        self.values = values
+        self.max_distance = config.get("max_distance") or 1
+        self.variants: Dict[str, List[int]] = {}
+        for position, value in enumerate(values):
+            for variant in deletions(value, self.max_distance):
+                self.variants.setdefault(variant, []).append(position)
+
+    def find(self, value: str) -> int:
+        candidates = set()
+        for variant in deletions(value, self.max_distance):
+            candidates.update(self.variants.get(variant, ()))
+        best_distance, best_position = self.max_distance + 1, -1
+        for position in sorted(candidates):
+            distance = editDistance(self.values[position], value)
+            if distance < best_distance:
+                best_distance, best_position = distance, position
+        return best_position
+
+
+# Soundex digit of each letter, 0 for the vowels which separate two letters with the same digit
+SOUNDEX_CODES = {
+    letter: str(digit)
+    for digit, letters in enumerate(
+        ["aeiouy", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"]
+    )
+    for letter in letters
+}
+
+
+def soundex(value: str) -> Optional[str]:
+    """
+    Soundex key of a value, the first letter and the digits of the next 3 consonant sounds, eg:- 'Robert' and
+    'Rupert' are both 'r163'. The accents are removed and everything other than a-z is ignored.\n
+    @return: The key, None if the value has no letters.
+    """
+    letters = [
+        char for char in stripAccents(value) if char in SOUNDEX_CODES or char in "hw"
+    ]
+    if not letters:
+        return None
+    key = letters[0]
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        # h and w dont separate two letters with the same digit
+        if letter in "hw":
+            continue
+        code = SOUNDEX_CODES[letter]
+        if code != "0" and code != previous:
+            key += code
+            if len(key) == 4:
+                break
+        previous = code
+    return key.ljust(4, "0")
+
+
+class PhoneticIndex:
+    """
+    Finds a reference value that sounds the same as a value, the reference values are put in buckets by their
+    soundex key.\n
+    @func: `find`: Position of the first reference value with the same key, -1 if there is none.\n
+    """
+
+    def __init__(self, values: List[str], config: Dict[str, Any]) -> None:
+        self.buckets: Dict[str, int] = {}
+        for position, value in enumerate(values):
+            key = soundex(value)
+            if key is not None:
+                self.buckets.setdefault(key, position)
+
+    def find(self, value: str) -> int:
+        return self.buckets.get(soundex(value), -1)
+
+
+class PrefixIndex:
+    """
+    Finds a reference value that a value starts with, eg:- 'mc' for 'mcdonald', the reference values are kept in a
+    trie so a lookup reads the value only once.\n
+    @func: `find`: Position of the longest reference value the value starts with, -1 if there is none.\n
+    """
+
+    def __init__(self, values: List[str], config: Dict[str, Any]) -> None:
+        self.trie: Dict[str, Any] = {}
+        for position, value in enumerate(values):
+            if not value:
+                continue
+            node = self.trie
+            for char in value:
+                node = node.setdefault(char, {})
+            # "" cant be a character so it marks the end of a reference value
+            node.setdefault("", position)
+
+    def find(self, value: str) -> int:
+        node, position = self.trie, -1
+        for char in value:
+            node = node.get(char)
+            if node is None:
+                break
+            position = node.get("", position)
+        return position
+
+
+# Name of each match method and the index finding the reference values that are not equal to a value, every
+# method also matches the equal values
+MATCH_METHODS = {
+    "equal": None,
+    "edit": EditDistanceIndex,
+    "phonetic": PhoneticIndex,
+    "prefix": PrefixIndex,
+}
+
+
+class ValueMatcher:
+    """
+    Matches the cells of a column against a list of reference values, eg:- the common values of FilterValues.\n
+    The reference values are normalized once into a hash table. With the 'equal' method and a mode in
+    VECTORIZED_MODES the different values of a chunk are normalized with pandas string methods and looked up all at
+    once, otherwise each different cell value is normalized and looked up only once and the result is cached, so a
+    chunk only does work for the values it hasnt seen before. Only text cells can match.\n
+    The approximate methods look up the cells that are not equal to a reference value in an index built once from
+    the normalized reference values, with the cache most cells of a large file are never looked up again.\n
+    The matcher is built from a plain config so it can be passed to worker processes and built again in each of them.\n
+    @init\n
+        @param: `config`: Dictionary containing the following keys.\n
+            @key: `values`: The reference values.\n
+            @key: `mode`: (Optional) Name of the mode in MATCH_MODES, defaults to 'lower'.\n
+            @key: `method`: (Optional) Name of the method in MATCH_METHODS, defaults to 'equal'.\n
+            @key: `max_distance`: (Optional) Most edits for the 'edit' method, defaults to 1.\n
+    @func: `matchColumn`: Find the cells of a column matching a reference value.\n
+        @param: `values`: The column.\n
+        @return: A boolean array, True for the matching cells.\n
+    @func: `stats`: Rows checked, rows matched and the rows matched by each reference value since `resetStats`.\n
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        mode = config.get("mode", "lower")
+        if mode not in MATCH_MODES:
+            raise ValueError(
+                f"Unknown match mode {mode}, expected one of {list(MATCH_MODES)}"
+            )
+        method = config.get("method", "equal")
+        if method not in MATCH_METHODS:
+            raise ValueError(
+                f"Unknown match method {method}, expected one of {list(MATCH_METHODS)}"
+            )
+        self.normalize = MATCH_MODES[mode]
+        self.reference_values: List[str] = []
+        # Normalized reference value to the position of the first reference value normalized to it
+        self.reference_index: Dict[str, int] = {}
+        for value in config["values"]:
+            if not isinstance(value, str):
+                continue
+            normalized = self.normalize(value)
+            if normalized not in self.reference_index:
+                self.reference_index[normalized] = len(self.reference_values)
+                self.reference_values.append(value)
+        self.index = None
+        if MATCH_METHODS[method] is not None:
+            self.index = MATCH_METHODS[method](list(self.reference_index), config)
+        # Normalized reference values in the order of their positions, for looking up a whole chunk at once
+        self.reference_lookup = None
+        if self.index is None and mode in VECTORIZED_MODES:
+            self.vectorized_mode = VECTORIZED_MODES[mode]
+            self.reference_lookup = Index(list(self.reference_index), dtype=object)
+        # Factorize a chunk before looking it up, off when most cells of the chunk before were different
+        self.factorize_lookups = True
+        # Cell value to the position of the reference value it matches, -1 for no match
+        self.cell_matches: Dict[Any, int] = {}
+        self.resetStats()
+
+    def resetStats(self):
+        self.rows = 0
+        self.match_counts = np.zeros(len(self.reference_values), dtype=np.int64)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "matched": int(self.match_counts.sum()),
+            "values": dict(zip(self.reference_values, self.match_counts.tolist())),
+        }
+
+    def findReference(self, cell: Any) -> int:
+        if not isinstance(cell, str):
+            return -1
+        normalized = self.normalize(cell)
+        position = self.reference_index.get(normalized, -1)
+        if position == -1 and self.index is not None:
+            position = self.index.find(normalized)
+        return position
+
+    def lookupCells(self, cells) -> np.ndarray:
+        cells = Series(cells, dtype=object)
+        # Without a text cell pandas string methods refuse the values, and none of them can match anyway
+        if infer_dtype(cells, skipna=True) not in ("string", "mixed", "mixed-integer"):
+            return np.full(len(cells), -1, dtype=np.int64)
+        if self.vectorized_mode is not None:
+            # The cells that are not text become NaN, which is not a reference value
+            cells = getattr(cells.str, self.vectorized_mode)()
+        return self.reference_lookup.get_indexer(cells.values).astype(np.int64)
+
+    def findUniques(self, uniques) -> np.ndarray:
+        new_cells = [cell for cell in uniques if cell not in self.cell_matches]
+        if len(self.cell_matches) + len(new_cells) > MAX_CACHED_CELLS:
+            self.cell_matches.clear()
+            new_cells = list(uniques)
+        for cell in new_cells:
+            self.cell_matches[cell] = self.findReference(cell)
+        return np.fromiter(
+            (self.cell_matches[cell] for cell in uniques),
+            dtype=np.int64,
+            count=len(uniques),
+        )
+
+    def matchColumn(self, values: Series) -> np.ndarray:
+        if self.reference_lookup is not None and not self.factorize_lookups:
+            # The null cells become NaN, which is not a reference value
+            row_matches = self.lookupCells(values)
+        else:
+            codes, uniques = factorize(values)
+            if self.reference_lookup is not None:
+                unique_matches = self.lookupCells(uniques)
+                # With most cells different factorizing costs more than normalizing every cell saves
+                self.factorize_lookups = len(uniques) * 2 <= len(codes)
+            else:
+                unique_matches = self.findUniques(uniques)
+            # Null cells have the code -1, the -1 added at the end keeps them unmatched
+            row_matches = np.append(unique_matches, -1)[codes]
+        matched = row_matches >= 0
+        self.rows += len(row_matches)
+        self.match_counts += np.bincount(
+            row_matches[matched], minlength=len(self.reference_values)
+        )
+        return matched
+
+
+value_matchers: Dict[tuple, ValueMatcher] = {}
+
+
+def getValueMatcher(config: Dict[str, Any]) -> ValueMatcher:
+    """Return the matcher for a config, building it only the first time in each process."""
+    key = (
+        tuple(sorted((k, v) for k, v in config.items() if k != "values")),
+        tuple(config["values"]),
+    )
+    if key not in value_matchers:
+        value_matchers[key] = ValueMatcher(config)
+    return value_matchers[key]
@@ -0,0 +1,91 @@
+from .fileSignature import fileSignature
+from .readCSV import readCSV, csvEngine, setCSVEngine, CSV_ENGINES
+from .readColumnarBatches import (
+    fileFormat,
+    outputFileName,
+    readColumnarSchema,
+    readColumnarBatches,
+    readFileChunks,
+    readDataFile,
+)
+from .readCSVColumns import readCSVColumns
+from .profileColumnTypes import profileColumnTypes
+from .askColumnForFiles import askColumnForFiles
+from .countFileLines import countFileLines
+from .ChunkWriter import ChunkWriter
+from .ColumnarWriter import ColumnarWriter, ColumnarPartitionWriter, openChunkWriter
+from .ChunkCheckpoint import ChunkCheckpoint, CheckpointSaver
+from .makeRecordEndFinder import (
+    blockCodes,
+    makeRecordEndFinder,
+    makeRecordFieldCounter,
+    readHeaderRecord,
+)
+from .readCSVByteChunks import readCSVByteChunks, chunkBytesForRows
+from .processCSVInParallel import processCSVInParallel
+from .streamCSVInChunks import streamCSVInChunks
+from .PartitionWriter import PartitionWriter
+from .parseToolArgs import parseToolArgs
+from .processFilesInPool import processFilesInPool
+from .AddressParserEngine import (
+    splitAddress,
+    registerAddressParser,
+    getAddressParserEngine,
+    AddressParserEngine,
+    ADDRESS_PARSERS,
+)
+from .ValueMatcher import (
+    ValueMatcher,
+    getValueMatcher,
+    soundex,
+    editDistance,
+    MATCH_MODES,
+    MATCH_METHODS,
+)
+
+__description__ = ("Shared utilities for the dataset tools",)
+__all__ = [
+    "fileSignature",
+    "readCSV",
+    "csvEngine",
+    "setCSVEngine",
+    "CSV_ENGINES",
+    "fileFormat",
+    "outputFileName",
+    "readColumnarSchema",
+    "readColumnarBatches",
+    "readFileChunks",
+    "readDataFile",
+    "readCSVColumns",
+    "profileColumnTypes",
+    "askColumnForFiles",
+    "countFileLines",
+    "ChunkWriter",
+    "ColumnarWriter",
+    "ColumnarPartitionWriter",
+    "openChunkWriter",
+    "ChunkCheckpoint",
+    "CheckpointSaver",
+    "blockCodes",
+    "makeRecordEndFinder",
+    "makeRecordFieldCounter",
+    "readHeaderRecord",
+    "readCSVByteChunks",
+    "chunkBytesForRows",
+    "processCSVInParallel",
+    "streamCSVInChunks",
+    "PartitionWriter",
+    "parseToolArgs",
+    "processFilesInPool",
+    "splitAddress",
+    "registerAddressParser",
+    "getAddressParserEngine",
+    "AddressParserEngine",
+    "ADDRESS_PARSERS",
+    "ValueMatcher",
+    "getValueMatcher",
+    "soundex",
+    "editDistance",
+    "MATCH_MODES",
+    "MATCH_METHODS",
+]
@@ -0,0 +1,33 @@
+import os
+from typing import List, Optional, Tuple
+from pypeepa import printArray, askSelectOptionQuestion
+from .readCSVColumns import readCSVColumns
+
+
+def askColumnForFiles(
+    file_list: List[str], file_dir: str, label: Optional[str] = "values"
+) -> List[Tuple[str, str]]:
+    """
+    Same as pypeepa's askHeaderForMultipleCSV for csv, Parquet and Arrow IPC files, the user is asked again only
+    when the columns change from one file to the next.\n
+    @param:`file_list`: List of file names.\n
+    @param:`file_dir`: The directory of the files.\n
+    @param:`label`: (Optional) A general label shown to the user for the type of column.\n
+    @return: List of tuples containing the full path of each file and the selected column.
+    """
+    files_and_header = []
+    prev_cols = None
+    col_index = None
+    for file_name in file_list:
+        full_path = os.path.join(file_dir, file_name)
+        current_columns = readCSVColumns(full_path)
+        if current_columns != prev_cols:
+            printArray(current_columns)
+            col_index = askSelectOptionQuestion(
+                question=f"Enter the index of the column containing the {label}.",
+                min=1,
+                max=len(current_columns),
+            )
+            prev_cols = current_columns
+        files_and_header.append((full_path, current_columns[col_index - 1]))
+    return files_and_header
@@ -0,0 +1,79 @@
+import os
+import mmap
+import concurrent.futures
+import numpy as np
+from typing import Optional
+from .fileSignature import fileSignature
+from .savedValues import readSavedValues, saveValue
+
+LINE_COUNTS_PATH = os.path.join("saves", "LineCounts.json")
+NEWLINE = 10
+
+
+def countNewlinesInRange(mapped_file: mmap.mmap, start: int, end: int) -> int:
+    """Count the newline bytes from `start` to `end`, numpy releases the GIL so ranges can be counted in threads."""
+    block = np.frombuffer(mapped_file, dtype=np.uint8, count=end - start, offset=start)
+    count = int(np.count_nonzero(block == NEWLINE))
+    del block  # The mmap can't be closed while a buffer of it is alive
+    return count
+
+
+def countFileLines(
+    file_path: str,
+    estimate: Optional[bool] = False,
+    workers: Optional[int] = None,
+    block_size: Optional[int] = 16 * 1024 * 1024,
+    sample_blocks: Optional[int] = 16,
+    sample_size: Optional[int] = 1024 * 1024,
+) -> int:
+    """
+    Count the lines of a text based file like csv, json, txt etc, a last line without a newline is counted too.\n
+    The file is memory mapped and its blocks are counted by a pool of threads, the exact counts are saved to
+    `saves/LineCounts.json` keyed on the path, size and modification time of the file so they are only counted once.\n
+    @param:`file_path`: The path to the file you want to count the lines in.\n
+    @param:`estimate`: (Optional) If True only `sample_blocks` blocks spread over the file are read and the count is
+    estimated from the average bytes per line in them, use it when the count is only for a progress bar.\n
+    @param:`workers`: (Optional) Number of threads counting, defaults to the number of CPUs.\n
+    @param:`block_size`: (Optional) Size in bytes of the ranges given to each thread.\n
+    @param:`sample_blocks`: (Optional) Number of blocks read for an estimate.\n
+    @param:`sample_size`: (Optional) Size in bytes of each block read for an estimate.\n
+    @return: The line count, or the estimated line count.
+    """
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return 0
+    key = fileSignature(file_path)
+    line_counts = readSavedValues(LINE_COUNTS_PATH)
+    if key in line_counts:
+        return line_counts[key]
+
+    with open(file_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped_file:
+        ends_with_newline = mapped_file[file_size - 1] == NEWLINE
+        if estimate and file_size > sample_blocks * sample_size:
+            step = (file_size - sample_size) // (sample_blocks - 1)
+            sample_newlines = sum(
+                countNewlinesInRange(mapped_file, start, start + sample_size)
+                for start in range(0, step * sample_blocks, step)
+            )
+            if sample_newlines:
+                bytes_per_line = sample_blocks * sample_size / sample_newlines
+                return max(1, round(file_size / bytes_per_line))
+
+        ranges = [
+            (start, min(start + block_size, file_size))
+            for start in range(0, file_size, block_size)
+        ]
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers or os.cpu_count()
+        ) as executor:
+            newlines = sum(
+                executor.map(
+                    lambda block_range: countNewlinesInRange(mapped_file, *block_range),
+                    ranges,
+                )
+            )
+    lines = newlines + (not ends_with_newline)
+    saveValue(LINE_COUNTS_PATH, key, lines)
+    return lines
@@ -0,0 +1,17 @@
+import os
+import hashlib
+
+
+def fileSignature(file_path: str, *extra) -> str:
+    """
+    Build a key that changes whenever the file changes, used to name cached results for a file.\n
+    @param:`file_path`: Path to the file.\n
+    @param:`extra`: (Optional) Any additional values that should be part of the key eg:- a column name.\n
+    @return: A hex digest made from the absolute path, size and modification time of the file.
+    """
+    stat = os.stat(file_path)
+    key = "|".join(
+        [os.path.abspath(file_path), str(stat.st_size), str(stat.st_mtime_ns)]
+        + [str(value) for value in extra]
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
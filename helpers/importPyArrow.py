@@ -0,0 +1,14 @@
+def importPyArrow():
+    """
+    Import pyarrow only when a .parquet or .arrow file or the pyarrow csv engine is used, so the tools keep working
+    without it.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError(
+            "pyarrow is needed for .parquet and .arrow files and the pyarrow csv engine, install it with: pip install pyarrow"
+        ) from err
+    return pyarrow
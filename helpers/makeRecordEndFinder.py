@@ -0,0 +1,167 @@
+import numpy as np
+from typing import Callable, List, Tuple, Union
+
+NEWLINE = 10
+CARRIAGE_RETURN = 13
+QUOTE = 34
+COMMA = 44
+# A quote only opens a quoted value right after one of these, like the pandas parser
+FIELD_STARTS = (COMMA, NEWLINE, CARRIAGE_RETURN)
+
+
+def blockCodes(block: Union[bytes, str]) -> np.ndarray:
+    """The bytes of a block, or the code points of a decoded block, as a numpy array."""
+    if isinstance(block, bytes):
+        return np.frombuffer(block, dtype=np.uint8)
+    return np.frombuffer(block.encode("utf-32-le"), dtype=np.uint32)
+
+
+def scanQuotes(
+    quotes: np.ndarray,
+    previous_codes: List[int],
+    in_quotes: bool,
+    previous_closed: bool,
+) -> np.ndarray:
+    """
+    Go through the quotes of a block one by one like the pandas parser and return the ones opening or closing a
+    quoted value. Outside quotes a quote only opens one at the start of a value, or right after the quote that
+    closed the value before as "" inside quotes is a quote, any other quote is part of the value eg:- 5'10".
+    """
+    toggles = []
+    last_close = -1 if previous_closed else -2
+    for position, previous_code in zip(quotes.tolist(), previous_codes):
+        if in_quotes:
+            toggles.append(position)
+            last_close = position
+            in_quotes = False
+        elif previous_code in FIELD_STARTS or (
+            previous_code == QUOTE and last_close == position - 1
+        ):
+            toggles.append(position)
+            in_quotes = True
+    return np.array(toggles, dtype=np.int64)
+
+
+def makeQuoteFinder() -> Callable[[np.ndarray], Tuple[np.ndarray, bool]]:
+    """
+    Make a function finding the quotes of a block that open or close a quoted value, the blocks must be given in
+    order and the first one must start at the start of a record, as whether a block starts inside quotes is carried
+    over from the one before.\n
+    When every quote opening a value by the count of quotes before it starts a value, every quote is taken as
+    opening or closing one, escaped quotes ("") count twice so they dont change the count. Otherwise the quotes of
+    the block are gone through one by one with scanQuotes, so a stray quote inside a value doesnt flip the rest of
+    the file.\n
+    @return: Function taking the codes of a block from blockCodes and returning the positions of the quotes opening
+    or closing a value and whether the block starts inside quotes.
+    """
+    in_quotes = False
+    # The code before the block, a record starts right after a newline
+    previous_code = NEWLINE
+    # True if that code is a quote closing a quoted value
+    previous_closed = False
+
+    def findQuotes(codes: np.ndarray) -> Tuple[np.ndarray, bool]:
+        nonlocal in_quotes, previous_code, previous_closed
+        starts_in_quotes = in_quotes
+        quotes = np.flatnonzero(codes == QUOTE)
+        if not len(codes) or len(quotes) == 0:
+            if len(codes):
+                previous_code, previous_closed = int(codes[-1]), False
+            return quotes, starts_in_quotes
+
+        previous_codes = np.concatenate(
+            (np.array([previous_code], dtype=codes.dtype), codes)
+        )[quotes]
+        # The quotes the count takes as opening a value, the ones after an even number of quotes
+        opening = (np.arange(len(quotes)) + in_quotes) % 2 == 0
+        opening_codes = previous_codes[opening]
+        consistent = np.isin(opening_codes, FIELD_STARTS) | (opening_codes == QUOTE)
+        if quotes[0] == 0 and opening[0] and previous_code == QUOTE:
+            consistent[0] = previous_closed
+        if consistent.all():
+            toggles = quotes
+        else:
+            toggles = scanQuotes(
+                quotes, previous_codes.tolist(), in_quotes, previous_closed
+            )
+
+        in_quotes = (len(toggles) + in_quotes) % 2 == 1
+        previous_code = int(codes[-1])
+        previous_closed = (
+            len(toggles) > 0 and toggles[-1] == len(codes) - 1 and not in_quotes
+        )
+        return toggles, starts_in_quotes
+
+    return findQuotes
+
+
+def outsideQuotes(positions: np.ndarray, toggles: np.ndarray, in_quotes: bool) -> np.ndarray:
+    """True for the positions of a block that are not inside a quoted value, from the output of makeQuoteFinder."""
+    return (np.searchsorted(toggles, positions) + in_quotes) % 2 == 0
+
+
+def makeRecordEndFinder() -> Callable[[Union[bytes, str]], np.ndarray]:
+    """
+    Make a function finding the offsets right after every newline of a block that is not inside quotes, the blocks
+    must be given in order and the first one must start at the start of a record. The quotes are found with
+    makeQuoteFinder.
+    """
+    findQuotes = makeQuoteFinder()
+
+    def findRecordEnds(block: Union[bytes, str]) -> np.ndarray:
+        codes = blockCodes(block)
+        newlines = np.flatnonzero(codes == NEWLINE)
+        toggles, in_quotes = findQuotes(codes)
+        return newlines[outsideQuotes(newlines, toggles, in_quotes)] + 1
+
+    return findRecordEnds
+
+
+def makeRecordFieldCounter() -> Callable[[Union[bytes, str]], np.ndarray]:
+    """
+    Make a function counting the fields of every record ending in a block, the records are found the same way as
+    makeRecordEndFinder and a comma inside a quoted value doesnt separate two fields. The blocks must be given in
+    order and the first one must start at the start of a record.\n
+    @return: Function returning the number of fields of each record ending in the block, in order.
+    """
+    findQuotes = makeQuoteFinder()
+    # Fields separated in the blocks before, of the record not ended yet
+    separators_before = 0
+
+    def countRecordFields(block: Union[bytes, str]) -> np.ndarray:
+        nonlocal separators_before
+        codes = blockCodes(block)
+        toggles, in_quotes = findQuotes(codes)
+        newlines = np.flatnonzero(codes == NEWLINE)
+        commas = np.flatnonzero(codes == COMMA)
+        record_ends = newlines[outsideQuotes(newlines, toggles, in_quotes)]
+        separators = commas[outsideQuotes(commas, toggles, in_quotes)]
+        separators_until_end = np.searchsorted(separators, record_ends)
+        field_counts = np.diff(separators_until_end, prepend=0) + 1
+        if len(record_ends):
+            field_counts[0] += separators_before
+            separators_before = len(separators) - int(separators_until_end[-1])
+        else:
+            separators_before += len(separators)
+        return field_counts
+
+    return countRecordFields
+
+
+def readHeaderRecord(input_file, block_size: int):
+    """
+    Read the header of a csv file from an open file, it can have quoted values with new lines too.\n
+    @return: The header and what was read after it.
+    """
+    findRecordEnds = makeRecordEndFinder()
+    start = input_file.read(0)
+    while True:
+        block = input_file.read(block_size)
+        if not block:
+            return start, start[:0]
+        record_ends = findRecordEnds(block)
+        if len(record_ends):
+            header_end = len(start) + int(record_ends[0])
+            start += block
+            return start[:header_end], start[header_end:]
+        start += block
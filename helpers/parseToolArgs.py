@@ -0,0 +1,62 @@
+import argparse
+from typing import Optional
+from .readCSV import CSV_ENGINES, setCSVEngine
+from .profileColumnTypes import enableCategories
+
+
+def parseToolArgs(description: Optional[str] = None) -> argparse.Namespace:
+    """
+    Parse the command line options shared by the tools, unknown options are ignored.\n
+    @param:`description`: (Optional) Description shown with --help.\n
+    @return: The parsed options.\n
+        @key:`workers`: Number of input files to process in parallel, 1 processes them one after another.\n
+        @key:`chunk_workers`: Number of processes sharing the chunks of each file, always 1 when `workers` is more than 1.\n
+        @key:`output_format`: 'csv', 'parquet' or 'arrow' to write the outputs in, None keeps the format of each input.\n
+        @key:`engine`: The engine csv files are parsed with, set for this process and the workers it starts.\n
+        @key:`categories`: True to read the text columns with few different values as category.\n
+        @key:`sync`: True to write the outputs to the disk at every checkpoint.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of input files to process in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--chunk-workers",
+        type=int,
+        default=1,
+        help="Number of processes sharing the chunks of each file, ignored with --workers (default: 1)",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["csv", "parquet", "arrow"],
+        default=None,
+        help="Format of the output files, parquet and arrow need pyarrow (default: same as the input)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=CSV_ENGINES,
+        default=None,
+        help="Engine csv files are parsed with, pyarrow parses on all the CPUs and needs pyarrow (default: c)",
+    )
+    parser.add_argument(
+        "--categories",
+        action="store_true",
+        help="Read the text columns with few different values, eg:- codes or states, as category to use less memory",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Write the outputs to the disk at every checkpoint so they survive a power cut, slower with many output files",
+    )
+    args, _ = parser.parse_known_args()
+    if args.engine is not None:
+        setCSVEngine(args.engine)
+    if args.categories:
+        enableCategories()
+    args.workers = max(1, args.workers)
+    # Files are already processed in parallel, dont start a pool inside every worker
+    args.chunk_workers = 1 if args.workers > 1 else max(1, args.chunk_workers)
+    return args
@@ -0,0 +1,141 @@
+import os
+import io
+import concurrent.futures
+import pandas as pd
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Any, Tuple
+from pypeepa import progressBarIterator
+from .ChunkWriter import ChunkWriter
+from .readCSV import readCSV
+from .makeRecordEndFinder import makeRecordEndFinder, readHeaderRecord
+from .readCSVByteChunks import chunkBytesForRows
+
+
+def findRecordRanges(
+    csv_file: str, chunk_size: int
+) -> Tuple[bytes, int, Iterator[Tuple[int, int]]]:
+    """
+    Split a csv file into byte ranges that start and end at the end of a row, each holding about `chunk_size` rows.
+    Quoted values with new lines are kept whole, the ranges are found with the same record end finder as
+    readCSVByteChunks while the file is read block by block, so the first ranges can be processed before the end
+    of the file is reached.\n
+    @param:`csv_file`: Path to the csv file.\n
+    @param:`chunk_size`: The number of rows wanted in each range.\n
+    @return: The header record, the number of ranges for the progress bar and a generator of (start, end) byte
+    offsets.
+    """
+    range_bytes = chunkBytesForRows(csv_file, chunk_size)
+    with open(csv_file, "rb") as f:
+        header, _ = readHeaderRecord(f, 64 * 1024)
+    total_ranges = max(
+        1, -(-(os.path.getsize(csv_file) - len(header)) // range_bytes)
+    )
+
+    def readRanges():
+        with open(csv_file, "rb") as f:
+            start = offset = len(header)
+            f.seek(start)
+            findRecordEnds = makeRecordEndFinder()
+            while True:
+                block = f.read(range_bytes)
+                if not block:
+                    break
+                record_ends = findRecordEnds(block)
+                if len(record_ends):
+                    end = offset + int(record_ends[-1])
+                    yield start, end
+                    start = end
+                offset += len(block)
+            # The last row when the file does not end with a new line
+            if start < offset:
+                yield start, offset
+
+    return header, total_ranges, readRanges()
+
+
+def processCSVRange(
+    csv_file: str,
+    header: bytes,
+    start: int,
+    end: int,
+    process_function: Callable[[pd.DataFrame, Any], Optional[pd.DataFrame]],
+    pf_args: Any,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+):
+    """Parse and process one byte range of a csv file, the result is returned already serialized to csv text."""
+    with open(csv_file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    chunk = readCSV(
+        io.BytesIO(header + data),
+        low_memory=False,
+        encoding_errors="ignore",
+        on_bad_lines="skip",
+        usecols=usecols,
+        dtype=dtype,
+    )
+    processed_chunk = process_function(chunk, pf_args)
+    if processed_chunk is None:
+        return None
+    return (
+        list(processed_chunk.columns),
+        len(processed_chunk.index),
+        processed_chunk.to_csv(index=False, header=False),
+    )
+
+
+def processCSVInParallel(
+    csv_file: str,
+    output_path: str,
+    process_function: Callable[[pd.DataFrame, Any], Optional[pd.DataFrame]],
+    pf_args: Any,
+    chunk_size: Optional[int] = 10000,
+    hide_progress_bar: Optional[bool] = False,
+    workers: Optional[int] = 4,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Process one csv file with a pool of processes, the file is split into byte ranges at the end of rows,
+    each range is parsed and processed by a worker and the results are written to `output_path` in the original order.\n
+    Only for row-local process functions, each range is processed without seeing the others.\n
+    @param:`csv_file`: Path to the csv file.\n
+    @param:`output_path`: Path of the output csv file.\n
+    @param:`process_function`: The function containing the main processing, it must be importable by the workers.\n
+    @param:`pf_args`: Arguments for the process_function.\n
+    @param:`chunk_size`: (Optional) About the number of rows in each range.\n
+    @param:`hide_progress_bar`: (Optional) Set to True if you dont want the progress bar.\n
+    @param:`workers`: (Optional) Number of worker processes.\n
+    @param:`usecols`: (Optional) Only these columns are parsed, in the order they are in the file.\n
+    @param:`dtype`: (Optional) The dtype of some of the columns, eg:- from profileColumnTypes.\n
+    @return: The number of rows written to `output_path`
+    """
+    header, total_ranges, ranges = findRecordRanges(csv_file, chunk_size)
+    if not hide_progress_bar:
+        ranges = progressBarIterator(ranges, total_ranges, "Processing file -> ")
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor, ChunkWriter(output_path) as writer:
+        # Only a few ranges are kept in flight so finished results dont pile up in memory
+        pending = deque()
+        for start, end in ranges:
+            pending.append(
+                executor.submit(
+                    processCSVRange,
+                    csv_file,
+                    header,
+                    start,
+                    end,
+                    process_function,
+                    pf_args,
+                    usecols,
+                    dtype,
+                )
+            )
+            if len(pending) >= workers * 2:
+                writer.writeCSVText(pending.popleft().result())
+        while pending:
+            writer.writeCSVText(pending.popleft().result())
+    return writer.rows_written
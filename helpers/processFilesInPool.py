@@ -0,0 +1,78 @@
+import os
+import time
+import concurrent.futures
+from logging import Logger
+from traceback import format_exc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pypeepa import ProgressSaver, loggingHandler
+
+
+def runFileTask(task_function: Callable[..., Any], args: Tuple):
+    """Run one task and report back which process ran it, how long it took and the result or the traceback."""
+    tick = time.time()
+    try:
+        result = task_function(*args)
+        return os.getpid(), time.time() - tick, True, result
+    except Exception:
+        return os.getpid(), time.time() - tick, False, format_exc()
+
+
+def processFilesInPool(
+    task_function: Callable[..., Any],
+    tasks: List[Tuple[str, str, Tuple]],
+    workers: Optional[int] = 1,
+    progress: Optional[ProgressSaver] = None,
+    logger: Optional[Logger] = None,
+):
+    """
+    Run `task_function` once per input file on a pool of processes.\n
+    All user inputs must be collected before calling this, the workers can't ask questions.
+    Completed files are saved to `progress` from this process only, so the save file is never written concurrently.\n
+    @param:`task_function`: The function that processes one file, it must be importable by the worker processes.\n
+    @param:`tasks`: List of tuples containing the progress key, a display name and the args for `task_function`.\n
+    @param:`workers`: (Optional) Number of worker processes, with 1 the files are processed in this process.\n
+    @param:`progress`: (Optional) ProgressSaver to save the completed files to.\n
+    @param:`logger`: (Optional) A logger object to enable logging.\n
+    @return: Dictionary of the results of `task_function` keyed on the progress key of the files that completed.
+    """
+    results = {}
+    worker_times: Dict[int, List[float]] = {}
+
+    def handleResult(key, name, pid, time_taken, completed, result):
+        worker_times.setdefault(pid, []).append(time_taken)
+        if completed:
+            loggingHandler(
+                logger,
+                f"Results for {name}, Time taken:{time_taken}s, Worker:{pid}",
+            )
+            results[key] = result
+            if progress is not None:
+                progress.saveToJSON(key, name, logger)
+        else:
+            loggingHandler(logger, f"Exception occurred on {name}:\n{result}")
+
+    if workers <= 1:
+        for key, name, args in tasks:
+            handleResult(key, name, *runFileTask(task_function, args))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(runFileTask, task_function, args): (key, name)
+                for key, name, args in tasks
+            }
+            for future in concurrent.futures.as_completed(futures):
+                key, name = futures[future]
+                try:
+                    handleResult(key, name, *future.result())
+                except Exception:
+                    # The worker process itself died, eg:- it ran out of memory
+                    loggingHandler(
+                        logger, f"Exception occurred on {name}:\n{format_exc()}"
+                    )
+
+    for pid, times in worker_times.items():
+        loggingHandler(
+            logger,
+            f"Worker:{pid} processed {len(times)} files in {sum(times)}s",
+        )
+    return results
@@ -0,0 +1,61 @@
+import os
+from typing import Dict, Optional
+from .fileSignature import fileSignature
+from .savedValues import readSavedValues, saveValue
+from .readColumnarBatches import readFileChunks
+
+COLUMN_TYPES_PATH = os.path.join("saves", "ColumnTypes.json")
+# Environment variable turning the profiling on, set by parseToolArgs so the worker processes profile too
+CATEGORIES_VARIABLE = "DATASET_TOOLS_CATEGORIES"
+
+
+def enableCategories():
+    os.environ[CATEGORIES_VARIABLE] = "1"
+
+
+def profileColumnTypes(
+    file_path: str,
+    sample_rows: Optional[int] = 100000,
+    max_unique_ratio: Optional[float] = 0.05,
+) -> Optional[Dict[str, str]]:
+    """
+    Find the text columns of a file with few different values, eg:- codes, states or countries, so they can be read
+    as category. A category column keeps every value once and one small code per row instead of a python string
+    per row, and isin, groupby and value_counts on it only look at the different values.\n
+    The first `sample_rows` rows are read once, the result is saved to `saves/ColumnTypes.json` keyed on the path,
+    size and modification time of the file.\n
+    @param:`file_path`: Path to the csv, .parquet or .arrow file.\n
+    @param:`sample_rows`: (Optional) Number of rows read to profile the file.\n
+    @param:`max_unique_ratio`: (Optional) Most different values per row sampled for a column to be a category.\n
+    @return: The `dtype` to read the file with, eg:- {'state': 'category'}, or None when --categories was not used.
+    """
+    if os.environ.get(CATEGORIES_VARIABLE) != "1":
+        return None
+    key = fileSignature(file_path, sample_rows, max_unique_ratio)
+    column_types = readSavedValues(COLUMN_TYPES_PATH)
+    if key in column_types:
+        return column_types[key]
+
+    sample = next(
+        iter(
+            readFileChunks(
+                file_path,
+                sample_rows,
+                low_memory=False,
+                encoding_errors="ignore",
+                on_bad_lines="skip",
+            )
+        ),
+        None,
+    )
+    dtype = {}
+    if sample is not None and len(sample.index):
+        max_unique = max(1, int(len(sample.index) * max_unique_ratio))
+        for column in sample.columns:
+            # Only text columns, numbers read as category would become text
+            if sample[column].dtype == object and (
+                sample[column].nunique() <= max_unique
+            ):
+                dtype[column] = "category"
+    saveValue(COLUMN_TYPES_PATH, key, dtype)
+    return dtype
@@ -0,0 +1,149 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from .importPyArrow import importPyArrow
+
+# Environment variable holding the engine, set by parseToolArgs so the worker processes use the same one
+CSV_ENGINE_VARIABLE = "DATASET_TOOLS_CSV_ENGINE"
+CSV_ENGINES = ("c", "pyarrow")
+# The read_csv options the pyarrow engine can match, reads with any other option are parsed with the c engine
+PYARROW_MATCHED_OPTIONS = {"low_memory", "encoding_errors", "on_bad_lines"}
+# The values read_csv takes as null by default, so both engines find the same nulls
+NULL_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
+
+def csvEngine() -> str:
+    """The engine csv files are parsed with, 'c' unless --engine or the environment variable chose another."""
+    return os.environ.get(CSV_ENGINE_VARIABLE, "c")
+
+
+def setCSVEngine(engine: str):
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown csv engine {engine}, expected one of {CSV_ENGINES}")
+    os.environ[CSV_ENGINE_VARIABLE] = engine
+
+
+def usesPyArrow(options: Dict) -> bool:
+    """True if a read with these read_csv options is parsed by pyarrow, a `dtype` can only have category columns."""
+    dtype = options.get("dtype")
+    return (
+        csvEngine() == "pyarrow"
+        and not set(options) - PYARROW_MATCHED_OPTIONS - {"dtype"}
+        and (dtype is None or set(dtype.values()) <= {"category"})
+    )
+
+
+def decodeInvalidText(pa, table):
+    """Drop the bytes that are not valid UTF-8 from the text columns, same as encoding_errors='ignore'."""
+    for position, column in enumerate(table.columns):
+        if not pa.types.is_string(column.type):
+            continue
+        try:
+            column.validate(full=True)
+        except pa.ArrowInvalid:
+            values = [
+                None if value is None else value.decode("utf-8", errors="ignore")
+                for value in column.cast(pa.binary()).to_pylist()
+            ]
+            table = table.set_column(
+                position, table.field(position), pa.array(values, pa.string())
+            )
+    return table
+
+
+def readCSVWithPyArrow(
+    source,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Parse a whole csv with pyarrow.csv on all the CPUs, with the same results as read_csv with
+    `encoding_errors="ignore"` and `on_bad_lines="skip"`.\n
+    Dates and times are kept as text like read_csv does, pyarrow only takes YYYY-MM-DD as a date so dates are cast
+    back to the same text, columns with times are read again as strings. The category columns of `dtype` are read
+    as dictionaries, which become categories in pandas.
+    """
+    pa = importPyArrow()
+    import pyarrow.csv
+
+    if isinstance(source, str):
+        source = pa.memory_map(source, "r")
+    read_options = pa.csv.ReadOptions(use_threads=True)
+    # Quoted values with new lines are kept whole like the c engine, rows with too many values are skipped
+    parse_options = pa.csv.ParseOptions(
+        newlines_in_values=True, invalid_row_handler=lambda row: "skip"
+    )
+    category_type = pa.dictionary(pa.int32(), pa.string())
+    convert_options = pa.csv.ConvertOptions(
+        include_columns=usecols,
+        column_types=dict.fromkeys(dtype or {}, category_type),
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+        check_utf8=False,
+    )
+    table = pa.csv.read_csv(source, read_options, parse_options, convert_options)
+    for position, field in enumerate(table.schema):
+        if pa.types.is_date32(field.type):
+            table = table.set_column(
+                position,
+                pa.field(field.name, pa.string()),
+                table.column(position).cast(pa.string()),
+            )
+    temporal_columns = [
+        field.name for field in table.schema if pa.types.is_temporal(field.type)
+    ]
+    if temporal_columns:
+        source.seek(0)
+        convert_options.include_columns = temporal_columns
+        convert_options.column_types = dict.fromkeys(temporal_columns, pa.string())
+        text_table = pa.csv.read_csv(
+            source, read_options, parse_options, convert_options
+        )
+        for name in temporal_columns:
+            table = table.set_column(
+                table.schema.get_field_index(name),
+                pa.field(name, pa.string()),
+                text_table.column(name),
+            )
+    df = decodeInvalidText(pa, table).to_pandas()
+    # pyarrow gives None for the nulls of text columns where the c engine gives NaN
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].fillna(np.nan)
+    return df
+
+
+def readCSV(source, usecols: Optional[List[str]] = None, **options) -> pd.DataFrame:
+    """
+    Read a whole csv with the engine from csvEngine, every read of a csv in the tools goes through this or
+    readCSVBytes.\n
+    @param:`source`: Path to the csv file, or a file object of its bytes.\n
+    @param:`usecols`: (Optional) Only these columns are parsed, in the order they are in the file.\n
+    @param:`options`: (Optional) Keyword arguments for read_csv, only used by the c engine. The pyarrow engine
+    always ignores encoding errors and skips bad lines, reads with options it cant match eg:- `dtype` or `nrows`
+    are parsed with the c engine.\n
+    @return: The DataFrame.
+    """
+    if usesPyArrow(options):
+        return readCSVWithPyArrow(source, usecols, options.get("dtype"))
+    return pd.read_csv(source, usecols=usecols, **options)
@@ -0,0 +1,79 @@
+import io
+import os
+import pandas as pd
+from typing import Dict, Iterator, List, Optional, Tuple
+from .countFileLines import countFileLines
+from .makeRecordEndFinder import makeRecordEndFinder, readHeaderRecord
+from .readCSV import readCSV
+
+
+def readCSVByteChunks(
+    csv_file: str,
+    chunk_bytes: int,
+    start_offset: Optional[int] = None,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+) -> Iterator[Tuple[pd.DataFrame, int, int]]:
+    """
+    Read a csv file in chunks of about `chunk_bytes` bytes that always end at the end of a row, quoted values with
+    new lines are kept whole. Each chunk comes with the byte offsets of where it starts and ends in the file, so
+    reading can be started again from the end of any chunk.\n
+    @param:`csv_file`: Path to the csv file.\n
+    @param:`chunk_bytes`: About the size of each chunk in bytes, a chunk is longer when a row goes over it.\n
+    @param:`start_offset`: (Optional) Byte offset to start reading from, the end offset of a chunk read before.\n
+    @param:`usecols`: (Optional) Only these columns are parsed, in the order they are in the file.\n
+    @param:`dtype`: (Optional) The dtype of some of the columns, eg:- from profileColumnTypes.\n
+    @return: Generator of the chunk, its start offset and its end offset.
+    """
+    with open(csv_file, "rb") as f:
+        header, _ = readHeaderRecord(f, 64 * 1024)
+        offset = start_offset or len(header)
+        f.seek(offset)
+        findRecordEnds = makeRecordEndFinder()
+        pending = b""
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            record_ends = findRecordEnds(block)
+            if not len(record_ends):
+                pending += block
+                continue
+            data = pending + block[: record_ends[-1]]
+            pending = block[record_ends[-1] :]
+            yield (
+                readCSVBytes(header, data, usecols, dtype),
+                offset,
+                offset + len(data),
+            )
+            offset += len(data)
+        # The last row when the file does not end with a new line
+        if pending:
+            yield (
+                readCSVBytes(header, pending, usecols, dtype),
+                offset,
+                offset + len(pending),
+            )
+
+
+def readCSVBytes(
+    header: bytes,
+    data: bytes,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    return readCSV(
+        io.BytesIO(header + data),
+        low_memory=False,
+        encoding_errors="ignore",
+        on_bad_lines="skip",
+        usecols=usecols,
+        dtype=dtype,
+    )
+
+
+def chunkBytesForRows(csv_file: str, chunk_size: int) -> int:
+    """About the number of bytes of `chunk_size` rows of a csv file, from the estimated line count."""
+    file_size = os.path.getsize(csv_file)
+    rows = max(1, countFileLines(csv_file, estimate=True))
+    return max(64 * 1024, int(file_size / rows * chunk_size))
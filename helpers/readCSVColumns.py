@@ -0,0 +1,14 @@
+from typing import List
+from pandas import read_csv
+from .readColumnarBatches import fileFormat, readColumnarSchema
+
+
+def readCSVColumns(csv_file: str) -> List[str]:
+    """
+    Read only the header of a csv file, or the schema of a .parquet or .arrow file.\n
+    @param:`csv_file`: Path to the file.\n
+    @return: The columns named the same way the chunked readers name them.
+    """
+    if fileFormat(csv_file) != "csv":
+        return readColumnarSchema(csv_file)[0]
+    return list(read_csv(csv_file, nrows=0, encoding_errors="ignore").columns)
@@ -0,0 +1,165 @@
+import os
+import pandas as pd
+from typing import Dict, Iterator, List, Optional, Tuple
+from .importPyArrow import importPyArrow
+from .readCSV import readCSV, usesPyArrow
+from .readCSVByteChunks import readCSVByteChunks, chunkBytesForRows
+
+# File extensions read and written as columnar files, every other file is read as csv
+COLUMNAR_EXTENSIONS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+# Extension given to the outputs of each --output-format
+FORMAT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+
+def fileFormat(file_path: str) -> str:
+    """
+    The format of a file from its extension.\n
+    @return: 'parquet', 'arrow' or 'csv'.
+    """
+    return COLUMNAR_EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), "csv")
+
+
+def outputFileName(input_file: str, output_format: Optional[str] = None) -> str:
+    """
+    Name of the output of `input_file` in `output_format`, the input name is kept when no format is given or the
+    input is already in that format.
+    """
+    if output_format is None or fileFormat(input_file) == output_format:
+        return input_file
+    return os.path.splitext(input_file)[0] + FORMAT_EXTENSIONS[output_format]
+
+
+def openArrowFile(pa, file_path: str):
+    """Open an Arrow IPC file, or an Arrow IPC stream when it has no file footer."""
+    source = pa.memory_map(file_path, "r")
+    try:
+        return pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return pa.ipc.open_stream(source)
+
+
+def iterArrowBatches(pa, file_path: str):
+    reader = openArrowFile(pa, file_path)
+    if isinstance(reader, pa.ipc.RecordBatchFileReader):
+        return (reader.get_batch(i) for i in range(reader.num_record_batches))
+    return iter(reader)
+
+
+def readColumnarSchema(file_path: str) -> Tuple[List[str], int]:
+    """
+    Read the columns and the row count of a columnar file from its metadata, no values are read.\n
+    @return: Tuple of the columns and the row count.
+    """
+    pa = importPyArrow()
+    if fileFormat(file_path) == "parquet":
+        parquet_file = pa.parquet.ParquetFile(file_path)
+        return parquet_file.schema_arrow.names, parquet_file.metadata.num_rows
+    reader = openArrowFile(pa, file_path)
+    if isinstance(reader, pa.ipc.RecordBatchFileReader):
+        rows = sum(
+            reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+        )
+    else:
+        rows = sum(batch.num_rows for batch in reader)
+    return reader.schema.names, rows
+
+
+def categoryColumns(dtype: Optional[Dict[str, str]]) -> Optional[List[str]]:
+    """The columns of a read_csv `dtype` that are read as category."""
+    if dtype is None:
+        return None
+    return [column for column, column_type in dtype.items() if column_type == "category"]
+
+
+def readColumnarBatches(
+    file_path: str,
+    batch_size: int,
+    usecols: Optional[List[str]] = None,
+    categories: Optional[List[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a Parquet or Arrow IPC file in DataFrames of at most `batch_size` rows, straight from its record batches
+    with no text parsing. The rows are numbered on from one DataFrame to the next like the chunks of read_csv.\n
+    @param:`file_path`: Path to the .parquet or .arrow file.\n
+    @param:`batch_size`: Most rows in each DataFrame.\n
+    @param:`usecols`: (Optional) Only these columns are read, in the order they are in the file.\n
+    @param:`categories`: (Optional) Columns to read as category.\n
+    @return: Generator of DataFrames.
+    """
+    pa = importPyArrow()
+    if fileFormat(file_path) == "parquet":
+        parquet_file = pa.parquet.ParquetFile(file_path)
+        names = parquet_file.schema_arrow.names
+        columns = None if usecols is None else [c for c in names if c in usecols]
+        batches = parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+    else:
+        batches = iterArrowBatches(pa, file_path)
+        columns = None
+        if usecols is not None:
+            names = openArrowFile(pa, file_path).schema.names
+            columns = [c for c in names if c in usecols]
+
+    row_count = 0
+    for batch in batches:
+        if columns is not None and batch.schema.names != columns:
+            batch = batch.select(columns)
+        # Batches written by other tools can be much larger than a chunk, slicing them doesnt copy
+        for offset in range(0, batch.num_rows, batch_size):
+            chunk = batch.slice(offset, batch_size).to_pandas(categories=categories)
+            chunk.index = pd.RangeIndex(row_count, row_count + len(chunk.index))
+            row_count += len(chunk.index)
+            yield chunk
+
+
+def readFileChunks(
+    file_path: str,
+    chunk_size: int,
+    usecols: Optional[List[str]] = None,
+    **csv_options,
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a csv, Parquet or Arrow IPC file in chunks of `chunk_size` rows, the format is chosen by the extension.
+    With the pyarrow csv engine the csv is read in chunks of bytes ending on a row, each parsed by pyarrow.\n
+    @param:`csv_options`: (Optional) Keyword arguments for read_csv, only the category columns of `dtype` are used
+    for the other formats.\n
+    @return: Generator of DataFrames.
+    """
+    dtype = csv_options.get("dtype")
+    if fileFormat(file_path) != "csv":
+        return readColumnarBatches(
+            file_path, chunk_size, usecols, categoryColumns(dtype)
+        )
+    if usesPyArrow(csv_options):
+        chunk_bytes = chunkBytesForRows(file_path, chunk_size)
+        return (
+            chunk
+            for chunk, _, _ in readCSVByteChunks(
+                file_path, chunk_bytes, None, usecols, dtype
+            )
+        )
+    return pd.read_csv(
+        file_path, chunksize=chunk_size, usecols=usecols, **csv_options
+    )
+
+
+def readDataFile(
+    file_path: str, usecols: Optional[List[str]] = None, **csv_options
+) -> pd.DataFrame:
+    """Read a whole csv, Parquet or Arrow IPC file, same options as readFileChunks."""
+    if fileFormat(file_path) == "csv":
+        return readCSV(file_path, usecols, **csv_options)
+    pa = importPyArrow()
+    if fileFormat(file_path) == "parquet":
+        table = pa.parquet.read_table(file_path, columns=usecols)
+    else:
+        table = openArrowFile(pa, file_path).read_all()
+        if usecols is not None:
+            table = table.select([c for c in table.schema.names if c in usecols])
+    return table.to_pandas(categories=categoryColumns(csv_options.get("dtype")))
@@ -0,0 +1,25 @@
+import os
+import json
+from typing import Any, Dict
+
+
+def readSavedValues(save_path: str) -> Dict[str, Any]:
+    """Read a json file of values saved by saveValue, an empty dictionary if it doesnt exist or can't be read."""
+    try:
+        with open(save_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveValue(save_path: str, key: str, value: Any):
+    """
+    Add a value to a json file of saved values, written to a temporary file first so a reader never sees half of it.
+    """
+    saved_values = readSavedValues(save_path)
+    saved_values[key] = value
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    temp_path = f"{save_path}.{os.getpid()}.part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(saved_values, f)
+    os.replace(temp_path, save_path)
@@ -0,0 +1,139 @@
+import os
+import pandas as pd
+from typing import Callable, List, Optional, Any
+from pypeepa import progressBarIterator
+from .ChunkWriter import ChunkWriter
+from .ChunkCheckpoint import ChunkCheckpoint
+from .ColumnarWriter import openChunkWriter
+from .countFileLines import countFileLines
+from .processCSVInParallel import processCSVInParallel
+from .readCSVByteChunks import readCSVByteChunks, chunkBytesForRows
+from .readColumnarBatches import fileFormat, readColumnarSchema, readFileChunks
+from .profileColumnTypes import profileColumnTypes
+
+
+def streamCSVInChunks(
+    csv_file: str,
+    output_path: str,
+    process_function: Callable[[pd.DataFrame, Any], Optional[pd.DataFrame]],
+    pf_args: Any,
+    chunk_size: Optional[int] = 10000,
+    hide_progress_bar: Optional[bool] = False,
+    workers: Optional[int] = 1,
+    usecols: Optional[List[str]] = None,
+    checkpoint_dir: Optional[str] = None,
+) -> int:
+    """
+    Same as pypeepa's processCSVInChunks but every processed chunk is appended to `output_path` as soon as it is
+    ready instead of being concatenated in memory, so memory use stays at one chunk regardless of file size.\n
+    Parquet and Arrow IPC files are read and written by their record batches when the extension of `csv_file` or
+    `output_path` is .parquet or .arrow, `workers` and `checkpoint_dir` are not used for them.\n
+    @param:`csv_file`: Path to the csv, .parquet or .arrow file.\n
+    @param:`output_path`: Path of the output csv, .parquet or .arrow file.\n
+    @param:`process_function`: The function containing the main processing you want to get done.\n
+    @param:`pf_args`: Arguments for the process_function.\n
+    @param:`chunk_size`: (Optional) Size of chunks to work with\n
+    @param:`hide_progress_bar`: (Optional) Set to True if you dont want the progress bar that comes with this\n
+    @param:`workers`: (Optional) If more than 1 the chunks are processed in parallel by processCSVInParallel,
+    only for row-local process functions.\n
+    @param:`usecols`: (Optional) Only these columns are parsed, in the order they are in the file.\n
+    @param:`checkpoint_dir`: (Optional) Directory to save a checkpoint in after every chunk, if the file was not
+    completed before it is continued from the last checkpoint. Not used with `workers`.\n
+    With --categories the columns found by profileColumnTypes are read as category.\n
+    @return: The number of rows written to `output_path`
+    """
+    columnar = fileFormat(csv_file) != "csv" or fileFormat(output_path) != "csv"
+    if workers > 1 and not columnar:
+        return processCSVInParallel(
+            csv_file,
+            output_path,
+            process_function,
+            pf_args,
+            chunk_size,
+            hide_progress_bar,
+            workers,
+            usecols,
+            profileColumnTypes(csv_file),
+        )
+
+    if checkpoint_dir is not None and not columnar:
+        return streamCSVWithCheckpoints(
+            csv_file,
+            output_path,
+            process_function,
+            pf_args,
+            chunk_size,
+            hide_progress_bar,
+            usecols,
+            checkpoint_dir,
+        )
+
+    # Create a generator to read the file in chunks
+    chunk_reader = readFileChunks(
+        csv_file,
+        chunk_size,
+        usecols,
+        low_memory=False,
+        encoding_errors="ignore",
+        on_bad_lines="skip",
+        dtype=profileColumnTypes(csv_file),
+    )
+    if not hide_progress_bar:
+        if fileFormat(csv_file) != "csv":
+            total_chunks = -(-readColumnarSchema(csv_file)[1] // chunk_size)
+        else:
+            # The count is only for the progress bar so an estimate is enough
+            total_chunks = int(countFileLines(csv_file, estimate=True) / chunk_size)
+        chunk_reader = progressBarIterator(
+            chunk_reader, total_chunks, "Processing file -> "
+        )
+
+    with openChunkWriter(output_path) as writer:
+        for chunk in chunk_reader:
+            writer.write(process_function(chunk, pf_args))
+    return writer.rows_written
+
+
+def streamCSVWithCheckpoints(
+    csv_file: str,
+    output_path: str,
+    process_function: Callable[[pd.DataFrame, Any], Optional[pd.DataFrame]],
+    pf_args: Any,
+    chunk_size: int,
+    hide_progress_bar: bool,
+    usecols: Optional[List[str]],
+    checkpoint_dir: str,
+) -> int:
+    """
+    streamCSVInChunks saving a checkpoint of the input offset and the output size after each chunk is written to the
+    disk, on the next run the output is cut back to the checkpoint and the input is read again from its offset.
+    """
+    checkpoint = ChunkCheckpoint(checkpoint_dir, csv_file, output_path)
+    state = checkpoint.load()
+    temp_path = f"{output_path}.part"
+    if state is not None and (
+        not os.path.exists(temp_path)
+        or os.path.getsize(temp_path) < state["output_size"]
+    ):
+        # The unfinished output is gone, start again
+        state = None
+
+    file_size = os.path.getsize(csv_file)
+    # Chunks are read by bytes, sized to about `chunk_size` rows
+    chunk_bytes = chunkBytesForRows(csv_file, chunk_size)
+    start_offset = state["input_offset"] if state is not None else None
+    chunk_reader = readCSVByteChunks(
+        csv_file, chunk_bytes, start_offset, usecols, profileColumnTypes(csv_file)
+    )
+    if not hide_progress_bar:
+        total_chunks = -(-(file_size - (start_offset or 0)) // chunk_bytes)
+        chunk_reader = progressBarIterator(
+            chunk_reader, max(1, total_chunks), "Processing file -> "
+        )
+
+    with ChunkWriter(output_path, resume=state, keep_partial=True) as writer:
+        for chunk, _, end_offset in chunk_reader:
+            writer.write(process_function(chunk, pf_args))
+            checkpoint.save({"input_offset": end_offset, **writer.sync()})
+    checkpoint.clear()
+    return writer.rows_written